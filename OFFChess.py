@@ -1,55 +1,40 @@
 """Project Overview:
-Stack: Single-file Python 3 console app built on the standard library (`time`, `os`, `datetime`) with plain-text data files (Login.txt, Wins.txt, Loss.txt, Draw.txt, Elo.txt, GameHistory.txt) providing persistence.
+Stack: Single-file Python 3 console app built on the standard library (`time`, `os`, `datetime`; NumPy optionally, for batch evaluation only) with plain-text data files (Login.txt, Wins.txt, Loss.txt, Draw.txt, Elo.txt, GameHistory.txt) providing persistence.
 Flow: The program launches an ASCII-art animation, lands on a main menu (`choices()`), and branches into gameplay, tutorials, account management, or leaderboard views based on user input.
-Gameplay: `setboard()` seeds an 8x8 board stored as coordinate-keyed dict entries, `getmoves()`/`checktest()` compute legal chess moves (incl. castling, en passant, promotion), and `news()` applies moves, enforces check/mate logic, logs history, and rotates turns.
+Gameplay: `setboard()` builds a `Position` (a 64-square piece array mirrored into bitboards, with castling rights, en passant square, side to move and move counters), a bitboard move generator feeds `getmoves()` with legal chess moves (incl. castling, en passant, promotion), `is_square_attacked()` answers check questions, and `news()` applies moves, enforces check/mate logic, logs history, and rotates turns. A computer opponent (`Search`, iterative-deepening alpha-beta over a material plus piece-square evaluation) can take either side.
 Accounts & Stats: `login()`/`signup()` manage credentials while Elo, win/loss/draw tallies, game logs, and replays are read/written via the text files; `account_view()`, `database()`, and `halloffame()` surface this information for players.
-Overall: OFF Chess delivers an offline two-player chess experience with educational material and simple persistence, all orchestrated through command-line prompts and global state.
+Overall: OFF Chess delivers an offline two-player (or player versus computer) chess experience with educational material and simple persistence, all orchestrated through command-line prompts and global state.
 """
 
 import time
 import os
+import sys
+import random
+import threading
+import re
+import struct
+import array
+import mmap
+import argparse
+import io
+import tempfile
+import tracemalloc
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 from datetime import date
+try:
+    import numpy as np
+except ImportError:
+    np = None
 # Importing relevant packages
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
 def setboard():
-    # Initialise the chessboard dictionary with string coordinates -> piece codes
-    global board
-    board = {
-        "12":"wP",
-        "22":"wP",
-        "32":"wP",
-        "42":"wP" ,
-        "52":"wP",
-        "62":"wP",
-        "72":"wP",
-        "82":"wP",
-        "11":"wR",
-        "81":"wR",
-        "21":"wN",
-        "71":"wN",
-        "31":"wB",
-        "61":"wB",
-        "41":"wQ",
-        "51":"wK",
-
-        "17":"bP",
-        "27":"bP",
-        "37":"bP",
-        "47":"bP",
-        "57":"bP",
-        "67":"bP",
-        "77":"bP",
-        "87":"bP",
-        "18":"bR",
-        "88":"bR",
-        "28":"bN",
-        "78":"bN",
-        "38":"bB",
-        "68":"bB",
-        "48":"bQ",
-        "58":"bK",
-    }
-
-#Here we are initialising the board, each square is a key value pair of two numbers from 1-8. Squares with pieces are defined in this dictionary, as thier colour and then piece. Any time a piece moves, its old square is deleted, and a new definition is added for the square its moved to. Undefined squares are considered unoccupied
+    # Build a fresh position with both sides' pieces on their starting squares
+    return Position(START_FEN)
+
+#Every game is held in a Position (defined next to the move generator further down): a 64 square array of piece numbers mirrored into bitboards, plus castling rights, the en passant square, the side to move and the move counters. START_FEN is the starting layout written in Forsyth-Edwards Notation
 
 filecondict = {
     # Maps numeric file indices to algebraic file letters for display/logging
@@ -63,19 +48,7 @@ filecondict = {
     8:"h"
 }
 
-fileinputdict = {
-    # Converts algebraic file letters back to numeric indices for internal lookups
-    "a": 1,
-    "b": 2,
-    "c": 3,
-    "d": 4,
-    "e": 5,
-    "f": 6,
-    "g": 7,
-    "h": 8
-}
-
-#These are used in a variety of features to translte between the letters on the board and the numbers used when computing moves
+#This is used in a variety of features to translte between the letters on the board and the numbers used when computing moves
 
 ascii = {
     # Unicode glyphs used when rendering the board in the terminal
@@ -100,8 +73,8 @@ def print_chessboard(board):
     for rank in range(8, 0, -1):
         print(rank, end=" | ")
         for file in range(1, 9):
-            square1 = board.get(f'{file}{rank}', '.') 
-            square2 = ascii.get(f'{square1}', '.')      
+            square1 = board.code((rank - 1) * 8 + file - 1)
+            square2 = ascii.get(square1, '.')
             print(square2, end=" ")
         print()
     print("   ----------------")
@@ -109,699 +82,2557 @@ def print_chessboard(board):
 
 #This function prints every square in the board, and prints pieces on it when it finds a piece, otherwise leaves a dot to denote a blank piece.
 
-def getmoves(checks,dontAddKing):
-    # Build the legal move list for the currently selected piece, optionally reusing state during check evaluation
-    global possible_moves
-    global enpassant_moves
-    global check_moves
-    global newfile
-    global newranks
-    global ogx
-    global castlewk
-    global wkingmoved
-    global castlebk
-    global bkingmoved
-    global castlewq
-    global castlebq
-    global K_moves
-    global secondValueList
-    global bkrookmoved
-    global bqrookmoved
-    global wkrookmoved
-    global wqrookmoved
-
-    castlebk = False
-    castlewk = False
-    castlewq = False
-    castlebq = False
-
-
-    if checks == False:
-        # Fresh move generation: reset tracking lists and remember original square
-        check_moves = []
-        K_moves = []
-        secondValueList = []
-        ogx = x
-    #Rows
-    possible_moves = []  
-    enpassant_moves = []
-    if food == 'R':
-        # Rook: scan vertically and horizontally until blocked by own piece or capture
-        newranks = 0
-        newfile = 0
-
-        for i in range(7):
-            i += 1
-            # Step up the file increasing rank until collision
-            newranks = int(rank) + i
-            if f'{file}{newranks}' in board:
-                collisioncol = board[f'{file}{newranks}']
-                if x[0] == collisioncol[0]:
-                    break
-                else:
-
-                    possible_moves.append(f'{filecondict[int(file)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(file)]}{str(newranks)}'))
-                    break
-            elif newranks < 9:
-
-                possible_moves.append(f'{filecondict[int(file)]}{str(newranks)}')
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(file)]}{str(newranks)}'))
-
-
-        for i in range(7):
-            i += 1
-            # Step down the file decreasing rank until collision
-            newranks = int(rank) - i
-            if f'{file}{newranks}' in board:
-                collisioncol = board[f'{file}{newranks}']
-                if x[0] == collisioncol[0]:
-                    break
-                else:
-
-                    possible_moves.append(f'{filecondict[int(file)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(file)]}{str(newranks)}'))
-
-                    break
-            elif newranks > 0:
-
-                possible_moves.append(f'{filecondict[int(file)]}{str(newranks)}')
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(file)]}{str(newranks)}'))
-
-
-        for i in range(7):
-            i += 1
-            # March right along the rank until we hit a piece or board edge
-            newfile = int(file) + i
-            if f'{newfile}{rank}' in board:
-                collisioncol = board[f'{newfile}{rank}']
-                if x[0] == collisioncol[0]:
-                    break
-                else:
-
-                    possible_moves.append(f'{filecondict[int(newfile)]}{str(rank)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(rank)}'))
-
-                    break
-
-            elif newfile < 9:
-
-                possible_moves.append(f'{filecondict[int(newfile)]}{str(rank)}')
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(rank)}'))
-
-
-        for i in range(7):
-            i += 1
-            # March left along the rank until we hit a piece or board edge
-            newfile = int(file) - i
-            if f'{newfile}{rank}' in board:
-                collisioncol = board[f'{newfile}{rank}']
-                if x[0] == collisioncol[0]:
-                    break
-                else:
-                    
-
-                    possible_moves.append(f'{filecondict[int(newfile)]}{str(rank)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(rank)}'))
-
-                    break
-            elif newfile > 0:
-
-                possible_moves.append(f'{filecondict[int(newfile)]}{str(rank)}')
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(rank)}'))
-
-    if food == 'B':
-        # Bishop: explore diagonal rays in all four directions
-        newfile = 0
-        newranks = 0
-
-        for i in range(7):
-            i += 1
-            # Northeast diagonal sweep
-            newfile = int(file) + i
-            newranks = int(rank) + i
-            if f'{newfile}{newranks}' in board:
-                collisioncol = board[f'{newfile}{newranks}']
-                if x[0] == collisioncol[0]:
-                    break
-                else:
-                    possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-                    break
-            elif newfile < 9 and newranks < 9:
-                possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-
-        for i in range(7):
-            i += 1
-            # Southeast diagonal sweep
-            newfile = int(file) + i
-            newranks = int(rank) - i
-            if f'{newfile}{newranks}' in board:
-                collisioncol = board[f'{newfile}{newranks}']
-                if x[0] == collisioncol[0]:
-                    break
-                else:
-                    possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-                    break
-            elif newfile < 9 and newranks > 0:
-                possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-
-        for i in range(7):
-            i += 1
-            # Northwest diagonal sweep
-            newfile = int(file) - i
-            newranks = int(rank) + i
-            if f'{newfile}{newranks}' in board:
-                collisioncol = board[f'{newfile}{newranks}']
-                if x[0] == collisioncol[0]:
-                    break
-                else:
-                    possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-                    break
-            elif newfile > 0 and newranks < 9:
-                possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-
-        for i in range(7):
-            i += 1
-            # Southwest diagonal sweep
-            newfile = int(file) - i
-            newranks = int(rank) - i
-            if f'{newfile}{newranks}' in board:
-                collisioncol = board[f'{newfile}{newranks}']
-                if x[0] == collisioncol[0]:
-                    break
-                else:
-                    possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-                    break
-            elif newfile > 0 and newranks > 0:
-                possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-
-    if food == "Q":
-        # Queen: combine rook and bishop directional scans
-        newfile = 0
-        newranks = 0
-        for i in range(7):
-            i += 1
-            # Reuse rook logic: push forward ranks
-            newranks = int(rank) + i
-            if f'{file}{newranks}' in board:
-                collisioncol = board[f'{file}{newranks}']
-                if x[0] == collisioncol[0]:
-                    break
-                else:
-                    possible_moves.append(f'{filecondict[int(file)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(file)]}{str(newranks)}'))
-
-                    break
-            elif newranks < 9:
-                possible_moves.append(f'{filecondict[int(file)]}{str(newranks)}')
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(file)]}{str(newranks)}'))
-
-
-        for i in range(7):
-            i += 1
-            # Reuse rook logic: pull backward ranks
-            newranks = int(rank) - i
-            if f'{file}{newranks}' in board:
-                collisioncol = board[f'{file}{newranks}']
-                if x[0] == collisioncol[0]:
-                    break
-                else:
-                    possible_moves.append(f'{filecondict[int(file)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(file)]}{str(newranks)}'))
-
+WHITE = 0
+BLACK = 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECE_CODES = ['wP', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bP', 'bN', 'bB', 'bR', 'bQ', 'bK']
+EMPTY = 12
+FEN_LETTERS = 'PNBRQKpnbrqk'
+
+#Pieces are numbered colour * 6 + type, so PIECE_CODES[index] gives back the two letter code the rest of the program uses and EMPTY marks a bare square
+
+SQUARE_NAMES = [f'{filecondict[sq % 8 + 1]}{sq // 8 + 1}' for sq in range(64)]
+SQUARE_KEYS = [f'{sq % 8 + 1}{sq // 8 + 1}' for sq in range(64)]
+SQUARE_INDEX = {name: sq for sq, name in enumerate(SQUARE_NAMES)}
+SQUARE_KEY_INDEX = {key: sq for sq, key in enumerate(SQUARE_KEYS)}
+
+#Squares are numbered 0 (a1) to 63 (h8). Bit n of a bitboard is set when square n is in the set, so one python int holds a whole board of pieces
+
+FULL = (1 << 64) - 1
+FILE_A = 0x0101010101010101
+RANK_1 = 0xFF
+RANK_3 = RANK_1 << 16
+RANK_6 = RANK_1 << 40
+RANK_8 = RANK_1 << 56
+
+def _leaper_attacks(jumps):
+    # Precompute the squares a knight/king/pawn reaches from every square for the given (file, rank) jumps
+    table = []
+    for sq in range(64):
+        attacks = 0
+        for df, dr in jumps:
+            newfile = sq % 8 + df
+            newranks = sq // 8 + dr
+            if 0 <= newfile < 8 and 0 <= newranks < 8:
+                attacks |= 1 << (newranks * 8 + newfile)
+        table.append(attacks)
+    return table
+
+def _ray_table(df, dr):
+    # Precompute every square a slider passes on an empty board when travelling in one direction
+    table = []
+    for sq in range(64):
+        ray = 0
+        newfile = sq % 8 + df
+        newranks = sq // 8 + dr
+        while 0 <= newfile < 8 and 0 <= newranks < 8:
+            ray |= 1 << (newranks * 8 + newfile)
+            newfile += df
+            newranks += dr
+        table.append(ray)
+    return table
+
+KNIGHT_ATTACKS = _leaper_attacks(((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)))
+KING_ATTACKS = _leaper_attacks(((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1)))
+PAWN_ATTACKS = [_leaper_attacks(((-1, 1), (1, 1))), _leaper_attacks(((-1, -1), (1, -1)))]
+RAY_N = _ray_table(0, 1)
+RAY_E = _ray_table(1, 0)
+RAY_NE = _ray_table(1, 1)
+RAY_NW = _ray_table(-1, 1)
+RAY_S = _ray_table(0, -1)
+RAY_W = _ray_table(-1, 0)
+RAY_SW = _ray_table(-1, -1)
+RAY_SE = _ray_table(1, -1)
+
+#Rays heading north, east, north-east and north-west run towards higher square numbers, so their first blocker is the lowest set bit; the other four use the highest set bit
+
+def rook_attacks(sq, occupied):
+    # Rook attacks: each ray is cut off just past the first piece standing on it
+    north = RAY_N[sq]
+    blockers = north & occupied
+    if blockers:
+        north ^= RAY_N[(blockers & -blockers).bit_length() - 1]
+    east = RAY_E[sq]
+    blockers = east & occupied
+    if blockers:
+        east ^= RAY_E[(blockers & -blockers).bit_length() - 1]
+    south = RAY_S[sq]
+    blockers = south & occupied
+    if blockers:
+        south ^= RAY_S[blockers.bit_length() - 1]
+    west = RAY_W[sq]
+    blockers = west & occupied
+    if blockers:
+        west ^= RAY_W[blockers.bit_length() - 1]
+    return north | east | south | west
+
+def bishop_attacks(sq, occupied):
+    # Bishop attacks: same blocker trick as the rook, on the four diagonals
+    northeast = RAY_NE[sq]
+    blockers = northeast & occupied
+    if blockers:
+        northeast ^= RAY_NE[(blockers & -blockers).bit_length() - 1]
+    northwest = RAY_NW[sq]
+    blockers = northwest & occupied
+    if blockers:
+        northwest ^= RAY_NW[(blockers & -blockers).bit_length() - 1]
+    southwest = RAY_SW[sq]
+    blockers = southwest & occupied
+    if blockers:
+        southwest ^= RAY_SW[blockers.bit_length() - 1]
+    southeast = RAY_SE[sq]
+    blockers = southeast & occupied
+    if blockers:
+        southeast ^= RAY_SE[blockers.bit_length() - 1]
+    return northeast | northwest | southwest | southeast
+
+def popcount(bits):
+    # Number of squares set in a bitboard; int.bit_count() would do it but only exists from Python 3.10
+    return bin(bits).count('1')
+
+FLAG_DOUBLE = 1
+FLAG_ENPASSANT = 2
+FLAG_CASTLE = 3
+FLAG_PROMOTION = 4
+
+#A move is one int: bits 0-5 are the square it comes from, bits 6-11 the square it goes to, and the bits above that a flag. Flags 4-7 are promotions to a knight, bishop, rook or queen (flag - 3 is the piece type)
+
+CASTLE_WK = 1
+CASTLE_WQ = 2
+CASTLE_BK = 4
+CASTLE_BQ = 8
+
+#Castling rights are packed into four bits, one per king/rook pairing
+
+def move_text(move):
+    # Write a move in coordinate form, e.g. e2e4 or e7e8q
+    flag = move >> 12
+    text = f'{SQUARE_NAMES[move & 63]}{SQUARE_NAMES[move >> 6 & 63]}'
+    if flag >= FLAG_PROMOTION:
+        text += 'nbrq'[flag - FLAG_PROMOTION]
+    return text
+
+def piece_attacks(index, sq, occupied):
+    # Squares attacked by a single piece standing on sq
+    kind = index % 6
+    if kind == PAWN:
+        return PAWN_ATTACKS[index // 6][sq]
+    if kind == KNIGHT:
+        return KNIGHT_ATTACKS[sq]
+    if kind == BISHOP:
+        return bishop_attacks(sq, occupied)
+    if kind == ROOK:
+        return rook_attacks(sq, occupied)
+    if kind == QUEEN:
+        return rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+    return KING_ATTACKS[sq]
+
+def generate_pseudo_moves(pos):
+    # Every move for the side to move that follows the piece rules, before checking whether it leaves the king in check
+    moves = []
+    append = moves.append
+    pieces = pos.pieces
+    side = pos.side
+    ep_square = pos.ep
+    castling = pos.castling
+    base = side * 6
+    us = pos.colours[side]
+    them = pos.colours[side ^ 1]
+    occupied = us | them
+    empty = ~occupied & FULL
+
+    pawns = pieces[base + PAWN]
+    if side == WHITE:
+        push = 8
+        single = (pawns << 8) & empty
+        double = ((single & RANK_3) << 8) & empty
+        last_rank = RANK_8
+    else:
+        push = -8
+        single = (pawns >> 8) & empty
+        double = ((single & RANK_6) >> 8) & empty
+        last_rank = RANK_1
+    while single:
+        low = single & -single
+        to = low.bit_length() - 1
+        single ^= low
+        if low & last_rank:
+            for flag in (7, 6, 5, 4):
+                append(to - push | to << 6 | flag << 12)
+        else:
+            append(to - push | to << 6)
+    while double:
+        low = double & -double
+        to = low.bit_length() - 1
+        double ^= low
+        append(to - 2 * push | to << 6 | FLAG_DOUBLE << 12)
+    pawn_attacks = PAWN_ATTACKS[side]
+    ep_bit = 1 << ep_square if ep_square >= 0 else 0
+    bb = pawns
+    while bb:
+        low = bb & -bb
+        sq = low.bit_length() - 1
+        bb ^= low
+        attacks = pawn_attacks[sq]
+        targets = attacks & them
+        while targets:
+            hit = targets & -targets
+            to = hit.bit_length() - 1
+            targets ^= hit
+            if hit & last_rank:
+                for flag in (7, 6, 5, 4):
+                    append(sq | to << 6 | flag << 12)
+            else:
+                append(sq | to << 6)
+        if attacks & ep_bit:
+            append(sq | ep_square << 6 | FLAG_ENPASSANT << 12)
+
+    for index in range(base + KNIGHT, base + 6):
+        bb = pieces[index]
+        while bb:
+            low = bb & -bb
+            sq = low.bit_length() - 1
+            bb ^= low
+            targets = piece_attacks(index, sq, occupied) & ~us
+            while targets:
+                hit = targets & -targets
+                targets ^= hit
+                append(sq | (hit.bit_length() - 1) << 6)
+
+    # Castling only needs the squares between king and rook to be empty here; the check rules are applied by the legal filter
+    if side == WHITE:
+        if castling & CASTLE_WK and not occupied & 0x60:
+            append(4 | 6 << 6 | FLAG_CASTLE << 12)
+        if castling & CASTLE_WQ and not occupied & 0x0E:
+            append(4 | 2 << 6 | FLAG_CASTLE << 12)
+    else:
+        if castling & CASTLE_BK and not occupied & 0x60 << 56:
+            append(60 | 62 << 6 | FLAG_CASTLE << 12)
+        if castling & CASTLE_BQ and not occupied & 0x0E << 56:
+            append(60 | 58 << 6 | FLAG_CASTLE << 12)
+    return moves
+
+def is_square_attacked(pos, sq, by_colour):
+    # Look outward from sq for a piece of `by_colour` that hits it: knight and king jumps, pawn diagonals, then the first piece on each ray
+    pieces = pos.pieces
+    base = by_colour * 6
+    if KNIGHT_ATTACKS[sq] & pieces[base + KNIGHT]:
+        return True
+    if PAWN_ATTACKS[by_colour ^ 1][sq] & pieces[base + PAWN]:
+        return True
+    if KING_ATTACKS[sq] & pieces[base + KING]:
+        return True
+    occupied = pos.colours[WHITE] | pos.colours[BLACK]
+    queens = pieces[base + QUEEN]
+    straight = pieces[base + ROOK] | queens
+    if straight and rook_attacks(sq, occupied) & straight:
+        return True
+    diagonal = pieces[base + BISHOP] | queens
+    if diagonal and bishop_attacks(sq, occupied) & diagonal:
+        return True
+    return False
+
+#A pawn of one colour attacks sq exactly when a pawn of the other colour standing on sq would attack it, which is why the pawn table is looked up for the opposite side
+
+def in_check(pos):
+    # Whether the side to move has its king attacked
+    side = pos.side
+    return is_square_attacked(pos, pos.pieces[side * 6 + KING].bit_length() - 1, side ^ 1)
+
+def _between_table():
+    # Squares strictly between two squares that share a rank, file or diagonal (0 when they do not line up)
+    table = [[0] * 64 for sq in range(64)]
+    for rays in (RAY_N, RAY_E, RAY_NE, RAY_NW, RAY_S, RAY_W, RAY_SW, RAY_SE):
+        for sq in range(64):
+            ray = rays[sq]
+            while ray:
+                low = ray & -ray
+                target = low.bit_length() - 1
+                ray ^= low
+                table[sq][target] = rays[sq] & ~rays[target] & ~low
+    return table
+
+BETWEEN = _between_table()
+
+def pinned_pieces(pos):
+    # Pieces of the side to move that stand alone between their king and an enemy rook, bishop or queen
+    side = pos.side
+    base = (side ^ 1) * 6
+    pieces = pos.pieces
+    king_sq = pieces[side * 6 + KING].bit_length() - 1
+    them = pos.colours[side ^ 1]
+    occupied = them | pos.colours[side]
+    queens = pieces[base + QUEEN]
+    snipers = rook_attacks(king_sq, them) & (pieces[base + ROOK] | queens)
+    snipers |= bishop_attacks(king_sq, them) & (pieces[base + BISHOP] | queens)
+    pinned = 0
+    while snipers:
+        low = snipers & -snipers
+        snipers ^= low
+        between = BETWEEN[king_sq][low.bit_length() - 1] & occupied
+        if between and not between & (between - 1):
+            pinned |= between
+    return pinned
+
+#Looking from the king with only enemy pieces as blockers finds every enemy slider lined up with it; if exactly one piece stands in between (and it is ours) that piece is pinned
+
+def iter_legal_moves(pos):
+    # Yield legal moves one at a time, cheapest to confirm first, so callers can stop at the first one they need
+    side = pos.side
+    enemy = side ^ 1
+    pieces = pos.pieces
+    king_index = side * 6 + KING
+    king_sq = pieces[king_index].bit_length() - 1
+    moves = generate_pseudo_moves(pos)
+    if is_square_attacked(pos, king_sq, enemy):
+        # In check nothing is safe without trying it; king steps are the likeliest escapes so they go first
+        moves.sort(key=lambda move: (move & 63) != king_sq)
+        for move in moves:
+            if move >> 12 == FLAG_CASTLE:
+                continue
+            pos.make_move(move)
+            safe = not is_square_attacked(pos, pieces[king_index].bit_length() - 1, enemy)
+            pos.unmake_move()
+            if safe:
+                yield move
+        return
+
+    pinned = pinned_pieces(pos)
+    risky = []
+    for move in moves:
+        frm = move & 63
+        flag = move >> 12
+        if frm == king_sq or flag == FLAG_ENPASSANT or pinned >> frm & 1:
+            risky.append(move)
+        else:
+            # Out of check, a piece that is not pinned cannot expose its own king
+            yield move
+    for move in risky:
+        to = move >> 6 & 63
+        if move >> 12 == FLAG_CASTLE:
+            # The king may not castle out of, through or into check (it is not in check here)
+            if not (is_square_attacked(pos, (king_sq + to) // 2, enemy) or is_square_attacked(pos, to, enemy)):
+                yield move
+            continue
+        pos.make_move(move)
+        safe = not is_square_attacked(pos, pieces[king_index].bit_length() - 1, enemy)
+        pos.unmake_move()
+        if safe:
+            yield move
+
+def generate_legal_moves(pos):
+    # Every legal move for the side to move
+    return list(iter_legal_moves(pos))
+
+def has_legal_move(pos):
+    # Stop at the first legal move found; False means checkmate or stalemate
+    for move in iter_legal_moves(pos):
+        return True
+    return False
+
+CASTLING_KEEP = [15] * 64
+CASTLING_KEEP[0] = 15 ^ CASTLE_WQ
+CASTLING_KEEP[4] = 15 ^ (CASTLE_WK | CASTLE_WQ)
+CASTLING_KEEP[7] = 15 ^ CASTLE_WK
+CASTLING_KEEP[56] = 15 ^ CASTLE_BQ
+CASTLING_KEEP[60] = 15 ^ (CASTLE_BK | CASTLE_BQ)
+CASTLING_KEEP[63] = 15 ^ CASTLE_BK
+
+#Any move touching a king or rook home square (moving from it or capturing on it) masks off the castling rights that depend on that piece
+
+_zobrist_random = random.Random(20231120)
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(64) for sq in range(64)] for index in range(12)]
+ZOBRIST_BLACK = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for rights in range(16)]
+ZOBRIST_EP = [_zobrist_random.getrandbits(64) for file in range(8)]
+
+#Zobrist keys: a position's key is the XOR of one fixed random number per piece on its square, plus numbers for black to move, the castling mask and the en passant file. The generator is seeded so keys are the same in every run and can be stored in files
+
+def zobrist_pawn_key(pos):
+    # Key of the pawn placement alone, from scratch, made from the same numbers as the full key
+    key = 0
+    for index in (PAWN, 6 + PAWN):
+        pawns = pos.pieces[index]
+        while pawns:
+            low = pawns & -pawns
+            key ^= ZOBRIST_PIECES[index][low.bit_length() - 1]
+            pawns ^= low
+    return key
+
+def zobrist_key(pos):
+    # Compute a position's key from scratch (make_move keeps it up to date incrementally; this is for checking)
+    key = ZOBRIST_CASTLING[pos.castling]
+    for sq in range(64):
+        index = pos.squares[sq]
+        if index != EMPTY:
+            key ^= ZOBRIST_PIECES[index][sq]
+    if pos.side == BLACK:
+        key ^= ZOBRIST_BLACK
+    if pos.ep >= 0:
+        key ^= ZOBRIST_EP[pos.ep % 8]
+    return key
+
+class Position:
+    # The whole state of one game: piece numbers for all 64 squares, mirrored into one bitboard per piece and per colour
+    __slots__ = ('squares', 'pieces', 'colours', 'side', 'castling', 'ep', 'halfmove', 'fullmove', 'undo', 'key', 'pawn_key', 'material', 'positional')
+
+    def __init__(self, fen=START_FEN):
+        # Set the position up from a FEN string
+        self.squares = bytearray([EMPTY]) * 64
+        self.pieces = [0] * 12
+        self.colours = [0, 0]
+        self.key = 0
+        self.pawn_key = 0
+        self.material = 0
+        self.positional = 0
+        fields = fen.split()
+        rank = 7
+        file = 0
+        for letter in fields[0]:
+            if letter == '/':
+                rank -= 1
+                file = 0
+            elif letter.isdigit():
+                file += int(letter)
+            else:
+                self.put(rank * 8 + file, FEN_LETTERS.index(letter))
+                file += 1
+        self.side = WHITE if len(fields) < 2 or fields[1] == 'w' else BLACK
+        self.castling = 0
+        if len(fields) > 2:
+            for letter, right in (('K', CASTLE_WK), ('Q', CASTLE_WQ), ('k', CASTLE_BK), ('q', CASTLE_BQ)):
+                if letter in fields[2]:
+                    self.castling |= right
+        self.ep = SQUARE_INDEX[fields[3]] if len(fields) > 3 and fields[3] != '-' else -1
+        self.halfmove = int(fields[4]) if len(fields) > 4 else 0
+        self.fullmove = int(fields[5]) if len(fields) > 5 else 1
+        self.undo = []
+        if self.ep >= 0 and not PAWN_ATTACKS[self.side ^ 1][self.ep] & self.pieces[self.side * 6 + PAWN]:
+            self.ep = -1
+        self.key ^= ZOBRIST_CASTLING[self.castling]
+        if self.side == BLACK:
+            self.key ^= ZOBRIST_BLACK
+        if self.ep >= 0:
+            self.key ^= ZOBRIST_EP[self.ep % 8]
+
+    def put(self, sq, index):
+        # Place piece number `index` on an empty square
+        bit = 1 << sq
+        self.squares[sq] = index
+        self.pieces[index] |= bit
+        self.colours[index // 6] |= bit
+        self.key ^= ZOBRIST_PIECES[index][sq]
+        if index % 6 == PAWN:
+            self.pawn_key ^= ZOBRIST_PIECES[index][sq]
+        self.material += MATERIAL_TABLE[index]
+        self.positional += POSITIONAL_TABLE[index][sq]
+
+    def remove(self, sq):
+        # Lift whatever stands on sq off the board and return its piece number (EMPTY if the square was bare)
+        index = self.squares[sq]
+        if index != EMPTY:
+            bit = 1 << sq
+            self.squares[sq] = EMPTY
+            self.pieces[index] ^= bit
+            self.colours[index // 6] ^= bit
+            self.key ^= ZOBRIST_PIECES[index][sq]
+            if index % 6 == PAWN:
+                self.pawn_key ^= ZOBRIST_PIECES[index][sq]
+            self.material -= MATERIAL_TABLE[index]
+            self.positional -= POSITIONAL_TABLE[index][sq]
+        return index
+
+    def code(self, sq):
+        # Two letter code of the piece on sq, or None for an empty square
+        index = self.squares[sq]
+        return PIECE_CODES[index] if index != EMPTY else None
+
+    def copy(self):
+        # Independent copy, so trial moves never touch the original
+        other = Position.__new__(Position)
+        other.squares = self.squares[:]
+        other.pieces = self.pieces[:]
+        other.colours = self.colours[:]
+        other.side = self.side
+        other.castling = self.castling
+        other.ep = self.ep
+        other.halfmove = self.halfmove
+        other.fullmove = self.fullmove
+        other.undo = self.undo[:]
+        other.key = self.key
+        other.pawn_key = self.pawn_key
+        other.material = self.material
+        other.positional = self.positional
+        return other
+
+    def fen(self):
+        # Write the position back out as a FEN string
+        rows = []
+        for rank in range(7, -1, -1):
+            row = ''
+            gap = 0
+            for file in range(8):
+                index = self.squares[rank * 8 + file]
+                if index == EMPTY:
+                    gap += 1
+                    continue
+                if gap:
+                    row += str(gap)
+                    gap = 0
+                row += FEN_LETTERS[index]
+            if gap:
+                row += str(gap)
+            rows.append(row)
+        rights = ''.join(letter for letter, right in (('K', CASTLE_WK), ('Q', CASTLE_WQ), ('k', CASTLE_BK), ('q', CASTLE_BQ)) if self.castling & right)
+        ep = SQUARE_NAMES[self.ep] if self.ep >= 0 else '-'
+        return f"{'/'.join(rows)} {'wb'[self.side]} {rights or '-'} {ep} {self.halfmove} {self.fullmove}"
+
+    def make_move(self, move):
+        # Play a move from the generator: move the piece, take captures, move the rook when castling and update the rights, en passant square and counters
+        # Everything unmake_move() needs to step back is pushed on the undo stack first
+        squares = self.squares
+        pieces = self.pieces
+        colours = self.colours
+        side = self.side
+        frm = move & 63
+        to = move >> 6 & 63
+        flag = move >> 12
+        from_bit = 1 << frm
+        to_bit = 1 << to
+        moved = squares[frm]
+        captured = squares[to]
+        castling = self.castling
+        key = self.key
+        material = self.material
+        positional = self.positional
+        pawn_key = self.pawn_key
+        self.undo.append((move, captured, castling, self.ep, self.halfmove, key, material, positional, pawn_key))
+        if self.ep >= 0:
+            key ^= ZOBRIST_EP[self.ep % 8]
+        if captured != EMPTY:
+            pieces[captured] ^= to_bit
+            colours[side ^ 1] ^= to_bit
+            key ^= ZOBRIST_PIECES[captured][to]
+            material -= MATERIAL_TABLE[captured]
+            positional -= POSITIONAL_TABLE[captured][to]
+            if captured % 6 == PAWN:
+                pawn_key ^= ZOBRIST_PIECES[captured][to]
+        pieces[moved] ^= from_bit
+        colours[side] ^= from_bit | to_bit
+        squares[frm] = EMPTY
+        placed = side * 6 + flag - 3 if flag >= FLAG_PROMOTION else moved
+        pieces[placed] |= to_bit
+        squares[to] = placed
+        key ^= ZOBRIST_PIECES[moved][frm] ^ ZOBRIST_PIECES[placed][to]
+        positional += POSITIONAL_TABLE[placed][to] - POSITIONAL_TABLE[moved][frm]
+        if placed != moved:
+            material += MATERIAL_TABLE[placed] - MATERIAL_TABLE[moved]
+        if moved % 6 == PAWN:
+            # The pawn key follows pawns only: a promoting pawn leaves it, and a capture of a pawn (above) takes it out
+            pawn_key ^= ZOBRIST_PIECES[moved][frm]
+            if placed == moved:
+                pawn_key ^= ZOBRIST_PIECES[moved][to]
+        if flag == FLAG_ENPASSANT:
+            taken = to - 8 if side == WHITE else to + 8
+            captured = squares[taken]
+            squares[taken] = EMPTY
+            pieces[captured] ^= 1 << taken
+            colours[side ^ 1] ^= 1 << taken
+            key ^= ZOBRIST_PIECES[captured][taken]
+            material -= MATERIAL_TABLE[captured]
+            positional -= POSITIONAL_TABLE[captured][taken]
+            pawn_key ^= ZOBRIST_PIECES[captured][taken]
+        elif flag == FLAG_CASTLE:
+            rook_from, rook_to = (frm + 3, frm + 1) if to > frm else (frm - 4, frm - 1)
+            rook = squares[rook_from]
+            squares[rook_from] = EMPTY
+            squares[rook_to] = rook
+            pieces[rook] ^= 1 << rook_from | 1 << rook_to
+            colours[side] ^= 1 << rook_from | 1 << rook_to
+            key ^= ZOBRIST_PIECES[rook][rook_from] ^ ZOBRIST_PIECES[rook][rook_to]
+            positional += POSITIONAL_TABLE[rook][rook_to] - POSITIONAL_TABLE[rook][rook_from]
+        self.material = material
+        self.positional = positional
+        self.pawn_key = pawn_key
+        self.castling = castling & CASTLING_KEEP[frm] & CASTLING_KEEP[to]
+        key ^= ZOBRIST_CASTLING[castling] ^ ZOBRIST_CASTLING[self.castling]
+        self.ep = -1
+        if flag == FLAG_DOUBLE and PAWN_ATTACKS[side][(frm + to) // 2] & pieces[(side ^ 1) * 6 + PAWN]:
+            # Only record an en passant square an enemy pawn could actually use, so positions that play the same compare equal
+            self.ep = (frm + to) // 2
+            key ^= ZOBRIST_EP[self.ep % 8]
+        self.key = key ^ ZOBRIST_BLACK
+        if moved % 6 == PAWN or captured != EMPTY:
+            self.halfmove = 0
+        else:
+            self.halfmove += 1
+        if side == BLACK:
+            self.fullmove += 1
+        self.side = side ^ 1
+
+    def unmake_move(self):
+        # Take back the last move played with make_move(), restoring the captured piece, rights, en passant square and counters
+        move, captured, castling, ep, halfmove, self.key, self.material, self.positional, self.pawn_key = self.undo.pop()
+        squares = self.squares
+        pieces = self.pieces
+        colours = self.colours
+        side = self.side ^ 1
+        frm = move & 63
+        to = move >> 6 & 63
+        flag = move >> 12
+        from_bit = 1 << frm
+        to_bit = 1 << to
+        placed = squares[to]
+        moved = side * 6 + PAWN if flag >= FLAG_PROMOTION else placed
+        pieces[placed] ^= to_bit
+        pieces[moved] |= from_bit
+        colours[side] ^= from_bit | to_bit
+        squares[frm] = moved
+        squares[to] = captured
+        if captured != EMPTY:
+            pieces[captured] |= to_bit
+            colours[side ^ 1] |= to_bit
+        if flag == FLAG_ENPASSANT:
+            taken = to - 8 if side == WHITE else to + 8
+            pawn = (side ^ 1) * 6 + PAWN
+            squares[taken] = pawn
+            pieces[pawn] |= 1 << taken
+            colours[side ^ 1] |= 1 << taken
+        elif flag == FLAG_CASTLE:
+            rook_from, rook_to = (frm + 3, frm + 1) if to > frm else (frm - 4, frm - 1)
+            rook = squares[rook_to]
+            squares[rook_to] = EMPTY
+            squares[rook_from] = rook
+            pieces[rook] ^= 1 << rook_from | 1 << rook_to
+            colours[side] ^= 1 << rook_from | 1 << rook_to
+        self.castling = castling
+        self.ep = ep
+        self.halfmove = halfmove
+        if side == BLACK:
+            self.fullmove -= 1
+        self.side = side
+
+    def repetitions(self):
+        # Count earlier positions in the undo stack with the same key, looking back only as far as the last capture or pawn move
+        count = 0
+        for entry in self.undo[max(0, len(self.undo) - self.halfmove):]:
+            if entry[5] == self.key:
+                count += 1
+        return count
+
+def history_token(move, side):
+    # Compact GameHistory.txt notation for a move: the from square as file/rank digits followed by the destination
+    frm = move & 63
+    to = move >> 6 & 63
+    flag = move >> 12
+    origin = SQUARE_KEYS[frm]
+    if flag == FLAG_CASTLE:
+        return f"{origin}{'wb'[side]}{'k' if to > frm else 'q'}"
+    if flag == FLAG_ENPASSANT:
+        return f"{origin}{to % 8 + 1}{'e' if side == WHITE else 'E'}"
+    if flag >= FLAG_PROMOTION:
+        letter = 'nbrq'[flag - FLAG_PROMOTION]
+        return f"{origin}{to % 8 + 1}{letter if side == WHITE else letter.upper()}"
+    return f'{origin}{SQUARE_KEYS[to]}'
+
+def history_move(pos, token):
+    # Turn one four character GameHistory.txt entry back into the move it records, or None if it does not fit the position
+    frm = SQUARE_KEY_INDEX.get(token[:2])
+    for move in generate_pseudo_moves(pos):
+        if move & 63 == frm and history_token(move, pos.side) == token:
+            return move
+    return None
+
+#Castles are logged as wk/wq/bk/bq, en passant as the file plus e (white) or E (black), and promotions as the file plus the new piece's letter, lower case for white and upper case for black
+
+def history_games(path='GameHistory.txt'):
+    # The moves of every recorded game, read from the compact history notation up to the first entry that does not replay
+    games = []
+    with open(path, 'r') as fp:
+        for line in fp:
+            if ';' not in line:
+                continue
+            record = line.split(';')[-1].split('¿')[0]
+            pos = setboard()
+            moves = []
+            for a in range(0, len(record) - 3, 4):
+                move = history_move(pos, record[a:a + 4])
+                if move is None:
                     break
-            elif newranks > 0:
-                possible_moves.append(f'{filecondict[int(file)]}{str(newranks)}')
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(file)]}{str(newranks)}'))
-
-
-        for i in range(7):
-            i += 1
-            # Horizontal scan moving right
-            newfile = int(file) + i
-            if f'{newfile}{rank}' in board:
-                collisioncol = board[f'{newfile}{rank}']
-                if x[0] == collisioncol[0]:
+                pos.make_move(move)
+                moves.append(move)
+            games.append(moves)
+    return games
+
+def history_positions(path='GameHistory.txt'):
+    # Every position reached in the recorded games
+    positions = []
+    for moves in history_games(path):
+        pos = setboard()
+        for move in moves:
+            pos.make_move(move)
+            positions.append(pos.copy())
+    return positions
+
+
+BOOK_FILE = 'OFFChess.book'
+BOOK_ENTRY = struct.Struct('>QHHIII')
+BOOK_PLIES = 24
+
+#Opening book entries are fixed 24 byte records: position key, move, weight (times played, capped), then wins, draws and losses for the side that played the move. The file is sorted by key, so all the moves for a position sit together and a binary search finds them
+
+SAN_PATTERN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])=?([NBRQ])?$')
+
+#Standard algebraic notation once check marks and annotations are stripped: piece, from file, from rank, capture, destination, promotion
+
+def parse_san(pos, text):
+    # Find the legal move written in standard algebraic notation (e4, Nxf3, exd8=Q, O-O), or None if it does not fit the position
+    text = text.rstrip('+#!?').replace('0', 'O')
+    moves = generate_legal_moves(pos)
+    if text in ('O-O', 'O-O-O'):
+        for move in moves:
+            if move >> 12 == FLAG_CASTLE and ((move >> 6 & 63) > (move & 63)) == (text == 'O-O'):
+                return move
+        return None
+    found = SAN_PATTERN.match(text)
+    if not found:
+        return None
+    letter, from_file, from_rank, target, promote = found.groups()
+    piece_type = 'PNBRQK'.index(letter or 'P')
+    to = SQUARE_INDEX[target]
+    matches = []
+    for move in moves:
+        frm = move & 63
+        flag = move >> 12
+        if move >> 6 & 63 != to or pos.squares[frm] % 6 != piece_type or flag == FLAG_CASTLE:
+            continue
+        if from_file and SQUARE_NAMES[frm][0] != from_file or from_rank and SQUARE_NAMES[frm][1] != from_rank:
+            continue
+        if (flag >= FLAG_PROMOTION) != bool(promote) or promote and 'NBRQ'[flag - FLAG_PROMOTION] != promote:
+            continue
+        matches.append(move)
+    return matches[0] if len(matches) == 1 else None
+
+def pgn_games(path):
+    # Read a PGN collection: yields (moves as SAN text, result as 'w', 'b', 'd' or None) for every game, with comments, variations and move numbers dropped
+    with open(path, 'r', errors='replace') as fp:
+        text = fp.read()
+    result = None
+    tokens = []
+    depth = 0
+    for line in text.splitlines() + ['[Event ""]']:
+        line = line.strip()
+        if line.startswith('[') and depth == 0:
+            if tokens:
+                yield tokens, result
+                tokens = []
+                result = None
+            if line.startswith('[Result '):
+                result = {'"1-0"': 'w', '"0-1"': 'b', '"1/2-1/2"': 'd'}.get(line[8:].rstrip(']').strip())
+            continue
+        for word in line.replace('(', ' ( ').replace(')', ' ) ').replace('{', ' { ').replace('}', ' } ').split():
+            if word in ('(', '{'):
+                depth += 1
+            elif word in (')', '}'):
+                depth -= 1
+            elif depth == 0 and not word.startswith('$') and word not in ('1-0', '0-1', '1/2-1/2', '*'):
+                word = word.split('.')[-1]
+                if word:
+                    tokens.append(word)
+
+def history_results(path='GameHistory.txt'):
+    # Recorded games paired with their result as 'w', 'b', 'd', or None for a game that was never finished
+    results = []
+    with open(path, 'r') as fp:
+        for line in fp:
+            if ';' not in line:
+                continue
+            players = line.split(';')[0].split(' (')[0].split(' VS ')
+            ending = line.split('¿')[-1].strip() if '¿' in line else ''
+            if ending == 'Both players draw':
+                results.append('d')
+            elif ending.endswith(' wins') and len(players) == 2:
+                results.append('w' if ending[:-5] == players[0] else 'b')
+            else:
+                results.append(None)
+    return results
+
+def build_book(output=BOOK_FILE, pgn_files=(), plies=BOOK_PLIES, history='GameHistory.txt'):
+    # Collect (position key, move) statistics from the game archive and any PGN files over the first plies of each game, then write them as a sorted book file; returns (games, entries)
+    stats = {}
+    games = 0
+
+    def add(moves, result):
+        # Count one game's opening moves
+        pos = setboard()
+        for move in moves[:plies]:
+            record = stats.setdefault((pos.key, move), [0, 0, 0, 0])
+            record[0] += 1
+            if result == 'd':
+                record[2] += 1
+            elif result is not None:
+                record[1 if result == 'wb'[pos.side] else 3] += 1
+            pos.make_move(move)
+
+    if history and os.path.exists(history):
+        for moves, result in zip(history_games(history), history_results(history)):
+            add(moves, result)
+            games += 1
+    for path in pgn_files:
+        for tokens, result in pgn_games(path):
+            pos = setboard()
+            moves = []
+            for token in tokens[:plies]:
+                move = parse_san(pos, token)
+                if move is None:
                     break
+                pos.make_move(move)
+                moves.append(move)
+            add(moves, result)
+            games += 1
+    with open(output, 'wb') as fp:
+        for (key, move), (played, wins, draws, losses) in sorted(stats.items(), key=lambda item: (item[0][0], -item[1][0])):
+            fp.write(BOOK_ENTRY.pack(key, move, min(played, 65535), wins, draws, losses))
+    return games, len(stats)
+
+class OpeningBook:
+    # Read-only view of a book file: memory-mapped and binary searched, so a lookup touches a few pages whatever the size of the book
+
+    def __init__(self, path=BOOK_FILE):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.count = size // BOOK_ENTRY.size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def close(self):
+        # Unmap and close the file
+        if self.data:
+            self.data.close()
+        self.file.close()
+
+    def _key_at(self, index):
+        # Position key of record number index
+        return BOOK_ENTRY.unpack_from(self.data, index * BOOK_ENTRY.size)[0]
+
+    def entries(self, pos):
+        # Book moves for pos as (move, weight, wins, draws, losses), most played first; moves that are not legal here (a key collision) are left out
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < pos.key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        legal = None
+        while low < self.count:
+            key, move, weight, wins, draws, losses = BOOK_ENTRY.unpack_from(self.data, low * BOOK_ENTRY.size)
+            if key != pos.key:
+                break
+            if legal is None:
+                legal = generate_legal_moves(pos)
+            if move in legal:
+                found.append((move, weight, wins, draws, losses))
+            low += 1
+        return found
+
+    def pick(self, pos, rng=random):
+        # Choose a book move at random in proportion to how often it was played (favouring moves that scored), or None when out of book
+        found = self.entries(pos)
+        if not found:
+            return None
+        weights = [max(weight + wins - losses, 1) for move, weight, wins, draws, losses in found]
+        return rng.choices([entry[0] for entry in found], weights)[0]
+
+opening_book = None
+
+def get_book():
+    # The opening book, opened on first use; None if no book file has been built
+    global opening_book
+    if opening_book is None and os.path.exists(BOOK_FILE):
+        opening_book = OpeningBook(BOOK_FILE)
+    return opening_book
+
+TABLEBASE_DIR = 'tablebases'
+TABLEBASE_PIECES = {'KQK': QUEEN, 'KRK': ROOK, 'KPK': PAWN}
+TABLEBASE_HEADER = struct.Struct('>4sBI')
+TABLEBASE_SIZE = 2 * 64 * 64 * 64
+
+#A table covers the king and one piece against a lone king, always with the piece on the White side (probes mirror the board when it is Black's). Entry number side<<18 | white king<<12 | piece<<6 | black king holds 0 for a draw (or an impossible placement) and otherwise plies to mate plus one: odd distances are wins for the side to move, even ones losses. Entries are bit-packed at the width the longest mate needs
+
+def _tablebase_squares(index):
+    # Split an entry number into (side to move, white king, piece, black king)
+    return index >> 18, index >> 12 & 63, index >> 6 & 63, index & 63
+
+def _tablebase_legal(piece_type, side, wk, ps, bk):
+    # Whether the placement can occur: three different squares, kings apart, no pawn on the end ranks, and the side not to move not in check
+    if wk == ps or wk == bk or ps == bk or KING_ATTACKS[wk] >> bk & 1:
+        return False
+    if piece_type == PAWN and not 8 <= ps < 56:
+        return False
+    return side == BLACK or not piece_attacks(piece_type, ps, 1 << wk | 1 << ps | 1 << bk) >> bk & 1
+
+def _tablebase_chunk(task):
+    # Worker side of generation: the successors of every entry in [start, stop), with promotions looked up in the finished queen and rook tables
+    name, start, stop, directory = task
+    piece_type = TABLEBASE_PIECES[name]
+    counts = array.array('b')
+    successors = array.array('i')
+    external = []
+    promoted = {}
+    if piece_type == PAWN:
+        promoted = {QUEEN: load_tablebase('KQK', directory), ROOK: load_tablebase('KRK', directory)}
+    for index in range(start, stop):
+        side, wk, ps, bk = _tablebase_squares(index)
+        if not _tablebase_legal(piece_type, side, wk, ps, bk):
+            counts.append(-1)
+            continue
+        found = 0
+        if side == WHITE:
+            targets = KING_ATTACKS[wk] & ~KING_ATTACKS[bk] & ~(1 << ps | 1 << bk)
+            while targets:
+                low = targets & -targets
+                targets ^= low
+                successors.append(1 << 18 | (low.bit_length() - 1) << 12 | ps << 6 | bk)
+                found += 1
+            if piece_type == PAWN:
+                one = ps + 8
+                if one != wk and one != bk:
+                    if one >= 56:
+                        for promote in (QUEEN, ROOK, BISHOP, KNIGHT):
+                            # Bishop and knight promotions leave no mating material: a draw, so they are never resolved
+                            table = promoted.get(promote)
+                            external.append((index, table.code(1 << 18 | wk << 12 | one << 6 | bk) if table else 0))
+                            found += 1
+                    else:
+                        successors.append(1 << 18 | wk << 12 | one << 6 | bk)
+                        found += 1
+                        two = ps + 16
+                        if ps < 16 and two != wk and two != bk:
+                            successors.append(1 << 18 | wk << 12 | two << 6 | bk)
+                            found += 1
+            else:
+                targets = piece_attacks(piece_type, ps, 1 << wk | 1 << bk) & ~(1 << wk | 1 << bk)
+                while targets:
+                    low = targets & -targets
+                    targets ^= low
+                    successors.append(1 << 18 | wk << 12 | (low.bit_length() - 1) << 6 | bk)
+                    found += 1
+        else:
+            attacked = piece_attacks(piece_type, ps, 1 << wk)
+            targets = KING_ATTACKS[bk] & ~KING_ATTACKS[wk] & ~(1 << wk)
+            while targets:
+                low = targets & -targets
+                targets ^= low
+                to = low.bit_length() - 1
+                if to == ps:
+                    # Taking the undefended piece leaves two bare kings
+                    external.append((index, 0))
+                    found += 1
+                elif not attacked & low:
+                    successors.append(wk << 12 | ps << 6 | to)
+                    found += 1
+        counts.append(found)
+    return start, counts.tobytes(), successors.tobytes(), external
+
+def generate_tablebase(name, workers=1, directory=TABLEBASE_DIR):
+    # Build one table by retrograde analysis and write it to directory/name.tb; returns (entries resolved as wins or losses, file size in bytes)
+    piece_type = TABLEBASE_PIECES[name]
+    chunk = TABLEBASE_SIZE // 64
+    tasks = [(name, start, start + chunk, directory) for start in range(0, TABLEBASE_SIZE, chunk)]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_tablebase_chunk, tasks))
+    else:
+        parts = [_tablebase_chunk(task) for task in tasks]
+    counts = array.array('b')
+    successors = array.array('i')
+    offsets = array.array('i', [0])
+    external = []
+    for start, part_counts, part_successors, part_external in parts:
+        counts.frombytes(part_counts)
+        successors.frombytes(part_successors)
+        external.extend(part_external)
+    # Flat successor lists are turned around into flat predecessor lists, so resolving an entry can reach every entry that moves into it
+    external_count = array.array('b', [0]) * TABLEBASE_SIZE
+    for index, code in external:
+        external_count[index] += 1
+    incoming = array.array('i', [0]) * (TABLEBASE_SIZE + 1)
+    cursor = 0
+    for index in range(TABLEBASE_SIZE):
+        for slot in range(cursor, cursor + max(counts[index], 0) - external_count[index]):
+            incoming[successors[slot] + 1] += 1
+        cursor += max(counts[index], 0) - external_count[index]
+    for index in range(TABLEBASE_SIZE):
+        incoming[index + 1] += incoming[index]
+    predecessors = array.array('i', [0]) * len(successors)
+    fill = incoming[:]
+    cursor = 0
+    for index in range(TABLEBASE_SIZE):
+        for slot in range(cursor, cursor + max(counts[index], 0) - external_count[index]):
+            target = successors[slot]
+            predecessors[fill[target]] = index
+            fill[target] += 1
+        cursor += max(counts[index], 0) - external_count[index]
+    # Resolve outwards from the mates, one ply of distance at a time
+    distance = array.array('h', [-1]) * TABLEBASE_SIZE
+    remaining = array.array('b', counts)
+    buckets = {0: []}
+    wins_at = {}
+    losses_at = {}
+    for index in range(TABLEBASE_SIZE):
+        if counts[index] == 0:
+            side, wk, ps, bk = _tablebase_squares(index)
+            if side == BLACK and piece_attacks(piece_type, ps, 1 << wk | 1 << ps | 1 << bk) >> bk & 1:
+                distance[index] = 0
+                buckets[0].append(index)
+    for index, code in external:
+        if code:
+            plies = code - 1
+            if plies % 2 == 0:
+                wins_at.setdefault(plies + 1, []).append(index)
+            else:
+                losses_at.setdefault(plies, []).append(index)
+    last = max(list(wins_at) + list(losses_at) + [0])
+    plies = 0
+    while plies <= last or buckets.get(plies):
+        resolved = buckets.setdefault(plies, [])
+        for index in wins_at.get(plies, ()):
+            if distance[index] < 0:
+                distance[index] = plies
+                resolved.append(index)
+        for index in losses_at.get(plies, ()):
+            if distance[index] < 0:
+                remaining[index] -= 1
+                if remaining[index] == 0:
+                    distance[index] = plies + 1
+                    buckets.setdefault(plies + 1, []).append(index)
+        for target in resolved:
+            for slot in range(incoming[target], incoming[target + 1]):
+                index = predecessors[slot]
+                if distance[index] >= 0:
+                    continue
+                if plies % 2 == 0:
+                    # Moving into a lost position for the opponent wins
+                    distance[index] = plies + 1
+                    buckets.setdefault(plies + 1, []).append(index)
                 else:
-                    possible_moves.append(f'{filecondict[int(newfile)]}{str(rank)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(rank)}'))
+                    # Every move reaches a position the opponent wins: lost, as slowly as the last of them
+                    remaining[index] -= 1
+                    if remaining[index] == 0:
+                        distance[index] = plies + 1
+                        buckets.setdefault(plies + 1, []).append(index)
+        plies += 1
+    codes = [plies + 1 if plies >= 0 else 0 for plies in distance]
+    width = max(codes).bit_length()
+    packed = bytearray((TABLEBASE_SIZE * width + 7) // 8 + 2)
+    bit = 0
+    for code in codes:
+        if code:
+            value = code << (bit & 7)
+            byte = bit >> 3
+            while value:
+                packed[byte] |= value & 255
+                value >>= 8
+                byte += 1
+        bit += width
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{name}.tb')
+    with open(path, 'wb') as fp:
+        fp.write(TABLEBASE_HEADER.pack(name.encode(), width, TABLEBASE_SIZE))
+        fp.write(packed)
+    tablebases.pop((name, directory), None)
+    return sum(1 for code in codes if code), os.path.getsize(path)
+
+class Tablebase:
+    # One loaded table: unpacks single entries straight from the packed bytes
+
+    def __init__(self, path):
+        with open(path, 'rb') as fp:
+            data = fp.read()
+        name, self.width, self.size = TABLEBASE_HEADER.unpack_from(data)
+        self.name = name.decode()
+        self.data = data[TABLEBASE_HEADER.size:]
+        self.mask = (1 << self.width) - 1
+
+    def code(self, index):
+        # Raw entry: 0 for a draw, otherwise plies to mate plus one
+        bit = index * self.width
+        return int.from_bytes(self.data[bit >> 3:(bit >> 3) + 3], 'little') >> (bit & 7) & self.mask
+
+tablebases = {}
+
+def load_tablebase(name, directory=TABLEBASE_DIR):
+    # The named table, read on first use; None if it has not been generated
+    if (name, directory) not in tablebases:
+        path = os.path.join(directory, f'{name}.tb')
+        tablebases[(name, directory)] = Tablebase(path) if os.path.exists(path) else None
+    return tablebases[(name, directory)]
+
+def probe_tablebase(pos):
+    # Exact result of a king and piece against king position as ('win' or 'loss' for the side to move, plies to mate) or ('draw', 0); None when no table covers it
+    occupied = pos.colours[WHITE] | pos.colours[BLACK]
+    if popcount(occupied) == 2:
+        return ('draw', 0)
+    if popcount(occupied) != 3:
+        return None
+    for index in range(12):
+        if index % 6 != KING and pos.pieces[index]:
+            break
+    name = f'K{"PNBRQ"[index % 6]}K'
+    if name not in TABLEBASE_PIECES:
+        return ('draw', 0) if index % 6 in (KNIGHT, BISHOP) else None
+    table = load_tablebase(name)
+    if table is None:
+        return None
+    wk = pos.pieces[KING].bit_length() - 1
+    bk = pos.pieces[6 + KING].bit_length() - 1
+    ps = pos.pieces[index].bit_length() - 1
+    side = pos.side
+    if index >= 6:
+        # Tables have the piece on the White side: flip the board over and swap the colours
+        wk, bk, ps, side = bk ^ 56, wk ^ 56, ps ^ 56, side ^ 1
+    code = table.code(side << 18 | wk << 12 | ps << 6 | bk)
+    if not code:
+        return ('draw', 0)
+    return ('win' if code % 2 == 0 else 'loss', code - 1)
+
+def tablebase_move(pos):
+    # Best move by the tables: the fastest win, else a draw, else the slowest loss; None when the position or a reply is not covered
+    best = None
+    best_rank = None
+    for move in generate_legal_moves(pos):
+        pos.make_move(move)
+        found = probe_tablebase(pos)
+        pos.unmake_move()
+        if found is None:
+            return None
+        result, plies = found
+        rank = (2, -plies) if result == 'loss' else (1, 0) if result == 'draw' else (0, plies)
+        if best_rank is None or rank > best_rank:
+            best, best_rank = move, rank
+    return best
+
+#Probing only needs the few kilobytes of one table in memory; an ending with no table returns None and callers carry on as before
+
+REFERENCE_STEPS = {
+    # (file, rank) steps for each piece type, walked one square at a time by the reference generator
+    KNIGHT: ((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)),
+    BISHOP: ((1, 1), (1, -1), (-1, -1), (-1, 1)),
+    ROOK: ((0, 1), (1, 0), (0, -1), (-1, 0)),
+    QUEEN: ((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1)),
+    KING: ((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1)),
+}
 
-                    break
-            elif newfile < 9:
-                possible_moves.append(f'{filecondict[int(newfile)]}{str(rank)}')
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(rank)}'))
-
-        for i in range(7):
-            i += 1
-            # Horizontal scan moving left
-            newfile = int(file) - i
-            if f'{newfile}{rank}' in board:
-                collisioncol = board[f'{newfile}{rank}']
-                if x[0] == collisioncol[0]:
-                    break
+def reference_attacked(squares, sq, by_colour):
+    # Whether a piece of by_colour hits sq, found by stepping out from sq over the square array
+    file, rank = sq % 8, sq // 8
+    base = by_colour * 6
+    for kind in (KNIGHT, KING):
+        for df, dr in REFERENCE_STEPS[kind]:
+            if 0 <= file + df < 8 and 0 <= rank + dr < 8 and squares[(rank + dr) * 8 + file + df] == base + kind:
+                return True
+    # A white pawn attacks from the rank below, a black one from the rank above
+    behind = rank - 1 if by_colour == WHITE else rank + 1
+    if 0 <= behind < 8:
+        for df in (-1, 1):
+            if 0 <= file + df < 8 and squares[behind * 8 + file + df] == base + PAWN:
+                return True
+    for df, dr in REFERENCE_STEPS[QUEEN]:
+        slider = base + (ROOK if df == 0 or dr == 0 else BISHOP)
+        f, r = file + df, rank + dr
+        while 0 <= f < 8 and 0 <= r < 8:
+            index = squares[r * 8 + f]
+            if index != EMPTY:
+                if index == slider or index == base + QUEEN:
+                    return True
+                break
+            f += df
+            r += dr
+    return False
+
+def reference_pseudo_moves(pos):
+    # Every move that follows the piece rules, found by scanning the square array without the bitboard tables so it can catch their mistakes
+    moves = []
+    append = moves.append
+    squares = pos.squares
+    side = pos.side
+    forward = 8 if side == WHITE else -8
+    start_rank = 1 if side == WHITE else 6
+    last_rank = 7 if side == WHITE else 0
+    for sq, index in enumerate(squares):
+        if index == EMPTY or index // 6 != side:
+            continue
+        kind = index % 6
+        file, rank = sq % 8, sq // 8
+        if kind == PAWN:
+            targets = []
+            ahead = sq + forward
+            if squares[ahead] == EMPTY:
+                targets.append(ahead)
+                if rank == start_rank and squares[ahead + forward] == EMPTY:
+                    append(sq | (ahead + forward) << 6 | FLAG_DOUBLE << 12)
+            for df in (-1, 1):
+                if 0 <= file + df < 8:
+                    to = ahead + df
+                    if to == pos.ep:
+                        append(sq | to << 6 | FLAG_ENPASSANT << 12)
+                    elif squares[to] != EMPTY and squares[to] // 6 != side:
+                        targets.append(to)
+            for to in targets:
+                if to // 8 == last_rank:
+                    for flag in (7, 6, 5, 4):
+                        append(sq | to << 6 | flag << 12)
                 else:
-                    possible_moves.append(f'{filecondict[int(newfile)]}{str(rank)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(rank)}'))
-
-                    break
-            elif newfile > 0:
-                possible_moves.append(f'{filecondict[int(newfile)]}{str(rank)}')
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(rank)}'))
-
-
-        for i in range(7):
-            i += 1
-            # Diagonal sweep northeast
-            newfile = int(file) + i
-            newranks = int(rank) + i
-            if f'{newfile}{newranks}' in board:
-                collisioncol = board[f'{newfile}{newranks}']
-                if x[0] == collisioncol[0]:
+                    append(sq | to << 6)
+            continue
+        for df, dr in REFERENCE_STEPS[kind]:
+            f, r = file + df, rank + dr
+            while 0 <= f < 8 and 0 <= r < 8:
+                target = squares[r * 8 + f]
+                if target == EMPTY or target // 6 != side:
+                    append(sq | (r * 8 + f) << 6)
+                if target != EMPTY or kind in (KNIGHT, KING):
                     break
-                else:
-                    possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
+                f += df
+                r += dr
+    # As in generate_pseudo_moves(), castling here only needs the squares between king and rook to be empty
+    home = 0 if side == WHITE else 56
+    if pos.castling & (CASTLE_WK if side == WHITE else CASTLE_BK) and squares[home + 5] == squares[home + 6] == EMPTY:
+        append(home + 4 | home + 6 << 6 | FLAG_CASTLE << 12)
+    if pos.castling & (CASTLE_WQ if side == WHITE else CASTLE_BQ) and squares[home + 1] == squares[home + 2] == squares[home + 3] == EMPTY:
+        append(home + 4 | home + 2 << 6 | FLAG_CASTLE << 12)
+    return moves
+
+def reference_legal_moves(pos):
+    # Plain legal move list: every reference pseudo move is played and kept if the king is not attacked afterwards, with no bitboard code on the way
+    legal = []
+    side = pos.side
+    enemy = side ^ 1
+    king_index = side * 6 + KING
+    squares = pos.squares
+    for move in reference_pseudo_moves(pos):
+        frm = move & 63
+        to = move >> 6 & 63
+        if move >> 12 == FLAG_CASTLE and (reference_attacked(squares, frm, enemy) or reference_attacked(squares, (frm + to) // 2, enemy)):
+            continue
+        pos.make_move(move)
+        if not reference_attacked(squares, squares.index(king_index), enemy):
+            legal.append(move)
+        pos.unmake_move()
+    return legal
+
+#Perft with --generator reference shares only Position.make_move() with the bitboard generator, so a missing castle, en passant or promotion in either one shows up as a count that differs
+
+MOVE_GENERATORS = {
+    # Move generators perft can be pointed at; a faster replacement is registered here and checked against the others
+    "bitboard": generate_legal_moves,
+    "reference": reference_legal_moves,
+}
 
+PERFT_POSITIONS = [
+    # Standard perft test positions with their published leaf counts for depth 1, 2, 3...
+    ("start", START_FEN, [20, 400, 8902, 197281, 4865609, 119060324]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862, 4085603, 193690690]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624, 11030083]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467, 422333, 15833292]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487, 89941194]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890, 3894594, 164075551]),
+]
+
+def perft(pos, depth, movegen=generate_legal_moves):
+    # Count the leaf positions exactly `depth` plies below pos
+    if depth == 0:
+        return 1
+    moves = movegen(pos)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        pos.make_move(move)
+        nodes += perft(pos, depth - 1, movegen)
+        pos.unmake_move()
+    return nodes
+
+def divide(pos, depth, movegen=generate_legal_moves):
+    # Perft split by root move, as (move text, leaf count) pairs, for tracking down a generator bug
+    counts = []
+    for move in movegen(pos):
+        pos.make_move(move)
+        counts.append((move_text(move), perft(pos, depth - 1, movegen)))
+        pos.unmake_move()
+    return counts
+
+def parse_move(pos, text):
+    # Find the legal move written in coordinate form (e2e4, e7e8q), or None if there is no such move
+    text = text.strip().lower()
+    for move in generate_legal_moves(pos):
+        if move_text(move) == text:
+            return move
+    return None
+
+def _perft_task(task):
+    # Worker side of parallel perft: rebuild the position, play the moves leading to this subtree and count it
+    fen, line, depth, generator = task
+    pos = Position(fen)
+    for text in line:
+        pos.make_move(parse_move(pos, text))
+    return line[0], perft(pos, depth, MOVE_GENERATORS[generator])
+
+def parallel_perft(fen, depth, workers, generator="bitboard", split_depth=1):
+    # Perft with the tree split at the root (or one ply deeper) and the subtrees farmed out to a process pool; returns the divide counts
+    pos = Position(fen)
+    movegen = MOVE_GENERATORS[generator]
+    lines = [[]]
+    for ply in range(min(split_depth, depth - 1)):
+        deeper = []
+        for line in lines:
+            for text in line:
+                pos.make_move(parse_move(pos, text))
+            for move in movegen(pos):
+                deeper.append(line + [move_text(move)])
+            for text in line:
+                pos.unmake_move()
+        lines = deeper
+    if lines == [[]]:
+        # Depth 1 has nothing to split
+        return [(move_text(move), 1) for move in movegen(pos)]
+    remaining = depth - len(lines[0])
+    counts = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        tasks = [(fen, line, remaining, generator) for line in lines]
+        for root, count in pool.map(_perft_task, tasks, chunksize=max(1, len(tasks) // (workers * 4))):
+            counts[root] = counts.get(root, 0) + count
+    return sorted(counts.items())
+
+#Each worker gets the FEN plus the moves down to its subtree rather than a pickled position, so tasks stay small and workers never share state
+
+PIECE_VALUES = [100, 300, 300, 500, 900, 0]
+PIECE_NAMES = ['Pawn', 'Knight', 'Bishop', 'Rook', 'Queen', 'King']
+MATE_SCORE = 100000
+MATE_BOUND = MATE_SCORE - 1000
+
+#Piece values in centipawns, the same one/three/three/five/nine points taught in learn_pieces(). Scores beyond MATE_BOUND mean a forced mate, MATE_SCORE minus the number of plies to it
+
+PIECE_SQUARE_VIEW = [
+    [0, 0, 0, 0, 0, 0, 0, 0,
+     50, 50, 50, 50, 50, 50, 50, 50,
+     10, 10, 20, 30, 30, 20, 10, 10,
+     5, 5, 10, 25, 25, 10, 5, 5,
+     0, 0, 0, 20, 20, 0, 0, 0,
+     5, -5, -10, 0, 0, -10, -5, 5,
+     5, 10, 10, -20, -20, 10, 10, 5,
+     0, 0, 0, 0, 0, 0, 0, 0],
+    [-50, -40, -30, -30, -30, -30, -40, -50,
+     -40, -20, 0, 0, 0, 0, -20, -40,
+     -30, 0, 10, 15, 15, 10, 0, -30,
+     -30, 5, 15, 20, 20, 15, 5, -30,
+     -30, 0, 15, 20, 20, 15, 0, -30,
+     -30, 5, 10, 15, 15, 10, 5, -30,
+     -40, -20, 0, 5, 5, 0, -20, -40,
+     -50, -40, -30, -30, -30, -30, -40, -50],
+    [-20, -10, -10, -10, -10, -10, -10, -20,
+     -10, 0, 0, 0, 0, 0, 0, -10,
+     -10, 0, 5, 10, 10, 5, 0, -10,
+     -10, 5, 5, 10, 10, 5, 5, -10,
+     -10, 0, 10, 10, 10, 10, 0, -10,
+     -10, 10, 10, 10, 10, 10, 10, -10,
+     -10, 5, 0, 0, 0, 0, 5, -10,
+     -20, -10, -10, -10, -10, -10, -10, -20],
+    [0, 0, 0, 0, 0, 0, 0, 0,
+     5, 10, 10, 10, 10, 10, 10, 5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     0, 0, 0, 5, 5, 0, 0, 0],
+    [-20, -10, -10, -5, -5, -10, -10, -20,
+     -10, 0, 0, 0, 0, 0, 0, -10,
+     -10, 0, 5, 5, 5, 5, 0, -10,
+     -5, 0, 5, 5, 5, 5, 0, -5,
+     0, 0, 5, 5, 5, 5, 0, -5,
+     -10, 5, 5, 5, 5, 5, 0, -10,
+     -10, 0, 5, 0, 0, 0, 0, -10,
+     -20, -10, -10, -5, -5, -10, -10, -20],
+    [-30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -20, -30, -30, -40, -40, -30, -30, -20,
+     -10, -20, -20, -20, -20, -20, -20, -10,
+     20, 20, 0, 0, 0, 0, 20, 20,
+     20, 30, 10, 0, 0, 10, 30, 20],
+]
+
+#Piece-square bonuses for pawn, knight, bishop, rook, queen and king, laid out as White sees the board (rank 8 at the top): pawns are pushed to the centre and forwards, minor pieces kept off the rim, the king tucked away behind its pawns
+
+def _positional_table():
+    # One row of 64 placement bonuses per piece number (plus an all-zero row for EMPTY), positive for White and negative for Black
+    table = []
+    for index in range(12):
+        colour, piece_type = divmod(index, 6)
+        view = PIECE_SQUARE_VIEW[piece_type]
+        row = []
+        for sq in range(64):
+            # Row 0 of the view is rank 8 for White; Black reads the board mirrored top to bottom
+            bonus = view[(7 - sq // 8) * 8 + sq % 8] if colour == WHITE else view[sq]
+            row.append(bonus if colour == WHITE else -bonus)
+        table.append(row)
+    table.append([0] * 64)
+    return table
+
+MATERIAL_TABLE = [PIECE_VALUES[index % 6] if index < 6 else -PIECE_VALUES[index % 6] for index in range(12)] + [0]
+POSITIONAL_TABLE = _positional_table()
+EVAL_TABLE = [[MATERIAL_TABLE[index] + bonus for bonus in POSITIONAL_TABLE[index]] for index in range(13)]
+EVAL_DEBUG = False
+if np is not None:
+    EVAL_ARRAY = np.array(EVAL_TABLE, dtype=np.int32)
+    SQUARE_RANGE = np.arange(64)
+
+def verify_eval(pos):
+    # Check the material and positional sums and the hash keys kept by make_move()/unmake_move() against a full recount
+    material = sum(MATERIAL_TABLE[index] for index in pos.squares)
+    positional = sum(POSITIONAL_TABLE[index][sq] for sq, index in enumerate(pos.squares))
+    if (pos.material, pos.positional) != (material, positional):
+        raise AssertionError(f'incremental evaluation {pos.material}/{pos.positional} but recount gives {material}/{positional} in {pos.fen()}')
+    if pos.key != zobrist_key(pos):
+        raise AssertionError(f'incremental key {pos.key:016x} but recount gives {zobrist_key(pos):016x} in {pos.fen()}')
+    if pos.pawn_key != zobrist_pawn_key(pos):
+        raise AssertionError(f'incremental pawn key {pos.pawn_key:016x} but recount gives {zobrist_pawn_key(pos):016x} in {pos.fen()}')
+
+def _passed_masks():
+    # For each colour and square, the squares ahead on the same and neighbouring files that an enemy pawn would have to be on to stop a pawn there
+    masks = [[0] * 64, [0] * 64]
+    for sq in range(64):
+        file, rank = sq % 8, sq // 8
+        for other in range(64):
+            if abs(other % 8 - file) <= 1:
+                if other // 8 > rank:
+                    masks[WHITE][sq] |= 1 << other
+                elif other // 8 < rank:
+                    masks[BLACK][sq] |= 1 << other
+    return masks
+
+FILE_MASKS = [FILE_A << file for file in range(8)]
+ADJACENT_FILES = [(FILE_MASKS[file - 1] if file > 0 else 0) | (FILE_MASKS[file + 1] if file < 7 else 0) for file in range(8)]
+PASSED_MASKS = _passed_masks()
+DOUBLED_PAWN = -10
+ISOLATED_PAWN = -15
+PASSED_PAWN = [0, 5, 10, 20, 35, 60, 100, 0]
+
+#Pawn structure terms, per pawn: extra pawns on a file and pawns with no friendly pawn on either neighbouring file (a to h, as in filecondict) are weaknesses, and passed pawns earn more the further up the board they are
+
+def pawn_structure(pos):
+    # Score the pawn structure from White's point of view; returns (score, white passed pawns, black passed pawns) with the passed pawns as bitboards
+    white = pos.pieces[PAWN]
+    black = pos.pieces[6 + PAWN]
+    score = 0
+    passed = [0, 0]
+    for colour, own, enemy, sign in ((WHITE, white, black, 1), (BLACK, black, white, -1)):
+        for file in range(8):
+            count = popcount(own & FILE_MASKS[file])
+            if count:
+                score += sign * DOUBLED_PAWN * (count - 1)
+                if not own & ADJACENT_FILES[file]:
+                    score += sign * ISOLATED_PAWN * count
+        pawns = own
+        while pawns:
+            low = pawns & -pawns
+            sq = low.bit_length() - 1
+            pawns ^= low
+            if not PASSED_MASKS[colour][sq] & enemy:
+                passed[colour] |= low
+                score += sign * PASSED_PAWN[sq // 8 if colour == WHITE else 7 - sq // 8]
+    return score, passed[WHITE], passed[BLACK]
+
+class PawnHashTable:
+    # Bounded cache of pawn_structure() results keyed by the pawn-only Zobrist key; each key has one slot and a newer structure simply evicts the older one
+
+    def __init__(self, entries=16384):
+        size = 1
+        while size * 2 <= entries:
+            size *= 2
+        self.mask = size - 1
+        self.keys = [None] * size
+        self.values = [None] * size
+        self.probes = 0
+        self.hits = 0
+
+    def lookup(self, pos):
+        # Pawn structure of pos as (score, white passed, black passed), from the table when this pawn placement has been seen before
+        self.probes += 1
+        key = pos.pawn_key
+        slot = key & self.mask
+        if self.keys[slot] == key:
+            self.hits += 1
+            return self.values[slot]
+        value = pawn_structure(pos)
+        self.keys[slot] = key
+        self.values[slot] = value
+        return value
+
+    def hit_rate(self):
+        # Fraction of lookups answered from the table
+        return self.hits / max(self.probes, 1)
+
+    def stats(self):
+        # One line summary for tuning the table size
+        used = sum(1 for key in self.keys if key is not None)
+        return f'pawn hash {self.mask + 1:,} entries: {self.probes:,} lookups, {self.hit_rate():.1%} hits, {used / (self.mask + 1):.1%} full'
+
+def evaluate(pos, pawns=None):
+    # Static evaluation in centipawns from the point of view of the side to move: the material and positional sums the position keeps up to date plus the pawn structure, cached in pawns if a PawnHashTable is given
+    if EVAL_DEBUG:
+        verify_eval(pos)
+    score = pos.material + pos.positional + (pawns.lookup(pos) if pawns else pawn_structure(pos))[0]
+    return score if pos.side == WHITE else -score
+
+def encode_positions(positions):
+    # Pack positions into the arrays evaluate_batch() takes: an (n, 64) array of piece numbers and an array of sides to move
+    if np is None:
+        raise ImportError("Batch evaluation needs NumPy (pip install numpy)")
+    squares = np.frombuffer(b''.join(bytes(pos.squares) for pos in positions), dtype=np.uint8).reshape(-1, 64)
+    sides = np.fromiter((pos.side for pos in positions), dtype=np.uint8, count=len(positions))
+    return squares, sides
+
+def pawn_structure_batch(squares):
+    # pawn_structure() scores for a whole (n, 64) batch from White's point of view, worked out file by file with array operations
+    board = np.asarray(squares).reshape(-1, 8, 8)
+    ranks = np.arange(8).reshape(1, 8, 1)
+    score = np.zeros(board.shape[0], dtype=np.int64)
+    fronts = []
+    for index, sign in ((PAWN, 1), (6 + PAWN, -1)):
+        own = board == index
+        counts = own.sum(axis=1)
+        padded = np.pad(counts, ((0, 0), (1, 1)))
+        isolated = (padded[:, :-2] == 0) & (padded[:, 2:] == 0)
+        score += sign * (DOUBLED_PAWN * np.maximum(counts - 1, 0) + ISOLATED_PAWN * counts * isolated).sum(axis=1)
+        fronts.append(own)
+    white, black = fronts
+    # A pawn is passed when no enemy pawn on its own or a neighbouring file stands further up the board (for White) or further down (for Black)
+    highest = np.pad(np.where(black, ranks, -1).max(axis=1), ((0, 0), (1, 1)), constant_values=-1)
+    highest = np.maximum(np.maximum(highest[:, :-2], highest[:, 1:-1]), highest[:, 2:])
+    lowest = np.pad(np.where(white, ranks, 8).min(axis=1), ((0, 0), (1, 1)), constant_values=8)
+    lowest = np.minimum(np.minimum(lowest[:, :-2], lowest[:, 1:-1]), lowest[:, 2:])
+    bonus = np.array(PASSED_PAWN)
+    score += ((white & (ranks >= highest[:, None, :])) * bonus.reshape(1, 8, 1)).sum(axis=(1, 2))
+    score -= ((black & (ranks <= lowest[:, None, :])) * bonus[::-1].reshape(1, 8, 1)).sum(axis=(1, 2))
+    return score
+
+def evaluate_batch(squares, sides=None):
+    # Score a whole batch with NumPy: one gather and sum for material and piece squares plus the pawn structure, the same numbers as evaluate() (from White's point of view, or the side to move's when sides is given)
+    if np is None:
+        raise ImportError("Batch evaluation needs NumPy (pip install numpy)")
+    squares = np.asarray(squares, dtype=np.intp)
+    scores = EVAL_ARRAY[squares, SQUARE_RANGE].sum(axis=1) + pawn_structure_batch(squares)
+    if sides is not None:
+        scores = np.where(np.asarray(sides) == BLACK, -scores, scores)
+    return scores
+
+#NumPy is optional: the game and the search only use the plain Python path, and only the batch functions need it installed. Positions carry their material and positional sums, updated move by move, so evaluate() costs the same however full the board is; set EVAL_DEBUG (search --verify-eval) to recount them at every call
+
+NNUE_LAYERS = ('ft_weight', 'ft_bias', 'l1_weight', 'l1_bias', 'l2_weight', 'l2_bias', 'out_weight', 'out_bias')
+
+def move_features(pos, move):
+    # Network inputs (piece number, square) a move switches on and off, worked out before it is played on pos
+    squares = pos.squares
+    side = pos.side
+    frm = move & 63
+    to = move >> 6 & 63
+    flag = move >> 12
+    moved = squares[frm]
+    placed = side * 6 + flag - 3 if flag >= FLAG_PROMOTION else moved
+    added = [(placed, to)]
+    removed = [(moved, frm)]
+    if squares[to] != EMPTY:
+        removed.append((squares[to], to))
+    if flag == FLAG_ENPASSANT:
+        removed.append(((side ^ 1) * 6 + PAWN, to - 8 if side == WHITE else to + 8))
+    elif flag == FLAG_CASTLE:
+        rook_from, rook_to = (frm + 3, frm + 1) if to > frm else (frm - 4, frm - 1)
+        added.append((side * 6 + ROOK, rook_to))
+        removed.append((side * 6 + ROOK, rook_from))
+    return added, removed
+
+class NNUEEvaluator:
+    # Small efficiently updatable neural network: 768 piece-square inputs seen from each side feed a shared hidden layer, whose sums (the accumulator) are adjusted per move instead of recomputed, then two small dense layers give the score
+
+    def __init__(self, weights):
+        if np is None:
+            raise ImportError("The neural network evaluation needs NumPy (pip install numpy)")
+        for name in NNUE_LAYERS:
+            setattr(self, name, np.asarray(weights[name], dtype=np.float32))
+        self.stack = []
+        self.path = None
+
+    @classmethod
+    def load(cls, path):
+        # Read weights saved by save() (a NumPy .npz file holding the arrays named in NNUE_LAYERS)
+        with np.load(path) as data:
+            nnue = cls({name: data[name] for name in NNUE_LAYERS})
+        # Kept so parallel search helpers can load the same network in their own processes
+        nnue.path = path
+        return nnue
+
+    @classmethod
+    def random(cls, hidden=128, seed=1):
+        # Untrained network with small random weights, for benchmarks and as a starting point for training
+        if np is None:
+            raise ImportError("The neural network evaluation needs NumPy (pip install numpy)")
+        rng = np.random.default_rng(seed)
+        shapes = {'ft_weight': (768, hidden), 'ft_bias': (hidden,), 'l1_weight': (2 * hidden, 32), 'l1_bias': (32,),
+                  'l2_weight': (32, 32), 'l2_bias': (32,), 'out_weight': (32, 1), 'out_bias': (1,)}
+        return cls({name: rng.normal(0, 0.1, shape) for name, shape in shapes.items()})
+
+    def save(self, path):
+        # Write the weights to a .npz file load() can read
+        np.savez(path, **{name: getattr(self, name) for name in NNUE_LAYERS})
+
+    def features(self, pos):
+        # Input numbers of every piece from White's and from Black's point of view; Black sees the board flipped with the colours swapped
+        white = []
+        black = []
+        for sq, index in enumerate(pos.squares):
+            if index != EMPTY:
+                white.append(index * 64 + sq)
+                black.append((index + 6) % 12 * 64 + (sq ^ 56))
+        return white, black
+
+    def full(self, pos):
+        # Both accumulators summed from scratch
+        white, black = self.features(pos)
+        return self.ft_bias + self.ft_weight[white].sum(axis=0), self.ft_bias + self.ft_weight[black].sum(axis=0)
+
+    def refresh(self, pos):
+        # Start the accumulator stack over from pos
+        self.stack = [self.full(pos)]
+
+    def push(self, pos, move):
+        # Update the accumulators for a move about to be played on pos; pop() undoes it after unmake_move()
+        added, removed = move_features(pos, move)
+        weight = self.ft_weight
+        white, black = self.stack[-1]
+        white = white.copy()
+        black = black.copy()
+        for index, sq in added:
+            white += weight[index * 64 + sq]
+            black += weight[(index + 6) % 12 * 64 + (sq ^ 56)]
+        for index, sq in removed:
+            white -= weight[index * 64 + sq]
+            black -= weight[(index + 6) % 12 * 64 + (sq ^ 56)]
+        self.stack.append((white, black))
+
+    def pop(self):
+        # Go back to the accumulators before the last push()
+        self.stack.pop()
+
+    def output(self, white, black, side):
+        # Run the dense layers on a pair of accumulators; centipawns for the side to move
+        hidden = np.concatenate((white, black) if side == WHITE else (black, white))
+        hidden = np.clip(hidden, 0.0, 1.0)
+        hidden = np.clip(hidden @ self.l1_weight + self.l1_bias, 0.0, 1.0)
+        hidden = np.clip(hidden @ self.l2_weight + self.l2_bias, 0.0, 1.0)
+        return int((hidden @ self.out_weight + self.out_bias)[0] * 100)
+
+    def evaluate(self, pos):
+        # Score pos from the accumulators on top of the stack, which must match it
+        white, black = self.stack[-1]
+        return self.output(white, black, pos.side)
+
+#Clipped ReLU between layers as in the usual NNUE design, but in float32 NumPy rather than quantised integers, so it runs on any CPU. No trained weights ship with the game: the computer only uses a network when given a weights file
+
+BOUND_EXACT = 1
+BOUND_LOWER = 2
+BOUND_UPPER = 3
+SCORE_OFFSET = 1 << 31
+
+class TranspositionTable:
+    # Fixed-size table of search results keyed by Zobrist key: buckets of two entries, one kept for the deepest result and one always replaced
+
+    def __init__(self, size_mb=16, shared=False, name=None):
+        # Each bucket is four 64-bit words (two entries of key^data, data); the bucket count is the largest power of two that fits.
+        # shared=True puts the table in shared memory for the parallel search, and name attaches to one another process created
+        buckets = 1
+        while buckets * 64 <= size_mb * 1024 * 1024:
+            buckets *= 2
+        self.mask = buckets - 1
+        self.size_mb = size_mb
+        self.shm = None
+        self.owner = False
+        total = buckets * 32 + 8
+        if shared or name:
+            self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=total)
+            self.owner = name is None
+            self.name = self.shm.name
+            self.buffer = self.shm.buf
+        else:
+            self.name = None
+            self.buffer = bytearray(total)
+        self.bytes = memoryview(self.buffer)[:total]
+        self.words = self.bytes.cast('Q')
+        self.slots = self.words[:-1]
+        # The last word is a stop flag the parallel search uses to call its helpers off
+        self.stop = self.words[-1:]
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def size_bytes(self):
+        # Memory actually used by the entries
+        return (self.mask + 1) * 32
+
+    def new_search(self):
+        # Start a new search: entries from earlier searches may now be overwritten regardless of depth
+        self.age = (self.age + 1) & 63
+
+    def clear(self):
+        # Forget every entry and reset the counters
+        self.bytes[:] = bytes(len(self.bytes))
+        self.probes = self.hits = self.stores = 0
+
+    def close(self):
+        # Let go of a shared table; the process that created it also removes it
+        if self.shm:
+            for view in (self.stop, self.slots, self.words, self.bytes):
+                view.release()
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+            self.shm = None
+
+    def probe(self, key):
+        # Look the key up; returns (depth, bound, score, move) or None
+        self.probes += 1
+        slots = self.slots
+        index = (key & self.mask) * 4
+        for slot in (index, index + 2):
+            data = slots[slot + 1]
+            if data and slots[slot] ^ data == key:
+                # The key is stored XORed with the data so an entry torn by a concurrent writer fails this check instead of returning garbage
+                self.hits += 1
+                return data >> 16 & 255, data >> 24 & 3, (data >> 32) - SCORE_OFFSET, data & 0xFFFF
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        # Save a result: the first entry keeps the deepest result of the current search, everything else goes in the second
+        slots = self.slots
+        index = (key & self.mask) * 4
+        data = (move or 0) | min(depth, 255) << 16 | bound << 24 | self.age << 26 | (score + SCORE_OFFSET) << 32
+        old = slots[index + 1]
+        if not old or slots[index] ^ old == key or depth >= old >> 16 & 255 or old >> 26 & 63 != self.age:
+            slot = index
+        else:
+            slot = index + 2
+        slots[slot] = key ^ data
+        slots[slot + 1] = data
+        self.stores += 1
+
+    def hit_rate(self):
+        # Fraction of probes that found an entry
+        return self.hits / max(self.probes, 1)
+
+    def fill(self):
+        # Fraction of entries in use, sampled from the first thousand buckets
+        sample = min(self.mask + 1, 1000) * 4
+        return sum(1 for slot in range(1, sample, 2) if self.slots[slot]) / (sample // 2)
+
+    def stats(self):
+        # One line summary for tuning the table size against speed
+        return f'hash {self.size_bytes() // 1024:,} KB: {self.probes:,} probes, {self.hit_rate():.1%} hits, {self.stores:,} stores, {self.fill():.1%} full'
+
+#Entry data packs the move (bits 0-15), depth (16-23), bound (24-25), search age (26-31) and score (32-63). Mate scores are stored relative to the node, not the root, so they stay right when the same position turns up at a different ply
+
+class SearchTimeout(Exception):
+    # Raised inside the tree when the time or node budget runs out; run() catches it and keeps the last finished iteration
+    pass
+
+class Search:
+    # Iterative deepening negamax alpha-beta with quiescence, MVV-LVA captures, killer and history move ordering, and a time and/or node budget
+
+    def __init__(self, max_time=None, max_nodes=None, max_depth=64, report=None, table=None, stop=None, start_depth=1, nnue=None, pawns=None):
+        self.max_time = max_time
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.report = report
+        self.table = table
+        self.stop = stop
+        self.start_depth = start_depth
+        self.nnue = nnue
+        self.pawns = pawns if pawns is not None else PawnHashTable()
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.best = None
+        self.elapsed = 0.0
+        self.killers = [[0, 0] for ply in range(128)]
+        self.history = [[0] * 64 for index in range(12)]
+
+    def nps(self):
+        # Nodes per second over the last run
+        return int(self.nodes / max(self.elapsed, 1e-9))
+
+    def run(self, pos):
+        # Search deeper and deeper until the budget runs out; returns the best move of the deepest finished iteration, or None with no legal moves
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.started = time.perf_counter()
+        self.deadline = self.started + self.max_time if self.max_time else None
+        moves = generate_legal_moves(pos)
+        self.best = moves[0] if moves else None
+        base = len(pos.undo)
+        if self.nnue:
+            self.nnue.refresh(pos)
+        for depth in range(self.start_depth, self.max_depth + 1 if moves else 1):
+            try:
+                score, best = self._root(pos, depth, moves)
+            except SearchTimeout:
+                # Take back whatever the interrupted iteration still had on the board
+                while len(pos.undo) > base:
+                    pos.unmake_move()
+                break
+            self.depth = depth
+            self.score = score
+            self.best = best
+            self.elapsed = time.perf_counter() - self.started
+            # The best move so far is searched first next time, which makes the deeper search much cheaper
+            moves.remove(best)
+            moves.insert(0, best)
+            if self.report:
+                self.report(self)
+            if abs(score) > MATE_BOUND or len(moves) == 1:
+                break
+            if self.deadline and time.perf_counter() > self.started + self.max_time / 2:
+                # The next iteration costs several times this one, so it would not finish anyway
+                break
+        self.elapsed = time.perf_counter() - self.started
+        return self.best
+
+    def _root(self, pos, depth, moves):
+        # Score every root move with a full window below it and return the best
+        alpha = -MATE_SCORE - 1
+        best = moves[0]
+        for move in moves:
+            self._make(pos, move)
+            score = -self._negamax(pos, depth - 1, -MATE_SCORE - 1, -alpha, 1)
+            self._unmake(pos)
+            if score > alpha:
+                alpha = score
+                best = move
+        return alpha, best
+
+    def _make(self, pos, move):
+        # Play a move in the tree, keeping the network's accumulator in step when there is one
+        if self.nnue:
+            self.nnue.push(pos, move)
+        pos.make_move(move)
+
+    def _unmake(self, pos):
+        # Take back a move played with _make()
+        pos.unmake_move()
+        if self.nnue:
+            self.nnue.pop()
+
+    def _tick(self):
+        # Count a node and, every so often, check the budget
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            if self.deadline and time.perf_counter() > self.deadline:
+                raise SearchTimeout
+            if self.max_nodes and self.nodes >= self.max_nodes:
+                raise SearchTimeout
+            if self.stop is not None and self.stop[0]:
+                raise SearchTimeout
+
+    def _negamax(self, pos, depth, alpha, beta, ply):
+        # Alpha-beta score of the position for the side to move
+        self._tick()
+        if pos.halfmove >= 100 or pos.repetitions():
+            return 0
+        if ply and popcount(pos.colours[WHITE] | pos.colours[BLACK]) <= 3:
+            found = probe_tablebase(pos)
+            if found:
+                # Exact result from the tables, scored like a mate found by search
+                result, plies = found
+                if result == 'draw':
+                    return 0
+                return MATE_SCORE - ply - plies if result == 'win' else -MATE_SCORE + ply + plies
+        checked = in_check(pos)
+        if checked:
+            # Look one ply further when in check so short forcing lines are not cut off at the horizon
+            depth += 1
+        if depth <= 0 or ply >= 120:
+            return self._quiesce(pos, alpha, beta, ply)
+        table = self.table
+        hash_move = 0
+        if table:
+            entry = table.probe(pos.key)
+            if entry:
+                entry_depth, bound, score, hash_move = entry
+                if score > MATE_BOUND:
+                    score -= ply
+                elif score < -MATE_BOUND:
+                    score += ply
+                if entry_depth >= depth and (bound == BOUND_EXACT or (bound == BOUND_LOWER and score >= beta) or (bound == BOUND_UPPER and score <= alpha)):
+                    return score
+        moves = generate_legal_moves(pos)
+        if not moves:
+            return -MATE_SCORE + ply if checked else 0
+        killers = self.killers[ply]
+        moves.sort(key=lambda move: self._order(pos, move, killers), reverse=True)
+        if hash_move in moves:
+            # The best move stored last time this position was searched goes first
+            moves.remove(hash_move)
+            moves.insert(0, hash_move)
+        start_alpha = alpha
+        best = -MATE_SCORE
+        best_move = 0
+        for move in moves:
+            self._make(pos, move)
+            score = -self._negamax(pos, depth - 1, -beta, -alpha, ply + 1)
+            self._unmake(pos)
+            if score > best:
+                best = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    if pos.squares[move >> 6 & 63] == EMPTY and move >> 12 < FLAG_ENPASSANT:
+                        # A quiet move that refutes: remember it for sibling positions and for this piece and square in general
+                        if move != killers[0]:
+                            killers[1] = killers[0]
+                            killers[0] = move
+                        self.history[pos.squares[move & 63]][move >> 6 & 63] += depth * depth
                     break
-            elif newfile < 9 and newranks < 9:
-                possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-
-        for i in range(7):
-            i += 1
-            # Diagonal sweep southeast
-            newfile = int(file) + i
-            newranks = int(rank) - i
-            if f'{newfile}{newranks}' in board:
-                collisioncol = board[f'{newfile}{newranks}']
-                if x[0] == collisioncol[0]:
-                    break
+        if table:
+            bound = BOUND_UPPER if best <= start_alpha else BOUND_LOWER if best >= beta else BOUND_EXACT
+            stored = best + ply if best > MATE_BOUND else best - ply if best < -MATE_BOUND else best
+            table.store(pos.key, depth, bound, stored, best_move)
+        return best
+
+    def _quiesce(self, pos, alpha, beta, ply):
+        # Resolve captures and queen promotions so the static evaluation is never taken in the middle of an exchange
+        self._tick()
+        stand = self.nnue.evaluate(pos) if self.nnue else evaluate(pos, self.pawns)
+        if stand >= beta:
+            return stand
+        if stand > alpha:
+            alpha = stand
+        side = pos.side
+        squares = pos.squares
+        noisy = [move for move in generate_pseudo_moves(pos)
+                 if squares[move >> 6 & 63] != EMPTY or move >> 12 == FLAG_ENPASSANT or move >> 12 == FLAG_PROMOTION + QUEEN - KNIGHT]
+        noisy.sort(key=lambda move: self._order(pos, move, ()), reverse=True)
+        king_index = side * 6 + KING
+        for move in noisy:
+            self._make(pos, move)
+            if is_square_attacked(pos, pos.pieces[king_index].bit_length() - 1, side ^ 1):
+                self._unmake(pos)
+                continue
+            score = -self._quiesce(pos, -beta, -alpha, ply + 1)
+            self._unmake(pos)
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _order(self, pos, move, killers):
+        # Sort key: captures by most valuable victim then least valuable attacker, promotions, killer moves, then the history counters
+        to = move >> 6 & 63
+        victim = pos.squares[to]
+        flag = move >> 12
+        if victim != EMPTY:
+            return 1000000 + PIECE_VALUES[victim % 6] * 10 - pos.squares[move & 63] % 6
+        if flag == FLAG_ENPASSANT:
+            return 1000000 + PIECE_VALUES[PAWN] * 10
+        if flag >= FLAG_PROMOTION:
+            return 900000 + flag
+        if move in killers:
+            return 800000
+        return min(self.history[pos.squares[move & 63]][to], 799999)
+
+#Each iteration starts from the previous best move; killers are quiet moves that caused a cutoff at the same ply, history counts cutoffs by piece and destination across the whole search
+
+def _smp_helper(task):
+    # Helper process of the parallel search: attach to the shared table and search the same position until the main search raises the stop flag
+    pos, name, size_mb, age, max_time, max_depth, start_depth, nnue_path = task
+    table = TranspositionTable(size_mb, name=name)
+    table.age = age
+    # Every process has to score with the same evaluator, or the table would mix two kinds of score
+    nnue = NNUEEvaluator.load(nnue_path) if nnue_path else None
+    search = Search(max_time=max_time, max_depth=max_depth, table=table, stop=table.stop, start_depth=start_depth, nnue=nnue)
+    try:
+        search.run(pos)
+    finally:
+        search.table = search.stop = None
+        table.close()
+    return search.nodes, search.depth
+
+def parallel_search(pos, workers, table, max_time=None, max_nodes=None, max_depth=64, report=None, nnue=None):
+    # Lazy SMP: helper processes search the same position and share what they find through the table, which speeds up the main search; returns the main Search and the node count over every process
+    if workers > 1 and nnue is not None and nnue.path is None:
+        raise ValueError('a parallel search with a network needs one loaded from a weights file, so the helpers can load it too')
+    if table:
+        table.new_search()
+        table.stop[0] = 0
+    search = Search(max_time=max_time, max_nodes=max_nodes, max_depth=max_depth, report=report, table=table, nnue=nnue)
+    if workers <= 1:
+        search.run(pos)
+        return search, search.nodes
+    # Half the helpers start one ply deeper so the processes spread out over different depths instead of all searching the same tree in step
+    tasks = [(pos.copy(), table.name, table.size_mb, table.age, max_time, max_depth, 1 + helper % 2, nnue.path if nnue else None) for helper in range(1, workers)]
+    with ProcessPoolExecutor(max_workers=workers - 1) as pool:
+        futures = [pool.submit(_smp_helper, task) for task in tasks]
+        try:
+            search.run(pos)
+        finally:
+            table.stop[0] = 1
+        helpers = [future.result() for future in futures]
+    return search, search.nodes + sum(nodes for nodes, depth in helpers)
+
+#The helpers' own best moves are thrown away: their only job is filling the shared table with results the main search can cut off on. Entries are written without locks, which is what the key^data check in probe() is for
+
+PROOF_INFINITY = 1 << 30
+
+class ProofNode:
+    # One position in a proof-number tree: proof and disproof numbers count the positions still to settle to prove or refute the mate below it
+    __slots__ = ('move', 'parent', 'depth', 'children', 'proof', 'disproof')
+
+    def __init__(self, move, parent, depth):
+        self.move = move
+        self.parent = parent
+        self.depth = depth
+        self.children = None
+        self.proof = 1
+        self.disproof = 1
+
+class MateSolver:
+    # Proof-number search for a forced mate by the side to move: it grows the tree only where the mate is cheapest to prove or refute, instead of searching every move to full depth
+
+    def __init__(self, max_nodes=None, max_time=None):
+        self.max_nodes = max_nodes
+        self.max_time = max_time
+        self.nodes = 0
+        self.elapsed = 0.0
+        self.mate_in = None
+        self.line = []
+
+    def solve(self, pos, moves):
+        # True when the side to move mates within moves moves, False when it cannot, None when the budget ran out first; a found mate is the shortest, in mate_in and line
+        self.nodes = 0
+        self.mate_in = None
+        self.line = []
+        self.started = time.perf_counter()
+        result = False
+        for limit in range(1, moves + 1):
+            # A mate in fewer moves costs far less to find, so shorter limits go first and the first proof is also the shortest mate
+            result, root = self._prove(pos, 2 * limit - 1)
+            if result:
+                self.mate_in = limit
+                self.line = self._line(root)
+            if result is not False:
+                break
+        self.elapsed = time.perf_counter() - self.started
+        return result
+
+    def _prove(self, pos, plies):
+        # Prove or disprove mate within plies plies; returns the result and the tree
+        root = ProofNode(0, None, 0)
+        self._expand(pos, root, plies)
+        self._update(root)
+        node = root
+        while root.proof and root.disproof:
+            if (self.max_nodes and self.nodes >= self.max_nodes) or (self.max_time and time.perf_counter() - self.started >= self.max_time):
+                while node is not root:
+                    pos.unmake_move()
+                    node = node.parent
+                return None, root
+            # Walk down to the most proving position: the child that decides the proof number where the attacker moves, the disproof number where the defender does
+            while node.children is not None:
+                if node.depth % 2 == 0:
+                    node = next(child for child in node.children if child.proof == node.proof)
                 else:
-                    possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-                    break
-            elif newfile < 9 and newranks > 0:
-                possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-
-        for i in range(7):
-            i += 1
-            # Diagonal sweep northwest
-            newfile = int(file) - i
-            newranks = int(rank) + i
-            if f'{newfile}{newranks}' in board:
-                collisioncol = board[f'{newfile}{newranks}']
-                if x[0] == collisioncol[0]:
+                    node = next(child for child in node.children if child.disproof == node.disproof)
+                pos.make_move(node.move)
+            self._expand(pos, node, plies)
+            # Back the new numbers up only as far as they change, and carry on from there
+            while True:
+                proof, disproof = node.proof, node.disproof
+                self._update(node)
+                if (node.proof, node.disproof) == (proof, disproof) or node is root:
                     break
+                pos.unmake_move()
+                node = node.parent
+        while node is not root:
+            pos.unmake_move()
+            node = node.parent
+        return root.proof == 0, root
+
+    def _expand(self, pos, node, plies):
+        # Create the children of node, scoring each one at once: mates, stalemates and the move limit settle it, otherwise its move count is a first guess at how hard it is
+        children = []
+        attacker = node.depth % 2 == 1
+        for move in generate_legal_moves(pos):
+            pos.make_move(move)
+            child = ProofNode(move, node, node.depth + 1)
+            replies = len(generate_legal_moves(pos))
+            if attacker:
+                if not replies:
+                    child.proof, child.disproof = PROOF_INFINITY, 0
                 else:
-                    possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-                    break
-            elif newfile > 0 and newranks < 9:
-                possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-
-        for i in range(7):
-            i += 1
-            # Diagonal sweep southwest
-            newfile = int(file) - i
-            newranks = int(rank) - i
-            if f'{newfile}{newranks}' in board:
-                collisioncol = board[f'{newfile}{newranks}']
-                if x[0] == collisioncol[0]:
-                    break
+                    child.proof, child.disproof = 1, replies
+            elif not replies:
+                child.proof, child.disproof = (0, PROOF_INFINITY) if in_check(pos) else (PROOF_INFINITY, 0)
+            elif child.depth >= plies:
+                child.proof, child.disproof = PROOF_INFINITY, 0
+            else:
+                child.proof, child.disproof = replies, 1
+            pos.unmake_move()
+            children.append(child)
+            self.nodes += 1
+        node.children = children
+
+    def _update(self, node):
+        # Recompute node's numbers from its children: the attacker needs one proved move, the defender needs every move proved
+        children = node.children
+        if not children:
+            # Only the root is ever expanded without moves: no mate to find
+            node.proof, node.disproof = PROOF_INFINITY, 0
+            return
+        if node.depth % 2 == 0:
+            node.proof = min(child.proof for child in children)
+            node.disproof = min(sum(child.disproof for child in children), PROOF_INFINITY)
+        else:
+            node.proof = min(sum(child.proof for child in children), PROOF_INFINITY)
+            node.disproof = min(child.disproof for child in children)
+        if node.disproof == 0:
+            # A refuted subtree is never visited again
+            node.children = []
+
+    def _line(self, root):
+        # The mating line through the proved tree: the quickest mate for the attacker against the longest defence
+        lengths = {}
+
+        def length(node):
+            if node not in lengths:
+                if not node.children:
+                    lengths[node] = 0
+                elif node.depth % 2 == 0:
+                    lengths[node] = 1 + min(length(child) for child in node.children if child.proof == 0)
                 else:
-                    possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
+                    lengths[node] = 1 + max(length(child) for child in node.children)
+            return lengths[node]
+
+        line = []
+        node = root
+        while node.children:
+            if node.depth % 2 == 0:
+                node = min((child for child in node.children if child.proof == 0), key=length)
+            else:
+                node = max(node.children, key=length)
+            line.append(node.move)
+        return line
+
+#Proof numbers need no evaluation at all, only legal move generation, and a refuted line is dropped as soon as one defence holds
+
+COMPUTER_NAME = 'OFFbot'
+COMPUTER_MOVE_TIME = 2.0
+COMPUTER_MOVE_NODES = None
+COMPUTER_HASH_MB = 16
+COMPUTER_WORKERS = 1
+COMPUTER_NNUE = None
+computer_side = None
+computer_time = COMPUTER_MOVE_TIME
+computer_table = None
+computer_nnue = None
+
+#The computer plays under its own account so its games are rated and logged like anyone else's. computer_side is None in a two player game; the thinking budget per move is COMPUTER_MOVE_TIME seconds and, if set, COMPUTER_MOVE_NODES nodes, with a COMPUTER_HASH_MB transposition table kept for the whole game. COMPUTER_WORKERS above one searches in that many processes, and COMPUTER_NNUE names a network weights file to evaluate with instead of the piece-square tables
+
+class Ponderer:
+    # Background thread that thinks while a player is typing: it works out the legal moves and check status of the position and of every position one move on, then, against the computer, searches the computer's reply to each of those moves
+
+    def __init__(self):
+        self.facts = {}
+        self.replies = {}
+        self.thread = None
+        self.key = None
+        self.halt = [0]
+
+    def start(self, pos, reply_time=None, table=None, nnue=None, hint_from=None):
+        # Begin pondering pos, unless that is already under way; reply_time (seconds per reply) turns on the reply searches, and hint_from carries a hint on from that depth
+        if self.thread and self.thread.is_alive() and self.key == pos.key and hint_from is None:
+            return
+        self.stop()
+        if len(self.facts) > 100000:
+            # Keep the cache bounded over a long session
+            self.facts = {}
+        self.key = pos.key
+        self.halt = [0]
+        self.thread = threading.Thread(target=self._run, args=(pos.copy(), reply_time, table, nnue, hint_from, self.halt), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # Call the thread off and wait for it, so the board, table and network are the main program's again
+        if self.thread:
+            self.halt[0] = 1
+            self.thread.join()
+            self.thread = None
+
+    def facts_for(self, pos):
+        # (legal moves, in check) for pos, straight from the cache when the thread got there first
+        facts = self.facts.get(pos.key)
+        if facts is None:
+            facts = (generate_legal_moves(pos), in_check(pos))
+            self.facts[pos.key] = facts
+        return facts
+
+    def has_move(self, pos):
+        # Whether the side to move has any legal move: the cached list when the thread got there first, otherwise stop at the first one found
+        facts = self.facts.get(pos.key)
+        if facts is None:
+            return has_legal_move(pos)
+        return bool(facts[0])
+
+    def reply_for(self, pos):
+        # The finished search for the computer's move in pos, if pondering got to it
+        return self.replies.get(pos.key)
+
+    def _run(self, pos, reply_time, table, nnue, hint_from, halt):
+        # Thread body: facts for the position and every move from it first (cheap), then any hint, then reply searches starting with the likeliest move
+        moves = self.facts_for(pos)[0]
+        for move in moves:
+            if halt[0]:
+                return
+            pos.make_move(move)
+            self.facts_for(pos)
+            pos.unmake_move()
+        if hint_from is not None and moves:
+            key = pos.key
+
+            def deeper(search):
+                # Each finished iteration replaces the cached hint and is shown to the player
+                if (search.depth, search.score, search.best) != hint_cache.get(key):
+                    hint_cache[key] = (search.depth, search.score, search.best)
+                    print(f"\nHint: {move_text(search.best)} ({score_text(search.score)}, depth {search.depth})")
+
+            Search(max_time=HINT_STREAM_TIME, table=hint_table, stop=halt, start_depth=hint_from, report=deeper).run(pos)
+            if halt[0]:
+                return
+        if reply_time is None:
+            return
+        self.replies = {}
+        entry = table.probe(pos.key) if table else None
+        if entry and entry[3] in moves:
+            # The computer's own search left its expected answer in the table, so that reply is searched first
+            moves = [entry[3]] + [move for move in moves if move != entry[3]]
+        for move in moves:
+            pos.make_move(move)
+            if self.facts_for(pos)[0]:
+                search = Search(max_time=reply_time, table=table, stop=halt, nnue=nnue)
+                search.run(pos)
+                if halt[0]:
+                    return
+                self.replies[pos.key] = search
+            pos.unmake_move()
+
+ponderer = Ponderer()
+
+#input() lets go of the interpreter lock while it waits, so the thread runs at full speed while a player types. Everything it finds is keyed by Zobrist key and only read by the main program, and the thread is stopped before a move is played or a search of the main program's own uses the table
+
+def score_text(score):
+    # A search score for people: pawns with a sign, or the number of moves to a forced mate
+    if abs(score) > MATE_BOUND:
+        return f'mate {(MATE_SCORE - abs(score) + 1) // 2 * (1 if score > 0 else -1)}'
+    return f'{score / 100:+.2f}'
+
+def search_report(search):
+    # Print one line per finished iteration: depth, score, nodes, speed and the move it would play
+    print(f'depth {search.depth}: {score_text(search.score)}, {search.nodes:,} nodes in {search.elapsed:.2f}s, {search.nps():,} nodes/s, best {move_text(search.best)}')
+
+HINT_TIME = 0.2
+HINT_STREAM_TIME = 10.0
+HINT_HASH_MB = 8
+hint_table = None
+hint_cache = {}
+
+#A hint gets HINT_TIME seconds before it is shown; the search then carries on in the background for up to HINT_STREAM_TIME seconds, printing each deeper answer. hint_cache keeps the deepest answer per position (by Zobrist key) so asking again is instant
+
+def hint():
+    # Suggest a move for the player to move: from the cache if this position was analysed already, otherwise from a search capped at HINT_TIME
+    global hint_table
+    ponderer.stop()
+    if hint_table is None:
+        hint_table = TranspositionTable(HINT_HASH_MB)
+    cached = hint_cache.get(board.key)
+    if cached:
+        depth, score, move = cached
+    else:
+        hint_table.new_search()
+        search = Search(max_time=HINT_TIME, table=hint_table)
+        move = search.run(board)
+        depth, score = search.depth, search.score
+        hint_cache[board.key] = (depth, score, move)
+    print(f"Hint: {move_text(move)} ({score_text(score)}, depth {depth})")
+    book = get_book()
+    if book:
+        for move, weight, wins, draws, losses in book.entries(board)[:3]:
+            print(f"Book: {move_text(move)}, played {weight} times ({wins} won, {draws} drawn, {losses} lost)")
+    # Keep thinking while the player decides, and say so whenever a deeper search changes its mind or its score
+    ponder(hint_from=depth + 1)
+
+def ponder(hint_from=None):
+    # Set the ponderer going on the current position with this game's settings
+    if computer_side is None:
+        ponderer.start(board, hint_from=hint_from)
+    else:
+        ponderer.start(board, computer_time, computer_table, computer_nnue, hint_from)
+
+class GameSession:
+    # One game behind plain method calls, with the same rules as the interactive game (legal moves, check, checkmate, stalemate, draws and resignations) but no prompts, pauses or files
+
+    def __init__(self, white='White', black='Black', fen=START_FEN):
+        self.white = white
+        self.black = black
+        self.new_game(fen)
+
+    def new_game(self, fen=START_FEN):
+        # Start again from fen (the starting position by default)
+        self.board = Position(fen)
+        self.history = []
+        self.tokens = []
+        self.result = None
+        self.reason = None
+        self._settle()
+
+    def legal_moves(self):
+        # Legal moves for the side to move, worked out once per position; none once the game is over
+        return [] if self.result else list(self.moves)
+
+    def play(self, move):
+        # Play a move given as an encoded move or in coordinate form (e2e4, e7e8q); returns the result, which stays None while the game goes on
+        if self.result:
+            raise ValueError(f'the game is over ({self.reason})')
+        if isinstance(move, str):
+            text = move
+            move = next((candidate for candidate in self.moves if move_text(candidate) == text.strip().lower()), None)
+            if move is None:
+                raise ValueError(f'{text} is not a legal move here')
+        elif move not in self.moves:
+            raise ValueError(f'{move_text(move)} is not a legal move here')
+        self.tokens.append(history_token(move, self.board.side))
+        self.board.make_move(move)
+        self.history.append(move)
+        self._settle()
+        return self.result
+
+    def resign(self):
+        # The side to move gives up
+        self._finish('l' if self.board.side == WHITE else 'w', 'resignation')
+        return self.result
+
+    def draw(self):
+        # Both players agree to a draw
+        self._finish('d', 'agreement')
+        return self.result
+
+    def record(self, result=True):
+        # The game as a GameHistory.txt line: players, date, moves and, once it is over, the result; result=False leaves that for finish_game() to write
+        line = f'\n{self.white} VS {self.black} ({date.today()});{"".join(self.tokens)}'
+        if result and self.result == 'd':
+            line += '¿Both players draw'
+        elif result and self.result:
+            line += f'¿{self.white if self.result == "w" else self.black} wins'
+        return line
+
+    def _settle(self):
+        # Work out the new position's legal moves and whether they end the game
+        self.moves = generate_legal_moves(self.board)
+        if not self.moves:
+            if in_check(self.board):
+                self._finish('l' if self.board.side == WHITE else 'w', 'checkmate')
+            else:
+                self._finish('d', 'stalemate')
+
+    def _finish(self, result, reason):
+        # result is 'w', 'l' or 'd' from White's side, as finish_game() takes it
+        if self.result is None:
+            self.result = result
+            self.reason = reason
+
+#Nothing here touches input(), pause() or the data files, so scripts and tests can play thousands of games a minute; record() and finish_game() are how a finished session reaches GameHistory.txt and the rating files
+
+UCI_NAME = 'OFF Chess'
+UCI_AUTHOR = 'ezradevs'
+
+class UCIEngine:
+    # Universal Chess Interface front end: a reader thread queues stdin lines as they arrive and searches run on their own thread, so "isready" and "stop" are answered while the engine is thinking
+
+    def __init__(self, infile=None, outfile=None):
+        self.infile = infile or sys.stdin
+        self.outfile = outfile or sys.stdout
+        self.lines = queue.Queue()
+        self.lock = threading.Lock()
+        self.pos = setboard()
+        self.hash_mb = COMPUTER_HASH_MB
+        self.table = TranspositionTable(self.hash_mb)
+        self.thread = None
+        self.halt = [0]
+        self.stopped = threading.Event()
+
+    def run(self):
+        # Answer commands until "quit" or the end of input
+        threading.Thread(target=self._reader, daemon=True).start()
+        try:
+            while True:
+                line = self.lines.get()
+                if line is None or not self.command(line):
                     break
-            elif newfile > 0 and newranks > 0:
-                possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
+        finally:
+            self.stop()
+            self.table.close()
+
+    def _reader(self):
+        # Reader thread body: a blocked readline never holds up the engine
+        for line in self.infile:
+            self.lines.put(line)
+        self.lines.put(None)
+
+    def send(self, text):
+        # One line to the GUI; the search thread writes too, so lines are kept whole
+        with self.lock:
+            self.outfile.write(text + '\n')
+            self.outfile.flush()
+
+    def command(self, line):
+        # Carry out one command line; False means quit
+        words = line.split()
+        if not words:
+            return True
+        verb = words[0]
+        if verb == 'uci':
+            self.send(f'id name {UCI_NAME}')
+            self.send(f'id author {UCI_AUTHOR}')
+            self.send(f'option name Hash type spin default {COMPUTER_HASH_MB} min 1 max 4096')
+            self.send('uciok')
+        elif verb == 'isready':
+            self.send('readyok')
+        elif verb == 'setoption':
+            self.stop()
+            text = ' '.join(words)
+            found = re.match(r'setoption name (\S+) value (\S+)', text, re.IGNORECASE)
+            if found and found.group(1).lower() == 'hash' and found.group(2).isdigit():
+                self.table.close()
+                self.hash_mb = max(int(found.group(2)), 1)
+                self.table = TranspositionTable(self.hash_mb)
+        elif verb == 'ucinewgame':
+            self.stop()
+            self.table.clear()
+        elif verb == 'position':
+            self.stop()
+            self.position(words[1:])
+        elif verb == 'go':
+            self.stop()
+            self.go(words[1:])
+        elif verb == 'stop':
+            self.stop()
+        elif verb == 'quit':
+            return False
+        return True
 
+    def position(self, words):
+        # "position startpos|fen <fen> [moves ...]": set up the board and play the moves, keeping them as history so repetitions are seen
+        moves = words.index('moves') if 'moves' in words else len(words)
+        if words and words[0] == 'fen':
+            self.pos = Position(' '.join(words[1:moves]))
+        else:
+            self.pos = setboard()
+        for text in words[moves + 1:]:
+            move = parse_move(self.pos, text)
+            if move is None:
+                self.send(f'info string illegal move {text}')
+                break
+            self.pos.make_move(move)
+
+    def go(self, words):
+        # Start a search with the limits given: movetime, depth, nodes, the clock (wtime/btime/winc/binc/movestogo) or infinite
+        limits = {}
+        for name, value in zip(words, words[1:] + ['']):
+            if value.lstrip('-').isdigit():
+                limits[name] = int(value)
+        infinite = 'infinite' in words
+        max_time = None
+        if 'movetime' in limits:
+            max_time = limits['movetime'] / 1000
+        elif not infinite and ('wtime' in limits or 'btime' in limits):
+            # A share of the clock left plus most of the increment, never more than half of what is left
+            left = limits.get('wtime' if self.pos.side == WHITE else 'btime', 0) / 1000
+            increment = limits.get('winc' if self.pos.side == WHITE else 'binc', 0) / 1000
+            max_time = max(min(left / limits.get('movestogo', 30) + increment * 0.8, left / 2), 0.01)
+        self.halt = [0]
+        self.stopped.clear()
+        self.table.new_search()
+        search = Search(max_time=max_time, max_nodes=limits.get('nodes'), max_depth=limits.get('depth', 64), report=self.info, table=self.table, stop=self.halt)
+        self.thread = threading.Thread(target=self._search, args=(search, self.pos.copy(), infinite), daemon=True)
+        self.thread.start()
+
+    def _search(self, search, pos, infinite):
+        # Search thread body; with "go infinite" the answer waits for "stop", as the protocol asks
+        move = search.run(pos)
+        if infinite:
+            self.stopped.wait()
+        self.send(f'bestmove {move_text(move) if move is not None else "0000"}')
+
+    def info(self, search):
+        # Report a finished iteration in UCI terms: mate scores in moves, the rest in centipawns
+        if abs(search.score) > MATE_BOUND:
+            score = f'mate {(MATE_SCORE - abs(search.score) + 1) // 2 * (1 if search.score > 0 else -1)}'
+        else:
+            score = f'cp {search.score}'
+        self.send(f'info depth {search.depth} score {score} nodes {search.nodes} nps {search.nps()} time {int(search.elapsed * 1000)} pv {move_text(search.best)}')
 
-    if food == "P":
-        # Pawn: handle forward pushes, captures, initial double steps, and en passant for both colors
+    def stop(self):
+        # End any search under way and wait for its bestmove to go out
+        if self.thread:
+            self.halt[0] = 1
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
 
-        if x[0] == 'w':
-            newranks = 0
-            newfile = 0
+#Search checks the stop flag every 1024 nodes, so "stop" is answered within milliseconds; every other command that changes the position or the table stops the search first, and "go" while searching replaces the search under way
 
-            if rank == "2":
-                # Starting rank: allow single or double push if clear
-                for i in range(2):
-                    i += 1
-                    newranks = int(rank) + i
-                    if f'{file}{newranks}' in board:
-                        break
-                    if newranks < 9:
-                        possible_moves.append(f'{filecondict[int(file)]}{str(newranks)}')
-                        check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(file)]}{str(newranks)}'))
+PAUSES = True
 
-            else:
-                newranks = int(rank) + 1
-                if newranks < 9 and f'{file}{newranks}' not in board:
-                    possible_moves.append(f'{filecondict[int(file)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(file)]}{str(newranks)}'))
-            
-            newranks = int(rank)
-            newfile = int(file)
-            newranks += 1
-            newfile += 1
-            # Diagonal capture to the right if an enemy piece exists
-            if f'{newfile}{newranks}' in board:
-                pawntake = board[f'{newfile}{newranks}']
-                if pawntake[0] != x[0]:
-                    possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-            
-            newranks = int(rank)
-            newfile = int(file)
-            newranks += 1
-            newfile -= 1
-            # Diagonal capture to the left if an enemy piece exists
-            if f'{newfile}{newranks}' in board:
-                pawntake = board[f'{newfile}{newranks}']
-                if pawntake[0] != x[0]:
-                    possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-            if rank == '5':
-                newranks = int(rank)
-                newfile = int(file)
-                newfile -= 1
-                # En passant capture to the left for white pawns
-                if f'{newfile}{newranks}' in board:
-                    pawntake = board[f'{newfile}{newranks}']
-                    if (pawntake[0] != x[0]) and pawntake[-1] == 'P':
-                        newranks += 1
-                        enpassant_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-
-            if rank == '5':
-                newranks = int(rank)
-                newfile = int(file)
-                newfile += 1
-                # En passant capture to the right for white pawns
-                if f'{newfile}{newranks}' in board:
-                    pawntake = board[f'{newfile}{newranks}']
-                    if (pawntake[0] != x[0]) and pawntake[-1] == 'P':
-                        newranks += 1
-                        enpassant_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-
-
-
-
-        elif x[0] == 'b':
-
-            newranks = 0
-            newfile = 0
-            if str(rank) == "7":
-                # Black starting rank: allow single or double push if clear
-                for i in range(2):
-                    i += 1
-                    newranks = int(rank) - i
-                    if f'{file}{newranks}' in board:
-                        break
-                    if newranks > 0:
-                        possible_moves.append(f'{filecondict[int(file)]}{str(newranks)}')
-                        check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(file)]}{str(newranks)}'))
+def pause(seconds):
+    # Wait between messages so players can follow the game; scripted runs switch PAUSES off
+    if PAUSES:
+        time.sleep(seconds)
 
-            else:
-                newranks = int(rank) - 1
-                if newranks > 0 and f'{file}{newranks}' not in board:
-                    possible_moves.append(f'{filecondict[int(file)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(file)]}{str(newranks)}'))
-
-            newranks = int(rank)
-            newfile = int(file)
-            newranks -= 1
-            newfile += 1
-            # Diagonal capture to the right for black (toward smaller ranks)
-            if f'{newfile}{newranks}' in board:
-                pawntake = board[f'{newfile}{newranks}']
-                if pawntake[0] != x[0]:
-                    possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-            newranks = int(rank)
-            newfile = int(file)
-            newranks -= 1
-            newfile -= 1
-            # Diagonal capture to the left for black
-            if f'{newfile}{newranks}' in board:
-                pawntake = board[f'{newfile}{newranks}']
-                if pawntake[0] != x[0]:
-                    possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-                    check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-            if rank == '4':
-                newranks = int(rank)
-                newfile = int(file)
-                newfile -= 1
-                # En passant capture to the left for black pawns
-                if f'{newfile}{newranks}' in board:
-                    pawntake = board[f'{newfile}{newranks}']
-                    if (pawntake[0] != x[0]) and pawntake[-1] == 'P':
-                        newranks -= 1
-                        enpassant_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-
-            if rank == '4':
-                newranks = int(rank)
-                newfile = int(file)
-                newfile += 1
-                # En passant capture to the right for black pawns
-                if f'{newfile}{newranks}' in board:
-                    pawntake = board[f'{newfile}{newranks}']
-                    if (pawntake[0] != x[0]) and pawntake[-1] == 'P':
-                        newranks -= 1
-                        enpassant_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
- 
-    if food == "N":
-        # Knight: test all eight L-shaped jumps, ignoring blocking pieces
-        newfile = 0
-        newranks = 0
-        newfile = int(file) + 2
-        newranks = int(rank) - 1   
-        if newfile < 9 and newranks > 0 and board.get(f'{newfile}{newranks}',"1")[0] != x[0]:
-            possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-            check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-        newfile = 0
-        newranks = 0
-        newfile = int(file) + 2
-        newranks = int(rank) + 1   
-        if newfile < 9 and newranks < 9 and board.get(f'{newfile}{newranks}',"1")[0] != x[0]:
-            possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-            check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-        newfile = 0
-        newranks = 0
-        newfile = int(file) - 2
-        newranks = int(rank) + 1   
-        if newfile > 0 and newranks < 9 and board.get(f'{newfile}{newranks}',"1")[0] != x[0]:
-            possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-            check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-        newfile = 0
-        newranks = 0
-        newfile = int(file) - 2
-        newranks = int(rank) - 1   
-        if newfile > 0 and newranks > 0 and board.get(f'{newfile}{newranks}',"1")[0] != x[0]:
-            possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-            check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-        newfile = 0
-        newranks = 0
-        newfile = int(file) + 1
-        newranks = int(rank) + 2   
-        if newfile < 9 and newranks < 9 and board.get(f'{newfile}{newranks}',"1")[0] != x[0]:
-            possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-            check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-        newfile = 0
-        newranks = 0
-        newfile = int(file) - 1
-        newranks = int(rank) + 2   
-        if newfile > 0 and newranks < 9 and board.get(f'{newfile}{newranks}',"1")[0] != x[0]:
-            possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-            check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-        newfile = 0
-        newranks = 0
-        newfile = int(file) + 1
-        newranks = int(rank) - 2   
-        if newfile < 9 and newranks > 0 and board.get(f'{newfile}{newranks}',"1")[0] != x[0]:
-            possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-            check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-        newfile = 0
-        newranks = 0
-        newfile = int(file) - 1
-        newranks = int(rank) - 2   
-        if newfile > 0 and newranks > 0 and board.get(f'{newfile}{newranks}',"1")[0] != x[0]:
-            possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-            check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-
-
-    if food == "K":
-
-        if x[0] == 'w':
-            # White king: determine castling availability before testing standard moves
-            newfile = 0
-            newranks = 0
-            if f'{file}{rank}' == '51' and wkingmoved == False:
-                newfile = int(file) + 1
-                if f'{newfile}{rank}' not in board:
-                    newfile = int(newfile) + 1
-                    if f'{newfile}{rank}' not in board:
-                        castlewk = True
-
-                newfile = int(file) - 1
-                if f'{newfile}{rank}' not in board:
-                    newfile = int(newfile) - 1
-                    if f'{newfile}{rank}' not in board:
-                        castlewq = True
-
-        if x[0] == 'b':
-            newfile = 0
-            newranks = 0
-            # Black king: mirror the castling eligibility checks
-            if f'{file}{rank}' == '58' and bkingmoved == False:
-                newfile = int(file) + 1
-                if f'{newfile}{rank}' not in board:
-                    newfile = int(newfile) + 1
-                    if f'{newfile}{rank}' not in board:
-                        castlebk = True
-                    
-
-                newfile = int(file) - 1
-                if f'{newfile}{rank}' not in board:
-                    newfile = int(newfile) - 1
-                    if f'{newfile}{rank}' not in board:
-                        castlebq = True
-
-        newfile = 0
-        newranks = 0
-        newranks = int(rank) + 1
-        # King can step one square up if not blocked by own piece
-        if newranks < 9 and board.get(f'{file}{newranks}',"1")[0] != x[0]:
-            possible_moves.append(f'{filecondict[int(file)]}{str(newranks)}')
-            if dontAddKing == False:
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(file)]}{str(newranks)}'))
-            K_moves.append(f'{filecondict[int(file)]}{str(newranks)}')
-            
+def getmoves():
+    # Build the move list for the currently selected piece from the bitboard generator; False when it has nowhere to go
+    global possible_moves
+    global piece_moves
+    global ogx
 
-        newfile = 0
-        newranks = 0
-        newranks = int(rank) - 1
-        # King can step one square down if target not friendly
-        if newranks > 0 and board.get(f'{file}{newranks}',"1")[0] != x[0]:
-            possible_moves.append(f'{filecondict[int(file)]}{str(newranks)}')
-            if dontAddKing == False:
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(file)]}{str(newranks)}'))
-            K_moves.append(f'{filecondict[int(file)]}{str(newranks)}')
-
-
-        newfile = 0
-        newranks = 0
-        newfile = int(file) + 1
-        # Check the square to the right of the king
-        if newfile < 9 and board.get(f'{newfile}{rank}',"1")[0] != x[0]:
-            possible_moves.append(f'{filecondict[int(newfile)]}{str(rank)}')
-            if dontAddKing == False:
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(rank)}'))
-            K_moves.append(f'{filecondict[int(newfile)]}{str(rank)}')
-
-
-
-        newfile = 0
-        newranks = 0
-        newfile = int(file) - 1
-        # Check the square to the left of the king
-        if newfile > 0 and board.get(f'{newfile}{rank}',"1")[0] != x[0]:
-            possible_moves.append(f'{filecondict[int(newfile)]}{str(rank)}')
-            if dontAddKing == False:
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(rank)}'))
-            K_moves.append(f'{filecondict[int(newfile)]}{str(rank)}')
-
-
-
-        newfile = 0
-        newranks = 0
-        newfile = int(file) + 1
-        newranks = int(rank) + 1
-        # Up-right diagonal
-        if newfile < 9 and newranks < 9 and board.get(f'{newfile}{newranks}',"1")[0] != x[0]:
-            possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-            if dontAddKing == False:
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-            K_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-
-
-
-        newfile = 0
-        newranks = 0
-        newfile = int(file) + 1
-        newranks = int(rank) - 1
-        # Down-right diagonal
-        if newfile < 9 and newranks > 0 and board.get(f'{newfile}{newranks}',"1")[0] != x[0]:
-            possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-            if dontAddKing == False:
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-            K_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-
-
-
-        newfile = 0
-        newranks = 0
-        newfile = int(file) - 1
-        newranks = int(rank) + 1
-        # Up-left diagonal
-        if newfile > 0 and newranks < 9 and board.get(f'{newfile}{newranks}',"1")[0] != x[0]:
-            possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-            if dontAddKing == False:
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-            K_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-
-
- 
-        newfile = 0
-        newranks = 0
-        newfile = int(file) - 1
-        newranks = int(rank) - 1
-        # Down-left diagonal
-        if newfile > 0 and newranks > 0 and board.get(f'{newfile}{newranks}',"1")[0] != x[0]:
-            possible_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-            if dontAddKing == False:
-                check_moves.append((f'{filecondict[int(file)]}{str(rank)}',f'{filecondict[int(newfile)]}{str(newranks)}'))
-            K_moves.append(f'{filecondict[int(newfile)]}{str(newranks)}')
-
-
-
-    if checks == False:
-        if possible_moves == []:
-            # No legal moves available for the selected piece; force player to choose again
-            print("Sorry, this piece cannot move anywhere, please choose another one")
-            Pieceinput()
+    ogx = x
+    possible_moves = []
+    piece_moves = []
+    for move in generate_pseudo_moves(board):
+        if move & 63 != selected:
+            continue
+        piece_moves.append(move)
+        target = SQUARE_NAMES[move >> 6 & 63]
+        if target not in possible_moves:
+            # Promotions come out once per piece choice, but the player only names the square
+            possible_moves.append(target)
+
+    if possible_moves == []:
+        # No legal moves available for the selected piece; force player to choose again
+        print("Sorry, this piece cannot move anywhere, please choose another one")
+        return False
+    return True
 
 def GetElo(Ra,Rb,wresult,bresult):
     # Apply the Elo rating formula to both players and persist the new results
@@ -873,709 +2704,317 @@ def write(dox): #A generic write function
     with open(dox, 'w') as file:
         file.write(updated_contents)
 
-def checktest(chm):
-    #At the end of your turn, just before a piece move is submitted, check if the king is in check, by running through all the pieces
-    # When `chm` is True we gather enemy attacks; when False we gather friendly attacks for validation
-    global check_moves
-    global selfking
-    global K_moves
-    global secondValueList
-    global firstValueList
-    check_moves = []
-    secondValueList = []
-    firstValueList = []
-    K_moves = []
-
-    for index,sqr in enumerate(board):
-        # Iterate over every occupied square, treating each piece as potential attacker or king candidate
-        global food
-        global name
-        global file
-        global rank
-        global x
-
-        file = sqr[0]
-        rank = sqr[-1]
-        x = board[sqr]
-
-
-        if x[-1] == "R":
-            # Evaluate rook moves depending on whose attacks we are gathering
-            food = "R"
-            if ((whom == True and x[0] == 'b') or (whom == False and x[0] == 'w')):
-                if chm == False:
-                    getmoves(True,False)
-            else:
-                if chm == True:
-                    getmoves(True,False)
-
-        elif x[-1] == "B":
-            # Evaluate bishop moves
-            food = "B"
-
-            if ((whom == True and x[0] == 'b') or (whom == False and x[0] == 'w')):
-                if chm == False:
-                    getmoves(True,False)
-            else:
-                if chm == True:
-                    getmoves(True,False)
-
-        elif x[-1] == "Q":
-            # Evaluate queen moves
-            food = "Q"
-            if ((whom == True and x[0] == 'b') or (whom == False and x[0] == 'w')):
-                if chm == False:
-                    getmoves(True,False)
-            else:
-                if chm == True:
-                    getmoves(True,False)
-
-        elif x[-1] == "P":
-            # Evaluate pawn moves, including en passant threats
-            food = 'P'
-            if ((whom == True and x[0] == 'b') or (whom == False and x[0] == 'w')):
-                if chm == False:
-                    getmoves(True,False)          
-            else:
-                if chm == True:
-                    getmoves(True,False)
-
-        elif x[-1] == "N":
-            # Evaluate knight moves
-            food = 'N'
-            if ((whom == True and x[0] == 'b') or (whom == False and x[0] == 'w')):
-                if chm == False:
-                    getmoves(True,False)
-            else:
-                if chm == True:
-                    getmoves(True,False)
-                    
-        elif x[-1] == "K":
-            # Track the friendly king's square and gather opposing king moves
-            food = "K"
-            if ((whom == True and x[0] == 'w') or (whom == False and x[0] == 'b')):
-                selfking = f'{file}{rank}'
-                if chm == True:
-                    getmoves(True,True)
-            if ((whom == True and x[0] == 'b') or (whom == False and x[0] == 'w')):
-                if chm == False:
-                    getmoves(True,False)
-
 def mate():
-
+    # Decide whether the side to move has run out of moves, answered from the ponderer's cache when it has the position and an early-exit search when it does not
     global ismate
-    # Assume mate until we find a legal move that escapes check
-    ismate = True
-    checktest(True) #Get list of own colour pieces possible moves
-    for a in check_moves:
-        # Try every non-king move and see if any remove the king from danger
-        secondValueList.append(a[-1])
-        firstValueList.append(a[0])
-        originalPiece = 0
-        oldmove = f'{fileinputdict[a[0][0]]}{a[0][-1]}'
-        move = f'{fileinputdict[a[-1][0]]}{a[-1][-1]}'
-        if move in board:
-            originalPiece = board[move]
-        movedPiece = board[oldmove] 
-        board.pop(oldmove)
-        board[move] = movedPiece
-        checktest(False)
-        for b in check_moves:
-            secondValueList.append(b[-1])
-
-        if f'{filecondict[int(selfking[0])]}{selfking[-1]}' not in secondValueList:
-            ismate = False
-        if originalPiece == 0:
-            board.pop(move)
-        else:
-            board[move] = originalPiece
-        board[oldmove] = movedPiece
-
-    checktest(True)
-    for b in K_moves: #loop For all the moves in the list
-        # Explicitly test each king move against future attacks
-        originalPiece = 0
-        move = f'{fileinputdict[b[0]]}{b[-1]}' #figure out each move in the list
-        if move in board:
-            originalPiece = board[move]
-        if whom == True:
-            board[move] = 'wK'
-        elif whom == False:
-            board[move] = 'bK'
-        checktest(False)
-        for a in check_moves:
-            secondValueList.append(a[-1])
-        if f'{filecondict[int(move[0])]}{move[-1]}' not in secondValueList:
-            ismate = False
-        if originalPiece == 0:
-            board.pop(move)
+    ismate = not ponderer.has_move(board)
+
+def finish_game(white_result):
+    # Rate both players, add the result to their tallies and close the game's line in GameHistory.txt; white_result is 'w', 'l' or 'd' from White's side
+    global word
+    black_result = {'w': 'l', 'l': 'w', 'd': 'd'}[white_result]
+    word = p1name
+    Addwins("Elo.txt")
+    Ra = oldstuff
+    word = p2name
+    Addwins("Elo.txt")
+    Rb = oldstuff
+    GetElo(Ra,Rb,white_result,black_result)
+    tallies = {'w': 'Wins.txt', 'l': 'Loss.txt', 'd': 'Draw.txt'}
+    word = p1name
+    Addwins(tallies[white_result])
+    word = p2name
+    Addwins(tallies[black_result])
+    with open('GameHistory.txt','a') as p:
+        if white_result == 'd':
+            p.write('¿Both players draw')
         else:
-            board[move] = originalPiece
+            p.write(f'¿{p1name if white_result == "w" else p2name} wins')
+    pause(1)
 
 def start():
-    # Increment the global turn counter and announce whose move it is
-    global turns
-    turns += 1
-    global whom
-    if turns % 2 != 0: #Whites move
-        # Odd-numbered turns belong to White
-        whom = True
+    # Announce whose move it is, taken from the side to move in the position, and play that turn; False once the game is over
+    if board.side == WHITE: #Whites move
         print(f"It is now white ({p1name})'s move")
-        time.sleep(1)
+        pause(1)
     else:
-        # Even-numbered turns belong to Black
-        whom = False
         print(f"It is now black ({p2name})'s move")
-        time.sleep(1)
-    Pieceinput()
+        pause(1)
+    if board.side == computer_side and ponderer.has_move(board):
+        computer_move()
+        return True
+    ponder()
+    # Humans, and the end of the game on the computer's turn, go through the usual input and mate checks
+    return Pieceinput()
 
 def Pieceinput():  
-    # Prompt the active player for a piece to move, validate that choice, and seed move generation
+    # Prompt the active player for a piece to move, validate that choice, and seed move generation; True once a move has been played, False when the game ended instead
     global food
     global name
     global piece  
     global x
     global word
-    food = 0
-    piece = 0
-    checktest(False)
-    # Populate attack maps to identify checks and current legal responses
-    for a in check_moves:
-            secondValueList.append(a[-1])
-    if f'{filecondict[int(selfking[0])]}{selfking[-1]}' in secondValueList:
-        # If the king's square is attacked, determine whether the position is checkmate
-        mate()
-        if ismate == True:
-            print("CHECKMATE")
-            time.sleep(1)
-            print("Game over")
-
-            if whom == True:
-                print(f"Black, {p2name}, has won the game")
+    global selected
+    announced = None
+    # Every retry goes round this loop again rather than calling back in, so the stack stays the same however many times a player is asked
+    while True:
+        food = 0
+        piece = 0
+        checked = ponderer.facts_for(board)[1]
+        if checked:
+            # If the king's square is attacked, determine whether the position is checkmate
+            mate()
+            if ismate == True:
+                print("CHECKMATE")
+                pause(1)
+                print("Game over")
+
+                if board.side == WHITE:
+                    print(f"Black, {p2name}, has won the game")
+                    finish_game('l')
+
+                if board.side == BLACK:
+                    print(f"White, {p1name}, has won the game")
+                    finish_game('w')
+                return False
 
-                word = p1name
-                Addwins("Elo.txt")
-                Ra = oldstuff
-                word = p2name
-                Addwins("Elo.txt")
-                Rb = oldstuff
-                GetElo(Ra,Rb,'l','w')
-                word = p2name
-                Addwins("Wins.txt")
-                word = p1name
-                Addwins("Loss.txt")
-                with open('GameHistory.txt','a') as p:
-                    p.write(f'¿{p2name} wins')
+            else:
+                if board.side == WHITE:
+                    print("White is in check")
+                elif board.side == BLACK:
+                    print("Black is in check")
+
+        if not checked:
+
+            mate()
+            # When the king is safe, we still check for stalemate (no legal moves)
+            if ismate == True:
+                print("STALEMATE")
+                pause(1)
+                print("Game over")
+                print("Both players have drawn")
+                finish_game('d')
+                return False
+
+        found = probe_tablebase(board) if board.key != announced else None
+        announced = board.key
+        if found and found[0] != 'draw':
+            # The endgame tables know the result with best play from here; said once per position, not again after every retry
+            result, plies = found
+            winner = 'White' if (board.side == WHITE) == (result == 'win') else 'Black'
+            print(f"Tablebase: {winner} mates in {(plies + 1) // 2} with best play")
+
+        piece = input("Name the square of the piece you wish to move; ")
+        # Allow text commands for draw or resign before validating coordinates
+        if piece.lower() == 'draw':
+            # Interpret special command to offer a draw to the opponent
+            if board.side == WHITE:
+                print(f"{p1name} has offered a draw")
+                pause(1)
+                print(f"{p2name}, will you accept (Y or N)?")
+            if board.side == BLACK:
+                print(f"{p2name} has offered a draw")
+                pause(1)
+                print(f"{p1name}, will you accept (Y or N)?")
+            if computer_side == board.side ^ 1:
+                # The computer takes a draw only when it is more than a pawn down
+                draw = 'y' if evaluate(board) > PIECE_VALUES[PAWN] else 'n'
+                pause(1)
+                print(draw.upper())
+            else:
+                draw = input("")
+            if draw.lower() == 'y':
+                print("Game over")
+                print("Both players have drawn")
+                finish_game('d')
+                return False
+            else:
+                if board.side == WHITE:
+                    print(f"{p2name} has declined the draw")
+                    pause(1)
+                    print(f"{p1name}, please make a move")
+                if board.side == BLACK:
+                    print(f"{p1name} has declined the draw")
+                    pause(1)
+                    print(f"{p2name}, please make a move")
+                continue
+
+        if piece.lower() == 'hint':
+            # Suggest a move from a short search, then ask again
+            hint()
+            continue
+
+        if piece.lower() == 'resign':
+            # Resignation flow grants victory to the opponent after confirmation
+            die = input("Are you sure you wish to resign (Y or N)? ")
+            if die.upper() == 'N':
+                continue
+            if die.upper() == 'Y':
+                if board.side == WHITE:
+                    print(f"Black, {p2name}, has won the game")
+                    finish_game('l')
+
+                if board.side == BLACK:
+                    print(f"White, {p1name}, has won the game")
+                    finish_game('w')
+                return False
+            print("Please enter a valid answer")
+            pause(1)
+            continue
+        if piece.lower() not in SQUARE_INDEX or board.squares[SQUARE_INDEX[piece.lower()]] == EMPTY:
+            # Reject malformed input or empty squares
+            print("Please enter a valid piece")
+            continue
+        selected = SQUARE_INDEX[piece.lower()]
+        x = board.code(selected)
+        if (board.side == WHITE and x[0] == 'w') or (board.side == BLACK and x[0] == 'b'):
+            # Ensure the chosen piece belongs to the current player
+            if x[-1] == "R":
+                food = "R"
+                name = "Rook"
+            elif x[-1] == "B":
+                food = "B"
+                name = "Bishop"
+            elif x[-1] == "Q":
+                food = "Q"
+                name = "Queen"
+            elif x[-1] == "P":
+                food = 'P'
+                name = "Pawn"
+            elif x[-1] == "N":
+                food = 'N'
+                name = "Knight"
+            elif x[-1] == "K":
+                food = "K"
+                name = "King"
+            else:
+                print("w")
 
-            if whom == False:
-                print(f"White, {p1name}, has won the game")
-                
-                word = p1name
-                Addwins("Elo.txt")
-                Ra = oldstuff
-                word = p2name
-                Addwins("Elo.txt")
-                Rb = oldstuff
-                GetElo(Ra,Rb,'w','l')
-                word = p1name
-                Addwins("Wins.txt")
-                word = p2name
-                Addwins("Loss.txt")
-                with open('GameHistory.txt','a') as p:
-                    p.write(f'¿{p1name} wins')
-            time.sleep(1)
-            choices()
+            pause(1)
+            print(f'You have selected a {name}')
+            pause(1)
+            # Calculate possible moves for the selected piece
+            if not getmoves():
+                continue
 
         else:
-            if whom == True:
-                print("White is in check")
-            elif whom == False:
-                print("Black is in check")
-    
-    if f'{filecondict[int(selfking[0])]}{selfking[-1]}' not in secondValueList:
-
-        mate()
-        # When the king is safe, we still check for stalemate (no legal moves)
-        if ismate == True:
-            print("STALEMATE")
-            time.sleep(1)
-            print("Game over")
-            print("Both players have drawn")
-            word = p1name
-            Addwins("Elo.txt")
-            Ra = oldstuff
-            word = p2name
-            Addwins("Elo.txt")
-            Rb = oldstuff
-            GetElo(Ra,Rb,'d','d')
-            word = p1name
-            Addwins('Draw.txt')
-            word = p2name
-            Addwins('Draw.txt')
-            with open('GameHistory.txt','a') as p:
-                p.write('¿Both players draw')
-            time.sleep(1)
-            choices()                
-
-    piece = input("Name the square of the piece you wish to move; ")
-    # Allow text commands for draw or resign before validating coordinates
-    if piece.lower() == 'draw':
-        # Interpret special command to offer a draw to the opponent
-        if whom == True:
-            print(f"{p1name} has offered a draw")
-            time.sleep(1)
-            print(f"{p2name}, will you accept (Y or N)?")
-        if whom == False:
-            print(f"{p2name} has offered a draw")
-            time.sleep(1)
-            print(f"{p1name}, will you accept (Y or N)?")
-        draw = input("")
-        if draw.lower() == 'y':
-            print("Game over")
-            print("Both players have drawn")
-            word = p1name
-            Addwins("Elo.txt")
-            Ra = oldstuff
-            word = p2name
-            Addwins("Elo.txt")
-            Rb = oldstuff
-            GetElo(Ra,Rb,'d','d')
-            word = p1name
-            Addwins('Draw.txt')
-            word = p2name
-            Addwins('Draw.txt')
-            with open('GameHistory.txt','a') as p:
-                p.write('¿Both players draw')
-            time.sleep(1)
-            choices()
-        else:
-            if whom == True:
-                print(f"{p2name} has declined the draw")
-                time.sleep(1)
-                print(f"{p1name}, please make a move")
-            if whom == False:
-                print(f"{p1name} has declined the draw")
-                time.sleep(1)
-                print(f"{p2name}, please make a move")
-            Pieceinput()
-    
-    if piece.lower() == 'resign':
-        # Resignation flow grants victory to the opponent after confirmation
-        die = input("Are you sure you wish to resign (Y or N)? ")
-        if die.upper() == 'N':
-            Pieceinput()
-        if die.upper() == 'Y':
-            if whom == True:
-                print(f"Black, {p2name}, has won the game")
-                word = p1name
-                Addwins("Elo.txt")
-                Ra = oldstuff
-                word = p2name
-                Addwins("Elo.txt")
-                Rb = oldstuff
-                GetElo(Ra,Rb,'l','w')
-                word = p2name
-                Addwins("Wins.txt")
-                word = p1name
-                Addwins("Loss.txt")
-                with open('GameHistory.txt','a') as p:
-                    p.write(f'¿{p2name} wins')
-                time.sleep(1)
-                choices()
-
-            if whom == False:
-                print(f"White, {p1name}, has won the game")
-                word = p1name
-                Addwins("Elo.txt")
-                Ra = oldstuff
-                word = p2name
-                Addwins("Elo.txt")
-                Rb = oldstuff
-                GetElo(Ra,Rb,'w','l')
-                word = p1name
-                Addwins("Wins.txt")
-                word = p2name
-                Addwins("Loss.txt")
-                with open('GameHistory.txt','a') as p:
-                    p.write(f'¿{p1name} wins')
-                time.sleep(1)
-                choices()
-        else:
-            print("Please enter a valid answer")
-            time.sleep(1)
-            Pieceinput()
-            choices()
-    if ((piece.lower()[0] or piece.lower()[1]) not in fileinputdict) or len(piece) != 2 or f'{fileinputdict[piece[0]]}{piece[-1]}' not in board:
-        # Reject malformed input or empty squares
-        print("Please enter a valid piece")
-        Pieceinput()
-    x = board.get(f'{fileinputdict[piece[0]]}{piece[1]}')
-    if (whom == True and x[0] == 'w') or (whom == False and x[0] == 'b'):
-        # Ensure the chosen piece belongs to the current player
-        if x[-1] == "R":
-            food = "R"
-            name = "Rook"
-        elif x[-1] == "B":
-            food = "B"
-            name = "Bishop"
-        elif x[-1] == "Q":
-            food = "Q"
-            name = "Queen"
-        elif x[-1] == "P":
-            food = 'P'
-            name = "Pawn"
-        elif x[-1] == "N":
-            food = 'N'
-            name = "Knight"
-        elif x[-1] == "K":
-            food = "K"
-            name = "King"
-        else:
-            print("w")
-
-        time.sleep(1)
-        print(f'You have selected a {name}')
-        time.sleep(1)
-        global file
-        global rank
-        file = fileinputdict[piece[0]] #First number is file (a file, b file, c file etc)
-        rank = piece[-1] #Second number is rank (4th rank, 5th rank, 6th rank etc)
-        # Calculate possible moves for the selected piece
-        getmoves(False,False)
-
-    else:
-        print('Wrong colour piece!')
-        time.sleep(1)
-        Pieceinput()       
-    # Pass control to the destination selection prompt
-    news()
+            print('Wrong colour piece!')
+            pause(1)
+            continue
+        # Pass control to the destination selection prompt; it hands back here to choose a different piece
+        if news():
+            return True
 
 def promotion():
     # Convert a pawn that reached the back rank into the piece chosen by the player
     global ogx
-    global prom
-    global prop
-    promote = input("Your pawn has promoted! What piece will it become? ")
-    if promote.upper() == 'Q' or promote.upper() == 'R' or promote.upper() == 'B' or promote.upper() == 'N':
-        ogx = f'{ogx[0]}{promote.upper()}'
-        prom = True
-        if whom == True:
-            prop = promote.lower()
-        if whom == False:
-            prop = promote.upper()
-    else:
+    while True:
+        promote = input("Your pawn has promoted! What piece will it become? ")
+        if promote.upper() == 'Q' or promote.upper() == 'R' or promote.upper() == 'B' or promote.upper() == 'N':
+            ogx = f'{ogx[0]}{promote.upper()}'
+            return
         print("Invalid syntax please enter algebraic notation of piece")
-        time.sleep(1)
-        promotion()
+        pause(1)
 
 def news():
-    # Handle the target square entry, enforce special move rules, and finalize the move
-    global prom 
-    prom = False
-    new = input("What square do you wish to move this piece? ")
-    time.sleep(1)
-    if new.lower() == "cancel":
-        # Give players a way to re-select a piece
-        Pieceinput()
-    elif ((new.lower()[0] or new.lower()[1]) not in fileinputdict) or len(new) != 2:
-        # Guard against malformed destination coordinates
-        print("Unreadable syntax, please re-enter the square you would like in Algebraic notation, or else, enter cancel")
-        news()
-
-    else:
-        global wkingmoved
-        global bkingmoved
-        global bqrookmoved
-        global bkrookmoved
-        global wkrookmoved
-        global wqrookmoved
-        if castlewk == True and f'{fileinputdict[new[0]]}{new[-1]}' == '71' and wkrookmoved == False:
-            # Execute white king-side castling after verifying path is not in check
-            checktest(False)
-            for a in check_moves:
-                secondValueList.append(a[-1])
-            if 'f1' in secondValueList:
-                print("Still Check")
-                time.sleep(1)
-                print("Please play a legal move to not be in check")
-                time.sleep(1)
-                Pieceinput()
-
-            difnew = '71'
-            board.pop('51')
-            board[difnew] = ogx
-            
-            checktest(False)
-            for a in check_moves:
-                secondValueList.append(a[-1])
-            if f'{filecondict[int(selfking[0])]}{selfking[-1]}' in secondValueList:
-
-                print("Check")
-                time.sleep(1)
-                board.pop(difnew)
-                board[f'{fileinputdict[piece[0]]}{piece[1]}'] = ogx
-                print("Please play a legal move to not be in check")
-                time.sleep(1)
-                Pieceinput()
-
-            difnew = '61'
-            board.pop('81')
-            board[difnew] = 'wR'
-
-            print('White castled')
-            with open('GameHistory.txt', 'a') as enter_games:
-                ogfile = fileinputdict[piece[0]] #First number is file (a file, b file, c file etc)
-                ogrank = piece[-1]
-                enter_games.write(f'{ogfile}{ogrank}wk')
-            time.sleep(1)
-            print_chessboard(board)
-            time.sleep(1)
-            wkingmoved = True
-            start()
-
-        if castlewq == True and f'{fileinputdict[new[0]]}{new[-1]}' == '31' and wqrookmoved == False:
-            # Execute white queen-side castling with safety checks
-            checktest(False)
-            for a in check_moves:
-                secondValueList.append(a[-1])
-            if 'd1' in secondValueList:
-                print("Check")
-                time.sleep(1)
-                print("Please play a legal move to not be in check")
-                time.sleep(1)
-                Pieceinput()
-
-            difnew = '31'
-            board.pop('51')
-            board[difnew] = ogx
-            
-            checktest(False)
-            for a in check_moves:
-                secondValueList.append(a[-1])
-            if f'{filecondict[int(selfking[0])]}{selfking[-1]}' in secondValueList:
-
-                print("Check")
-                time.sleep(1)
-                board.pop(difnew)
-                board[f'{fileinputdict[piece[0]]}{piece[1]}'] = ogx
-                print("Please play a legal move to not be in check")
-                time.sleep(1)
-                Pieceinput()
-
-            difnew = '41'
-            board.pop('11')
-            board[difnew] = 'wR'
-
-            print('White castled')
-            with open('GameHistory.txt', 'a') as enter_games:
-                ogfile = fileinputdict[piece[0]] #First number is file (a file, b file, c file etc)
-                ogrank = piece[-1]
-                enter_games.write(f'{ogfile}{ogrank}wq')
-            time.sleep(1)
-            print_chessboard(board)
-            time.sleep(1)
-            wkingmoved = True
-            start()
-
-        if castlebk == True and f'{fileinputdict[new[0]]}{new[-1]}' == '78' and bkrookmoved == False:
-            # Execute black king-side castling when legal
-            checktest(False)
-            for a in check_moves:
-                secondValueList.append(a[-1])
-            if 'f8' in secondValueList:
-                print("Check")
-                time.sleep(1)
-                print("Please play a legal move to not be in check")
-                time.sleep(1)
-                Pieceinput()
-
-            difnew = '78'
-            board.pop('58')
-            board[difnew] = ogx
-            
-            checktest(False)
-            for a in check_moves:
-                secondValueList.append(a[-1])
-            if f'{filecondict[int(selfking[0])]}{selfking[-1]}' in secondValueList:
-
-                print("Check")
-                time.sleep(1)
-                board.pop(difnew)
-                board[f'{fileinputdict[piece[0]]}{piece[1]}'] = ogx
-                print("Please play a legal move to not be in check")
-                time.sleep(1)
-                Pieceinput()
-
-            difnew = '68'
-            board.pop('88')
-            board[difnew] = 'bR'
-
-            print('Black castled')
-            with open('GameHistory.txt', 'a') as enter_games:
-                ogfile = fileinputdict[piece[0]] #First number is file (a file, b file, c file etc)
-                ogrank = piece[-1]
-                enter_games.write(f'{ogfile}{ogrank}bk')
-            time.sleep(1)
-            print_chessboard(board)
-            time.sleep(1)
-            bkingmoved = True
-            start()
-
-        if castlebq == True and f'{fileinputdict[new[0]]}{new[-1]}' == '38' and bqrookmoved == False:
-            # Execute black queen-side castling when legal
-            checktest(False)
-            for a in check_moves:
-                secondValueList.append(a[-1])
-            if 'd8' in secondValueList:
-                print("Check")
-                time.sleep(1)
-                print("Please play a legal move to not be in check")
-                time.sleep(1)
-                Pieceinput()
-
-            difnew = '38'
-            board.pop('58')
-            board[difnew] = ogx
-            
-            checktest(False)
-            for a in check_moves:
-                secondValueList.append(a[-1])
-            if f'{filecondict[int(selfking[0])]}{selfking[-1]}' in secondValueList:
-
-                print("Check")
-                time.sleep(1)
-                board.pop(difnew)
-                board[f'{fileinputdict[piece[0]]}{piece[1]}'] = ogx
-                print("Please play a legal move to not be in check")
-                time.sleep(1)
-                Pieceinput()
-
-            difnew = '48'
-            board.pop('18')
-            board[difnew] = 'bR'
-
-            print('Black castled')
-            with open('GameHistory.txt', 'a') as enter_games:
-                ogfile = fileinputdict[piece[0]] #First number is file (a file, b file, c file etc)
-                ogrank = piece[-1]
-                enter_games.write(f'{ogfile}{ogrank}bq')
-            time.sleep(1)
-            print_chessboard(board)
-            time.sleep(1)
-            bkingmoved = True
-            start()
-
-        if new in enpassant_moves:
-
-            # Resolve en passant capture by removing the passed pawn and placing ours diagonally
-            difnew = f'{fileinputdict[new[0]]}{new[1]}'
-            board.pop(f'{fileinputdict[piece[0]]}{piece[1]}')
-            if x[0] == 'w':
-                board.pop(f'{fileinputdict[new[0]]}{int(new[-1])-1}')
-            if x[0] == 'b':
-                board.pop(f'{fileinputdict[new[0]]}{int(new[-1])+1}')
-            board[difnew] = ogx
-
-            checktest(False)
-            for a in check_moves:
-                secondValueList.append(a[-1])
-            if f'{filecondict[int(selfking[0])]}{selfking[-1]}' in secondValueList:
-
-                print("Check")
-                time.sleep(1)
-                board.pop(difnew)
-                board[f'{fileinputdict[piece[0]]}{piece[1]}'] = ogx
-                if x[0] == 'w':
-                    board[f'{fileinputdict[new[0]]}{int(new[-1])+1}'] = 'bP'
-                if x[0] == 'b':
-                    board[f'{fileinputdict[new[0]]}{int(new[-1])-1}'] = 'wP'
-
-                print("Please play a legal move to not be in check")
-                time.sleep(1)
-                Pieceinput()
-
-            print(f'The {name} has been moved to {new}')
-            with open('GameHistory.txt', 'a') as enter_games:
-                ogfile = fileinputdict[piece[0]] #First number is file (a file, b file, c file etc)
-                ogrank = piece[-1]
-                if whom == True:
-                    enter_games.write(f'{ogfile}{ogrank}{fileinputdict[new[0]]}e')
-                if whom == False:
-                    enter_games.write(f'{ogfile}{ogrank}{fileinputdict[new[0]]}E')
-            time.sleep(1)
-            print_chessboard(board)
-            time.sleep(1)
-            start()
-
-        if new in possible_moves:
-
-            # Default movement path: update board, handle promotion flags, and ensure move is legal
-            if ogx == 'wP' and new[-1] == '8' or ogx == 'bP' and new[-1] == '1':
-                promotion()
-
-            difnew = f'{fileinputdict[new[0]]}{new[1]}'
-            board.pop(f'{fileinputdict[piece[0]]}{piece[1]}')
-            board[difnew] = ogx
-            checktest(False)
-            for a in check_moves:
-                secondValueList.append(a[-1])
-            if f'{filecondict[int(selfking[0])]}{selfking[-1]}' in secondValueList:
-
-                print("Check")
-                time.sleep(1)
-                board.pop(difnew)
-                board[f'{fileinputdict[piece[0]]}{piece[1]}'] = ogx
-                print("Please play a legal move to not be in check")
-                time.sleep(1)
-                Pieceinput()
-                
-            if name == 'King':
-                if whom == True:
-                    wkingmoved = True
-                else:
-                    bkingmoved = True
-            
-            if name == 'Rook':
-                if f'{file}{rank}' == '11' and x[0] == 'w':
-                    wqrookmoved = True
-                if f'{file}{rank}' == '81' and x[0] == 'w':
-                    wkrookmoved = True
-                if f'{file}{rank}' == '18' and x[0] == 'b':
-                    bqrookmoved = True
-                if f'{file}{rank}' == '88' and x[0] == 'b':
-                    bkrookmoved = True
-
-            print(f'The {name} has been moved to {new}')
-            with open('GameHistory.txt', 'a') as enter_games:
-                # Record the move in the compact history notation for later replay
-                if prom == True:
-                    ogfile = fileinputdict[piece[0]] #First number is file (a file, b file, c file etc)
-                    ogrank = piece[-1]
-                    enter_games.write(f'{ogfile}{ogrank}{fileinputdict[new[0]]}{prop}')
-                else:
-                    ogfile = fileinputdict[piece[0]] #First number is file (a file, b file, c file etc)
-                    ogrank = piece[-1]
-                    enter_games.write(f'{ogfile}{ogrank}{fileinputdict[new[0]]}{new[-1]}')
-
-            time.sleep(1)
-            print_chessboard(board)
-            time.sleep(1)
-            start()
-                
-        else:
+    # Handle the target square entry, enforce special move rules, and finalize the move; False sends the player back to choosing a piece
+    while True:
+        new = input("What square do you wish to move this piece? ").lower()
+        pause(1)
+        if new == "cancel":
+            # Give players a way to re-select a piece
+            return False
+        if new == "hint":
+            hint()
+            continue
+        if new not in SQUARE_INDEX:
+            # Guard against malformed destination coordinates
+            print("Unreadable syntax, please re-enter the square you would like in Algebraic notation, or else, enter cancel")
+            continue
+
+        move = None
+        for candidate in piece_moves:
+            if SQUARE_NAMES[candidate >> 6 & 63] == new:
+                move = candidate
+                break
+        if move is None:
             # Destination square rejected; ask for another
             print("Not a possible move dummy")
-            news()
+            continue
+        if move not in ponderer.facts_for(board)[0]:
+            # Castling out of or through check, or any move that leaves the king attacked, is refused
+            print("Check")
+            pause(1)
+            print("Please play a legal move to not be in check")
+            pause(1)
+            return False
+        if move >> 12 >= FLAG_PROMOTION:
+            promotion()
+            move = (move & 0xFFF) | (FLAG_PROMOTION + 'NBRQ'.index(ogx[-1])) << 12
+
+        record_move(move)
+        return True
+
+def record_move(move):
+    # Log a move to GameHistory.txt, play it and show the board; shared by human and computer moves
+    ponderer.stop()
+    side = board.side
+    with open('GameHistory.txt', 'a') as enter_games:
+        # Record the move in the compact history notation for later replay
+        enter_games.write(history_token(move, side))
+    board.make_move(move)
+    if move >> 12 == FLAG_CASTLE:
+        print('White castled' if side == WHITE else 'Black castled')
+    else:
+        print(f'The {name} has been moved to {SQUARE_NAMES[move >> 6 & 63]}')
+    pause(1)
+    print_chessboard(board)
+    pause(1)
+
+def computer_move():
+    # Let the search choose the computer's move within its budget, report how hard it worked, then play it like a human move
+    global name
+    ponderer.stop()
+    book = get_book()
+    move = book.pick(board) if book else None
+    if move is not None:
+        name = PIECE_NAMES[board.squares[move & 63] % 6]
+        print(f'{COMPUTER_NAME} plays {move_text(move)} from the opening book')
+        pause(1)
+        record_move(move)
+        return
+    move = tablebase_move(board)
+    if move is not None:
+        name = PIECE_NAMES[board.squares[move & 63] % 6]
+        print(f'{COMPUTER_NAME} plays {move_text(move)} from the endgame tablebase')
+        pause(1)
+        record_move(move)
+        return
+    search = ponderer.reply_for(board)
+    if search:
+        # Already worked out while the player was typing, with the full budget
+        move = search.best
+        name = PIECE_NAMES[board.squares[move & 63] % 6]
+        print(f'{COMPUTER_NAME} plays {move_text(move)} at once (pondered: depth {search.depth}, {search.nodes:,} nodes, {search.nps():,} nodes/s)')
+        pause(1)
+        record_move(move)
+        return
+    search, nodes = parallel_search(board, COMPUTER_WORKERS, computer_table, max_time=computer_time, max_nodes=COMPUTER_MOVE_NODES, nnue=computer_nnue)
+    move = search.best
+    name = PIECE_NAMES[board.squares[move & 63] % 6]
+    print(f'{COMPUTER_NAME} plays {move_text(move)} after {search.elapsed:.2f}s (depth {search.depth}, {nodes:,} nodes, {int(nodes / max(search.elapsed, 1e-9)):,} nodes/s)')
+    pause(1)
+    record_move(move)
 
 def login(): #Check the players login
-    # Validate submitted username/password pair and load the player's rating
+    # Validate submitted username/password pair and load the player's rating; False when the account was not found
     global p1ready
     global p2ready
     global word
     global p1name
     global p2name
     username = input("Enter your username; ")  #Ask for username
-    time.sleep(1)
+    pause(1)
     password = input("Enter your password; ") #Ask for password
     with open('Login.txt') as f:
         if f'{username}, {password}¿' in f.read(): #Look for these two together in the login doc, and, if found;
@@ -1593,10 +3032,11 @@ def login(): #Check the players login
                 rat = oldstuff
             print(f'Success, welcome {username}, {who}') #Print a success
             print(f"You have a rating of {rat} ")
-            
+            return True
+
         else: #Accout not found
             print("Sorry, this account does not exist, please resubmit your username and password, or create a new account") 
-            entry()   #Restart their entry          
+            return False   #entry() asks again          
 
 def signup(): #Let the player sign up
     # Create a new account, persisting credentials and initial stat lines
@@ -1604,69 +3044,134 @@ def signup(): #Let the player sign up
     global p2ready
     global p1name
     global p2name
-    with open('Login.txt') as f:
+    while True: #Ask again until the username is free and usable
+        with open('Login.txt') as f:
             newusername = input("Enter a new username: ") #input a new username
-            time.sleep(1)
+            pause(1)
             if f'{newusername}' in f.read(): #If it is already found on the document;
                 print("Sorry, this username is taken, please select a new one") #Tell them to change it
-                signup() #Restart the signup
             elif ',' in newusername or '¿' in newusername or ';' in newusername: #commas break detection of username in other documents
                 print("Sorry, no commas, upside down question marks or semicolons are permitted in your username")
-                signup()
-            if (who == "White player" and p1ready == False) or (who == "Black player" and p2ready == False): #If we are looking for player 1 and they are not already in OR we are looking for player 2 and they are not already in then continue;
-                newpassword = input("Now make a password: ") #Input password
-                fileop = open('Login.txt', 'a+') #Open doc to append
-                fileop.write (f"\n{newusername}, {newpassword}¿") #Write in the combo of their username and password
-                if who == "White player": #If the person logging in is p1
-                    p1name = newusername #Set those  variables to be their name and password
-                    p1ready = True #State boolean to say they are ready
-                elif who == "Black player": #Likewise for player 2
-                    p2name =  newusername #Set those  variables to be their name and password
-                    p2ready = True
-                print(f"Success, welcome {newusername}, {who}") #Welcome them
-                print("Your rating is 100")
-                fileop = open('Wins.txt', 'a+') 
-                fileop.write (f"\n{newusername},0")
-                fileop = open('Loss.txt', 'a+') 
-                fileop.write (f"\n{newusername},0") 
-                fileop = open('Draw.txt', 'a+') 
-                fileop.write (f"\n{newusername},0")
-                fileop = open('Elo.txt', 'a+') 
-                fileop.write (f"\n{newusername},100")
+            else:
+                break
+    if (who == "White player" and p1ready == False) or (who == "Black player" and p2ready == False): #If we are looking for player 1 and they are not already in OR we are looking for player 2 and they are not already in then continue;
+        newpassword = input("Now make a password: ") #Input password
+        fileop = open('Login.txt', 'a+') #Open doc to append
+        fileop.write (f"\n{newusername}, {newpassword}¿") #Write in the combo of their username and password
+        if who == "White player": #If the person logging in is p1
+            p1name = newusername #Set those  variables to be their name and password
+            p1ready = True #State boolean to say they are ready
+        elif who == "Black player": #Likewise for player 2
+            p2name =  newusername #Set those  variables to be their name and password
+            p2ready = True
+        print(f"Success, welcome {newusername}, {who}") #Welcome them
+        print("Your rating is 100")
+        fileop = open('Wins.txt', 'a+') 
+        fileop.write (f"\n{newusername},0")
+        fileop = open('Loss.txt', 'a+') 
+        fileop.write (f"\n{newusername},0") 
+        fileop = open('Draw.txt', 'a+') 
+        fileop.write (f"\n{newusername},0")
+        fileop = open('Elo.txt', 'a+') 
+        fileop.write (f"\n{newusername},100")
 
 def entry(): # At the start of the game, offers the choice of entry to the player
     # Loop until the user chooses login or signup for their seat
-    New = input(f"{who}: Login or Signup; ").lower() #Inputs whether to login or signup, not case sensitive
-    if New == "login": # If they login;
-        login() #Direct to login function
-    elif New == "signup":  # If they signup;
-        signup() # Direct to signup function
-    else:
-        entry() #If they do a dumb answer restart this entry
+    while True:
+        New = input(f"{who}: Login or Signup; ").lower() #Inputs whether to login or signup, not case sensitive
+        if New == "login": # If they login;
+            if login(): #Direct to login function
+                return
+        elif New == "signup":  # If they signup;
+            signup() # Direct to signup function
+            return
+        #If they do a dumb answer, or the login failed, ask again
 
 def playgame(): #Starts the P1 and P2 login / signup sequence
     # Reset the board, fetch both players, then kick off a new game session
-    setboard()
+    global board
+    board = setboard()
     global who
     global p1ready
     global p2ready
-    time.sleep(1)
-    print("Get 2 players to play!")
-    time.sleep(1)
-    who = "White player"
+    global computer_side
+    computer_side = None
+    pause(1)
     p1ready = False
     p2ready = False
-    entry()
-    who = "Black player"
-    entry()
+    opponent = input("Would you like to play;\n1. Against another player\n2. Against the computer\n")
+    if opponent == '2':
+        computer_setup()
+    else:
+        print("Get 2 players to play!")
+        pause(1)
+        who = "White player"
+        entry()
+        who = "Black player"
+        entry()
     if p1ready == True and p2ready == True: #If both players are ready start
         begin() #Play begin sequence
 
+def computer_account(name=COMPUTER_NAME):
+    # Make sure a computer player has a login and stat lines, so games against it are rated and counted like any other
+    with open('Login.txt') as f:
+        found = f.read()
+        if f'{name}, ' not in found:
+            # Nobody is meant to log in as the computer, so its password is random
+            fileop = open('Login.txt', 'a+')
+            fileop.write(f"{chr(10) if found else ''}{name}, {random.getrandbits(64):016x}¿")
+    for dox, first in (('Wins.txt', '0'), ('Loss.txt', '0'), ('Draw.txt', '0'), ('Elo.txt', '100')):
+        with open(dox) as f:
+            found = f.read()
+            if f'{name},' not in found:
+                # A brand new file (a self-play output directory) gets no blank first line
+                fileop = open(dox, 'a+')
+                fileop.write(f"{chr(10) if found else ''}{name},{first}")
+
+def computer_setup():
+    # Seat one player against the computer: pick colours, log the player in, and set the computer's thinking time
+    global who
+    global p1name
+    global p2name
+    global p1ready
+    global p2ready
+    global computer_side
+    global computer_time
+    global computer_table
+    global computer_nnue
+    computer_account()
+    if COMPUTER_NNUE and computer_nnue is None:
+        computer_nnue = NNUEEvaluator.load(COMPUTER_NNUE)
+    if computer_table:
+        computer_table.close()
+    computer_table = TranspositionTable(COMPUTER_HASH_MB, shared=COMPUTER_WORKERS > 1)
+    colour = input("Would you like to play White or Black (W or B)? ").lower()
+    if colour == 'b':
+        who = "Black player"
+        computer_side = WHITE
+        p1name = COMPUTER_NAME
+        p1ready = True
+    else:
+        who = "White player"
+        computer_side = BLACK
+        p2name = COMPUTER_NAME
+        p2ready = True
+    entry()
+    seconds = input(f"How many seconds may {COMPUTER_NAME} think per move (press enter for {COMPUTER_MOVE_TIME:g})? ")
+    try:
+        computer_time = max(float(seconds), 0.05)
+    except ValueError:
+        computer_time = COMPUTER_MOVE_TIME
+
+class BackToMenu(Exception):
+    # Raised by "cancel" anywhere in the tutorials; the menu loop in choices() catches it
+    pass
+
 def want_to_continue():
     # Common prompt gate used by the tutorial sections to pace the narration
     usercon = input("Press enter to proceed ")
     if "cancel" in usercon:
-        choices()
+        raise BackToMenu
     if "" in usercon:
         return True
 
@@ -1674,11 +3179,11 @@ def learn_pieces(LearnedPiece,Value,PossibleMoves,VisMoves):
     # Educational helper that displays piece values and example move patterns
     if want_to_continue() == True:
         print(f"The {LearnedPiece} is worth {Value}")
-        time.sleep(1)
+        pause(1)
         print(f"The {LearnedPiece} can move {PossibleMoves}")
-        time.sleep(1)
+        pause(1)
         print("This is illustrated by the board;")
-        time.sleep(1)
+        pause(1)
         print(VisMoves)
         print("   ----------------")
         print("    a b c d e f g h")
@@ -1687,31 +3192,31 @@ def check_or_stale(teach,info,matepositions):
     # Show an explanatory scenario for check or stalemate, depending on `teach`
     if want_to_continue() == True:
         print(info)
-        time.sleep(2)
+        pause(2)
         print(f"This is an example of a {teach}... it is white's move and they are {teach}d")
-        time.sleep(1)
+        pause(1)
         print(matepositions)
         print("   ----------------")
         print("    a b c d e f g h")
-        time.sleep(2)
+        pause(2)
 
 def special_moves(special,info,specialpositions1,specialpositions2):
     # Walk through the narrative and board state change for a special move (castle, en passant, etc.)
     if want_to_continue() == True:
         print(f"This special move is {special}")
-        time.sleep(1)
+        pause(1)
         print(info)
-        time.sleep(2)
+        pause(2)
         print(f"An example of when {special} is applicable is illustrated below")
-        time.sleep(1)
+        pause(1)
         print("It is white's move")
-        time.sleep(1)
+        pause(1)
         print(specialpositions1)
         print("   ----------------")
         print("    a b c d e f g h")
-        time.sleep(2)
+        pause(2)
         print(f"After playing {special}, the position now becomes")
-        time.sleep(1)
+        pause(1)
         print(specialpositions2)
         print("   ----------------")
         print("    a b c d e f g h")
@@ -1719,22 +3224,22 @@ def special_moves(special,info,specialpositions1,specialpositions2):
 def new_to_chess():
         # Provide a scripted walkthrough of chess fundamentals for new players
         if want_to_continue() == True:
-            time.sleep(1)
+            pause(1)
             print("Chess is played on an 8x8 grid")
-            time.sleep(1)
+            pause(1)
             print("letters indicate the file, or x coordinate, and numbers indicate the rank, or y coordinate")
-            time.sleep(1)
+            pause(1)
             print("8 | . . . . . . . . \n7 | . . . . . . . . \n6 | . . . . . . . . \n5 | . . . . . . . . \n4 | . . . . . . . . \n3 | . . . . . . . . \n2 | . . . . . . . . \n1 | . . . . . . . . ")
             print("   ----------------")
             print("    a b c d e f g h")
         if want_to_continue() == True:
-                time.sleep(1)
+                pause(1)
                 print("Chess is a two player game, played by the white (♖) and black (♜) pieces")    
-                time.sleep(1)
+                pause(1)
                 print("Each side has 16 pieces, worth different point values. They are;\nPawn(x8): ♙ (worth 1 point)\nRook(x2): ♖ (worth 5 points)\nKnight(x2): ♘ (worth 3 points)\nBishop(x2): ♗ (worth 3 points)\nQueen(x1): ♕ (worth 9 points)\nKing(x1): ♔ (worth the entire game)")
-                time.sleep(3)
+                pause(3)
                 print("They are set up on the board at the start of the game like so;")
-                time.sleep(1)
+                pause(1)
                 print("8 | ♜ ♞ ♝ ♛ ♚ ♝ ♞ ♜ \n7 | ♟ ♟ ♟ ♟ ♟ ♟ ♟ ♟ \n6 | . . . . . . . . \n5 | . . . . . . . . \n4 | . . . . . . . . \n3 | . . . . . . . . \n2 | ♙ ♙ ♙ ♙ ♙ ♙ ♙ ♙ \n1 | ♖ ♘ ♗ ♕ ♔ ♗ ♘ ♖ ")
                 print("   ----------------")
                 print("    a b c d e f g h")
@@ -1746,122 +3251,122 @@ def new_to_chess():
                 learn_pieces('Knight','Three points','Two squares in one direction, and then one square in a direction at 90° angle, like an L\nIt is the only piece that can jump over pieces, and it can be pieces of any colour',"8 | . . . . . . . . \n7 | . . . . . . . . \n6 | . . . o . o . . \n5 | . . o . . . o . \n4 | . . . . ♘ . . . \n3 | . . o . . . o . \n2 | . . . o . o . . \n1 | . . . . . . . . ")
                 learn_pieces('Pawn','One point','only forward one square, except on their first move, when they can move forward two squares\nA pawn can only take a piece diagonally forward, but otherwise it cannot move diagonally',"8 | . . . . . . . . \n7 | . . . . . . . . \n6 | . o . . . . . . \n5 | . ♙ . . . . . . \n4 | . . . . o . . . \n3 | . . . . o . . . \n2 | . . . . ♙ . . . \n1 | . . . . . . . . ")
                 if want_to_continue() == True:
-                    time.sleep(1)
+                    pause(1)
                     print("To win a chess game, you must put your opponent in checkmate")
-                    time.sleep(1)
+                    pause(1)
                     print("A check is where you attack your opponents king")
-                    time.sleep(1)
+                    pause(1)
                     print("If you are in check, you must end your turn without being in check, ie, your king can no longer be taken")
-                    time.sleep(1)
+                    pause(1)
                     print("If it is your move and you can take your opponent's king, there move is an illegal move")
-                    time.sleep(1)
+                    pause(1)
                     print("These are all the legal moves in this position for white;")
-                    time.sleep(1)
+                    pause(1)
                     print("8 | . . . . . . . . \n7 | . . . ♛ . . . . \n6 | . . . o . . . . \n5 | . . o . . . . . \n4 | . . o ♔ . ♗ . . \n3 | . . o o . . . . \n2 | . . . . . . . . \n1 | ♚ . . . ♜ . . . ")
-                    time.sleep(1)
+                    pause(1)
                     print("Note that when you are in check you can either;\nTake the piece giving check\nBlock the pieces line of attack towards the king (not for Knights)\nMove the king away")
-                    time.sleep(2)
+                    pause(2)
                     check_or_stale('checkmate',"If you cannot do any of these, meaning that every single possible move on the board will end your turn still in check, it is checkmate, and you lose","8 | . . . . . . . . \n7 | . . . . . . . . \n6 | . . . . . . . . \n5 | . . . . . . . . \n4 | . . . . . . . . \n3 | . . . ♚ . . . . \n2 | . . . ♛ . . . . \n1 | . . . ♔ . . . . ")
                     check_or_stale('stalemate',"If, all of your legal moves result in you ending your turn in check, but you are not currently in check, it is called a stalemate, and it is a draw","8 | . . . . . . . . \n7 | . . . . . . . . \n6 | . . . . . . . . \n5 | . . . . . . . . \n4 | . . . . . . . . \n3 | . . . ♚ . . . . \n2 | . . . . . ♛ . . \n1 | . . . . . . . ♔ ")
                     print("Both players may also mutually agree to a draw")
                     if want_to_continue() == True:
-                        time.sleep(1)
+                        pause(1)
                         print("There are a few special moves in chess which are important to learn")
-                        time.sleep(1)
+                        pause(1)
                         special_moves('castling','Castling occurs as a double move of the king, and a move with the rook.\nCastling is only allowed if the king has not moved yet, and the rook being castled with has not either.\nThe king moves two squares horizontally towards the rook, and the rook jumps over the king and lands next to it.\nYou may not castle through check, meaning if the king were to stop partway through, it would not be in check, neither can you castle to escape from check',"8 | . . . ♚ . . . . \n7 | . . . . . . . . \n6 | . . . . . . . . \n5 | . . . . . . . . \n4 | . . . . . . . . \n3 | . . . . . . . . \n2 | . . . . . . . . \n1 | . . . . ♔ . . ♖ ","8 | . . . ♚ . . . . \n7 | . . . . . . . . \n6 | . . . . . . . . \n5 | . . . . . . . . \n4 | . . . . . . . . \n3 | . . . . . . . . \n2 | . . . . . . . . \n1 | . . . . . ♖ ♔ . ")
                         special_moves('En passant','En passant occurs between two pawns.\nIf a pawn moves two squares upwards, and it is directly next to a pawn from the opposition, they may capture the pawn as if it had moved one square\nIt is important to note that this capture is only avalaible for one move',"8 | . . . . ♚ . . . \n7 | . . . . . . . . \n6 | . . . . . . . . \n5 | . . . . . ♙ ♟ . \n4 | . . . . . . . . \n3 | . . . . . . . . \n2 | . . . . . . . . \n1 | . . . . ♔ . . . ","8 | . . . . ♚ . . . \n7 | . . . . . . . . \n6 | . . . . . . ♙ . \n5 | . . . . . . . . \n4 | . . . . . . . . \n3 | . . . . . . . . \n2 | . . . . . . . . \n1 | . . . . ♔ . . . ")
                         special_moves('Promotion','Promotion occurs when a pawn reaches the last rank\n If it is a white pawn, the eigth rank, if it is a black pawn, the first rank\nThat pawn instantly becomes transformed into a piece of your choice, either a knight, bishop, rook or queen',"8 | . . . . ♚ . . . \n7 | ♙ . . . . . . . \n6 | . . . . . . . . \n5 | . . . . . . . . \n4 | . . . . . . . . \n3 | . . . . . . . . \n2 | . . . . . . . . \n1 | . . . . ♔ . . . ","8 | ♕ . . . ♚ . . . \n7 | . . . . . . . . \n6 | . . . . . . . . \n5 | . . . . . . . . \n4 | . . . . . . . . \n3 | . . . . . . . . \n2 | . . . . . . . . \n1 | . . . . ♔ . . . ")
                         if want_to_continue() == True:
-                            time.sleep(1)
+                            pause(1)
                             print("Finally, some other general information about playing chess")
-                            time.sleep(1)
+                            pause(1)
                             print("Each turn, you may move one piece (except when castling) to a legal square")
-                            time.sleep(1)
+                            pause(1)
                             print("It is now your opponents turn")
-                            time.sleep(1)
+                            pause(1)
                             print("The player with the white pieces always plays the first move")
-                            time.sleep(1)
+                            pause(1)
                             print("Each player will be given a rating upon creating an account")
-                            time.sleep(1)
+                            pause(1)
                             print("You will gain points for a win, and lose points for a loss")
-                            time.sleep(1)
+                            pause(1)
                             print("If you play someone with a much higher rating, a win will give you a lot more points then a loss would lose points")
-                            time.sleep(1)
+                            pause(1)
                             print("Similarly, by playing a much worse opponent, if you win, you will go up a lot less than the amount you would lose if you lost")
-                            time.sleep(1)
+                            pause(1)
                             print("And thats it! Those are the rules of chess, good luck!")
 
 def new_to_website():
     if want_to_continue() == True:
-        time.sleep(1)
+        pause(1)
         print("This is an offline chess website, two player play each other over one device")
-        time.sleep(1)
+        pause(1)
         print("To start a game, select the choice to play a game")
-        time.sleep(1)
+        pause(1)
         print("To select something, state the number it is listed as and press enter")
-        time.sleep(1)
+        pause(1)
         print("You may, at any time you are asked to proceed, enter cancel to return to the original choices")
         if want_to_continue() == True:
             print("When playing, there are a few things that you must take into consideration")
-            time.sleep(1)
+            pause(1)
             print("To make a move, first, state the square of the piece you wish to move, in algebraic notation")
-            time.sleep(1)
+            pause(1)
             print("Algebraic notaiton is the letter of the file it is on, followed by the number of the rank")
-            time.sleep(1)
+            pause(1)
             print("8 | . . . . . . . . \n7 | . . . . . . . . \n6 | . . . . . . ▲ . \n5 | . . . . . . . . \n4 | . . . . . . . . \n3 | . . o . . . . . \n2 | . . . . . x . . \n1 | . . . . . . . . ")
             print("   ----------------")
             print("    a b c d e f g h")
-            time.sleep(2)
+            pause(2)
             print("The ▲ is on g6")
-            time.sleep(1)
+            pause(1)
             print("The o is on c3")
-            time.sleep(1)
+            pause(1)
             print("The x is on f2")
-            time.sleep(1)
+            pause(1)
             print("Enter the square the piece is on to select it, in the same form as above")
             if want_to_continue() == True:
-                time.sleep(1)
+                pause(1)
                 print("Once you have selected a piece, you may then select a legal square that the piece can move to, and enter it in in the same way you selected the piece")
-                time.sleep(1)
+                pause(1)
                 print("The piece will be moved there and your turn will end")
                 if want_to_continue() == True:
-                    time.sleep(1)
+                    pause(1)
                     print("To offer a draw, instead of selecting a piece, type in draw instead. Your opponent will then decide whether they agree to draw or not")
-                    time.sleep(1)
+                    pause(1)
                     print("Similarly, to resign, simply type the word resign instead of selecting a piece")
-                    time.sleep(1)
+                    pause(1)
                     print("Whenever you are asked a yes or no question (e.g. accepting a draw), please respond with either a Y or N")
-                    time.sleep(1)
+                    pause(1)
                     print("Any invalid syntax entered will not be recognised and you will have to resubmit")
                     if want_to_continue() == True:
-                        time.sleep(1)
+                        pause(1)
                         print("To play a game, login to your account, or create a new one")
-                        time.sleep(1)
+                        pause(1)
                         print("Enter / make the appropriate details and don't forget them!")
-                        time.sleep(1)
+                        pause(1)
                         print("And thats it! Try out the website and play your friends.")
 
 def get_rules():
     # Prompt the user for which tutorial set to launch
     print("RULES")
-    time.sleep(1)
-    choice = input("Do you wish to learn;\n1. Rules of chess\n2. Rules of the website\n3. Rules of both\n")
-    time.sleep(1)
-    if choice.lower() == '1':
-        new_to_chess()
-        choices()                
-    elif choice.lower() == '2':
-        new_to_website()
-        choices()
-    elif choice.lower() == '3':
-        new_to_chess()
-        new_to_website()
-        choices()
-    elif choice.lower() == 'back' or 'cancel':
-        choices()
-    else:
-        print("Invalid syntax, please respond with the number of the option you wish to choose")
-        get_rules()
+    pause(1)
+    while True:
+        choice = input("Do you wish to learn;\n1. Rules of chess\n2. Rules of the website\n3. Rules of both\n")
+        pause(1)
+        if choice.lower() == '1':
+            new_to_chess()
+            return
+        elif choice.lower() == '2':
+            new_to_website()
+            return
+        elif choice.lower() == '3':
+            new_to_chess()
+            new_to_website()
+            return
+        elif choice.lower() in ('back', 'cancel'):
+            return
+        else:
+            print("Invalid syntax, please respond with the number of the option you wish to choose")
 
 def statlook(stat,speaking):
     # Fetch a particular stat line for the authenticated user and print with a label
@@ -1879,14 +3384,11 @@ def statlook(stat,speaking):
 
 def database():
     # Replay and display a chosen game from the history log for the logged-in user
-    setboard()
+    board = setboard()
     print('\n')
     word1 = uzername #Sets the key word to be found
     noposgames = []
     yesposgames = []
-    mylist = []
-    listpi1 = []
-    listpi2 = []
     nogames = 0
     with open('GameHistory.txt', 'r') as fp: #Open the designated document
         lines = fp.readlines()
@@ -1913,66 +3415,17 @@ def database():
                             games = fakegam.split('¿')[0]
                             res = fakegam.split('¿')[-1]
 
-                            for z in games[0::2]:
-                                listpi1.append(z)
-                            for i in games[1::2]:
-                                listpi2.append(i)
-                            for a in range(int(len(games)/2)):
-                                mylist.append(f'{listpi1[a]}{listpi2[a]}')
-                            selormov = 0
-                            for simpie in mylist:
-                                    # Reconstruct the board by applying recorded moves in sequence
-                                    selormov += 1
-                                    if selormov % 2 != 0:
-                                        picsim = board[simpie]
-                                        board.pop(simpie)
-                                    
-                                    else:
-
-                                        if simpie == 'wk':
-                                            # Special tokens represent castling events
-                                            board.pop('81')
-                                            board['71'] = 'wK'
-                                            board['61'] = 'wR'
-                                        if simpie == 'wq':
-                                            board.pop('11')
-                                            board['31'] = 'wK'
-                                            board['41'] = 'wR'
-                                        if simpie == 'bk':
-                                            board.pop('88')
-                                            board['78'] = 'bK'
-                                            board['68'] = 'bR'
-                                        if simpie == 'bq':
-                                            board.pop('18')
-                                            board['38'] = 'bK'
-                                            board['48'] = 'bR'
-
-                                        if (simpie[-1] == 'q' or simpie[-1] == 'r' or simpie[-1] =='b' or simpie[-1] =='n') and (simpie[0] != 'w' or simpie[0] != 'b'):
-                                            # Lowercase markers mean a white pawn promoted on that file
-                                            prompic = str(simpie[-1]).upper()
-                                            promfil = simpie[0]
-                                            board[f'{promfil}8'] = f'w{prompic}'
-                                            
-                                        if (simpie[-1] == 'Q' or simpie[-1] == 'R' or simpie[-1] =='B' or simpie[-1] =='N') and (simpie[0] != 'w' or simpie[0] != 'b'):
-                                            # Uppercase markers mean a black pawn promotion
-                                            prompic = str(simpie[-1]).upper()
-                                            promfil = simpie[0]
-                                            board[f'{promfil}1'] = f'b{prompic}'
-                                        
-                                        if simpie[-1] == 'e':
-                                            # Lowercase e/E encode en passant captures in the log
-                                            board.pop(f'{simpie[0]}5')
-                                            board[f'{simpie[0]}6'] = 'wP'
-
-                                        if simpie[-1] == 'E':
-                                            board.pop(f'{simpie[0]}4')
-                                            board[f'{simpie[0]}3'] = 'bP'
-
-                                        board[simpie] = picsim
-                                        if want_to_continue() == True:
-                                            print_chessboard(board)
-                                        time.sleep(1)
-                                        
+                            for a in range(0, len(games) - 3, 4):
+                                # Reconstruct the board by applying recorded moves in sequence
+                                move = history_move(board, games[a:a + 4])
+                                if move is None:
+                                    print("This game record could not be read any further")
+                                    break
+                                board.make_move(move)
+                                if want_to_continue() == True:
+                                    print_chessboard(board)
+                                pause(1)
+
                             print(res)
 
 def account_view():
@@ -1985,42 +3438,41 @@ def account_view():
     with open('Login.txt') as f:
         if f'{uzername}, {password}¿' in f.read(): 
             print(f'Success, welcome {uzername} \n')
-            time.sleep(1)
+            pause(1)
             w = statlook("Wins.txt","You have won ")
-            time.sleep(1)
+            pause(1)
             l = statlook("Loss.txt","You have lost ")
-            time.sleep(1)
+            pause(1)
             d = statlook("Draw.txt", "You have drawn ")
-            time.sleep(1)
+            pause(1)
             nogames = int(w)+int(l)+int(d)
             print(f"You have played {nogames}\n")
-            time.sleep(1)
+            pause(1)
             # Convert raw totals into a simple win percentage
             percentwins = int((int(w) / nogames) * 100)
             print(f"You have won {percentwins}% of your games\n")
-            time.sleep(1)
+            pause(1)
             statlook("Elo.txt","Your rating is ")
-            time.sleep(1)
+            pause(1)
             Look_at_games = input("Do you wish to look at your games database (Y or N)? ")
             if Look_at_games.lower() == 'y':
                 database()
-            choices()
 
         else: 
             print("Sorry, this account does not exist, please resubmit your username and password")
-            time.sleep(2)
-            choices() 
+            pause(2)
 
 def halloffame():
     # Rank players by Elo and print the top N entries requested by the user
-    deep = input("How many far down the rankings do you wish to go? ")
-    print('\n')
-    try:
-        int(deep)
-    except:
-        time.sleep(1)
-        print("Please enter a number")
-        halloffame()
+    while True:
+        deep = input("How many far down the rankings do you wish to go? ")
+        print('\n')
+        try:
+            int(deep)
+            break
+        except:
+            pause(1)
+            print("Please enter a number")
     halllist = []
     namlist = []
     with open('Elo.txt','r') as hall:
@@ -2044,35 +3496,38 @@ def halloffame():
         for nam in namlist:
             if hall == int(str(nam).split(',')[-1]):
                 print(f'{ranking}. {nam}')
-    choices()
 
 def choices():
-    # Root menu hub that routes the player to gameplay, tutorials, accounts, or rankings
-    time.sleep(1)
-    choice = input("Would you like to;\n1. Play a game\n2. See the rules\n3. View an account\n4. View the leaderboard\n")
-    if choice.lower() == '1':
-        playgame()
-    elif  choice.lower() == '2':
-        get_rules()
-    elif choice.lower() == '3':
-        account_view()
-    elif choice.lower() == '4':
-        print("Welcome to the global leaderboard")
-        time.sleep(1)
-        print("The top players are represented on the leaderboard")
-        time.sleep(1)
-        halloffame()
-    else:
-        time.sleep(1)
-        print("Invalid syntax, please respond with the number of the option you wish to choose")
-        choices()
+    # Root menu hub that routes the player to gameplay, tutorials, accounts, or rankings; every option returns here, so the menu is shown again by looping rather than by calling back in
+    while True:
+        ponderer.stop()
+        pause(1)
+        choice = input("Would you like to;\n1. Play a game\n2. See the rules\n3. View an account\n4. View the leaderboard\n")
+        try:
+            if choice.lower() == '1':
+                playgame()
+            elif  choice.lower() == '2':
+                get_rules()
+            elif choice.lower() == '3':
+                account_view()
+            elif choice.lower() == '4':
+                print("Welcome to the global leaderboard")
+                pause(1)
+                print("The top players are represented on the leaderboard")
+                pause(1)
+                halloffame()
+            else:
+                pause(1)
+                print("Invalid syntax, please respond with the number of the option you wish to choose")
+        except BackToMenu:
+            pass
 
 def openingAnimation():
     # Play the ASCII splash screen and a quick move animation before showing the menu
     OFFchess = '████▄ ▄████  ▄████      ▄█▄     ▄  █ ▄███▄     ▄▄▄▄▄    ▄▄▄▄▄ \n█   █ █▀   ▀ █▀   ▀     █▀ ▀▄  █   █ █▀   ▀   █     ▀▄ █     ▀▄ \n█   █ █▀▀    █▀▀        █   ▀  ██▀▀█ ██▄▄   ▄  ▀▀▀▀▄ ▄  ▀▀▀▀▄   \n▀████ █      █          █▄  ▄▀ █   █ █▄   ▄▀ ▀▄▄▄▄▀   ▀▄▄▄▄▀    \n       █      █         ▀███▀     █  ▀███▀                      \n        ▀      ▀                 ▀                              \n                                                                '
-    time.sleep(2)
+    pause(2)
     for i in range(9):
-        time.sleep(1)
+        pause(1)
         if i == 0:
             anim = "8 | ♜ ♞ ♝ ♛ ♚ ♝ ♞ ♜ \n7 | ♟ ♟ ♟ ♟ ♟ ♟ ♟ ♟ \n6 | . . . . . . . . \n5 | . . . . . . . . \n4 | . . . . . . . . \n3 | . . . . . . . . \n2 | ♙ ♙ ♙ ♙ ♙ ♙ ♙ ♙ \n1 | ♖ ♘ ♗ ♕ ♔ ♗ ♘ ♖ "
         if i == 1:
@@ -2098,38 +3553,613 @@ def openingAnimation():
         print("    a b c d e f g h")
     os.system('clear')
     print(OFFchess)
-    time.sleep(1)
+    pause(1)
     print("CHESS TIME")
-    time.sleep(2)
+    pause(2)
     print("Welcome to OFF Chess, on offline chess program")
     choices()
 
 def begin():
     # Final pre-game setup: show board, log matchup, and start the move loop
-    time.sleep(1)
+    pause(1)
     print("Get ready...")
-    time.sleep(1)
+    pause(1)
     print_chessboard(board)
-    time.sleep(1)
+    pause(1)
     with open('GameHistory.txt', 'a') as enter_games:
         enter_games.write(f'\n{p1name} VS {p2name} ({date.today()});')
-    start()
+    # One turn per pass until start() reports the game over; control then goes back to the menu loop
+    while start():
+        pass
+
+class ScriptedInput:
+    # Stands in for sys.stdin so a script of answers can play through the input() prompts, noting the call stack depth and traced memory at every prompt
+
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.depths = []
+        self.memory = []
+
+    def readline(self):
+        # input() reads one line per prompt; running out ends the script with EOFError
+        frame = sys._getframe()
+        depth = 0
+        while frame:
+            depth += 1
+            frame = frame.f_back
+        self.depths.append(depth)
+        if tracemalloc.is_tracing():
+            self.memory.append(tracemalloc.get_traced_memory()[0])
+        line = next(self.lines, None)
+        return '' if line is None else line + '\n'
+
+LOOP_BENCH_CYCLE = ['z9', 'g1', 'f3', 'g8', 'f6', 'f3', 'e9', 'g1', 'f6', 'cancel', 'f6', 'g8']
+
+#Four plies of knights going out and back, with a bad square, an unreadable destination and a cancelled piece choice along the way so the retry paths are played too
+
+BATCH_PLAYERS = re.compile(r'^\s*(.+?) VS (.+?)\s*;(.*)$')
+
+def batch_script(line, white, black):
+    # Read one game of a move script ("e2 e4 / e7 e5 / ... / resign", optionally after "White VS Black;") into the players, the answers the prompts expect and a GameSession that has already played it; raises ValueError on anything the game would refuse
+    found = BATCH_PLAYERS.match(line)
+    if found:
+        white, black, line = found.group(1), found.group(2), found.group(3)
+    session = GameSession(white, black)
+    answers = []
+    for number, step in enumerate((part.strip() for part in line.split('/') if part.strip()), 1):
+        words = step.lower().split()
+        if words in (['resign'], ['draw']):
+            if session.result:
+                raise ValueError(f'step {number}: {words[0]} after the game is over ({session.reason})')
+            # Confirm the resignation, or accept the draw for the other player
+            answers += [words[0], 'y']
+            getattr(session, words[0])()
+            continue
+        if len(words) == 2 and len(words[1]) == 3:
+            # e7 e8q: the destination square, then the promotion prompt
+            words = [words[0], words[1][:2], words[1][2]]
+        if len(words) not in (2, 3):
+            raise ValueError(f'step {number}: cannot read "{step}"')
+        try:
+            session.play(''.join(words))
+        except ValueError as error:
+            raise ValueError(f'step {number}: {error}') from None
+        answers += words
+    return white, black, answers, session
+
+def random_player(session, rng, depth):
+    # Any legal move
+    return rng.choice(session.moves)
+
+def greedy_player(session, rng, depth):
+    # The capture of the most valuable piece, taken with the least valuable one, or else any legal move
+    squares = session.board.squares
+    captures = [move for move in session.moves if squares[move >> 6 & 63] != EMPTY]
+    if not captures:
+        return rng.choice(session.moves)
+    return max(captures, key=lambda move: (PIECE_VALUES[squares[move >> 6 & 63] % 6], -PIECE_VALUES[squares[move & 63] % 6], rng.random()))
+
+def search_player(session, rng, depth):
+    # The alpha-beta search to a fixed depth, so a game depends only on its seed and not on the machine's speed
+    return Search(max_depth=depth).run(session.board)
+
+SELF_PLAY_PLAYERS = {'random': random_player, 'greedy': greedy_player, 'search': search_player}
+
+def self_play_name(kind, side):
+    # Account name for an automated player; the colour letter keeps the two sides apart when a kind plays itself, and no name is part of another
+    return f'{kind.capitalize()}Bot{"WB"[side]}'
+
+def _self_play_game(task):
+    # Worker side of the self-play harness: play one game from its seed and return its GameHistory.txt line, result and where the time went
+    seed, white, black, depth, max_plies = task
+    rng = random.Random(seed)
+    session = GameSession(self_play_name(white, WHITE), self_play_name(black, BLACK))
+    players = (SELF_PLAY_PLAYERS[white], SELF_PLAY_PLAYERS[black])
+    choosing = [0.0, 0.0]
+    rules = 0.0
+    while session.result is None:
+        if len(session.history) >= max_plies:
+            session.draw()
+            session.reason = 'move limit'
+            break
+        side = session.board.side
+        started = time.perf_counter()
+        move = players[side](session, rng, depth)
+        middle = time.perf_counter()
+        session.play(move)
+        rules += time.perf_counter() - middle
+        choosing[side] += middle - started
+    return seed, session.record(result=False), session.result, session.reason, len(session.history), choosing, rules
             
-global wkingmoved
-global bkingmoved
-global bkrookmoved
-global bqrookmoved
-global wkrookmoved
-global wqrookmoved
-global turns
-# Track castling eligibility and turn order flags across the session
-bkingmoved = False
-wkingmoved = False
-wkrookmoved = False
-wqrookmoved = False
-bkrookmoved = False
-bqrookmoved = False
-turns = 0
-setboard()
-# Show the splash screen and launch the interactive menu loop
-openingAnimation()
+def perft_command(args):
+    # Run perft from the command line: the reference suite, or a single position with optional divide output
+    movegen = MOVE_GENERATORS[args.generator]
+    if args.fen:
+        positions = [("custom", args.fen, [])]
+    else:
+        positions = PERFT_POSITIONS
+    failures = 0
+    total_nodes = 0
+    total_time = 0.0
+    for label, fen, expected in positions:
+        pos = Position(fen)
+        depth = args.depth or min(len(expected), 3)
+        started = time.perf_counter()
+        if args.workers > 1:
+            counts = parallel_perft(fen, depth, args.workers, args.generator, args.split_depth)
+        elif args.divide:
+            counts = divide(pos, depth, movegen)
+        else:
+            counts = [("", perft(pos, depth, movegen))]
+        elapsed = time.perf_counter() - started
+        if args.divide:
+            for text, count in counts:
+                print(f'{text}: {count}')
+        nodes = sum(count for text, count in counts)
+        if args.workers > 1 and args.compare_serial:
+            # Time the same count on one core so the speedup is measured on this machine
+            started = time.perf_counter()
+            perft(Position(fen), depth, movegen)
+            serial = time.perf_counter() - started
+            print(f'{label}: serial {serial:.2f}s, {args.workers} workers {elapsed:.2f}s, speedup {serial / max(elapsed, 1e-9):.2f}x')
+        total_nodes += nodes
+        total_time += elapsed
+        if depth <= len(expected):
+            verdict = "ok" if nodes == expected[depth - 1] else f"FAIL (expected {expected[depth - 1]})"
+            if nodes != expected[depth - 1]:
+                failures += 1
+        else:
+            verdict = "no reference count"
+        print(f'{label} depth {depth}: {nodes} nodes in {elapsed:.2f}s, {nodes / max(elapsed, 1e-9):,.0f} nodes/s, {verdict}')
+    print(f'{args.generator} generator: {total_nodes} nodes in {total_time:.2f}s, {total_nodes / max(total_time, 1e-9):,.0f} nodes/s')
+    return 1 if failures else 0
+
+def search_command(args):
+    # Search one position from the command line and report each iteration, so time-to-move and nodes per second can be measured on this machine
+    global EVAL_DEBUG
+    EVAL_DEBUG = args.verify_eval
+    pos = Position(args.fen)
+    table = TranspositionTable(args.hash, shared=args.workers > 1) if args.hash > 0 else None
+    try:
+        nnue = NNUEEvaluator.load(args.nnue) if args.nnue else None
+        search, nodes = parallel_search(pos, args.workers, table, args.time if args.time > 0 else None, args.nodes or None, args.depth or 64, search_report, nnue)
+        if search.best is None:
+            print('no legal moves')
+            return 1
+        print(f'best move {move_text(search.best)}: depth {search.depth}, {nodes:,} nodes in {search.elapsed:.2f}s, {int(nodes / max(search.elapsed, 1e-9)):,} nodes/s')
+        if table:
+            print(table.stats())
+        if not nnue:
+            print(search.pawns.stats())
+    finally:
+        if table:
+            table.close()
+    return 0
+
+SMP_BENCH_POSITIONS = [
+    ("startpos", START_FEN),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10"),
+]
+
+def smp_bench_command(args):
+    # Search a fixed set of positions for the same time at each worker count and report depth reached and nodes per second against one worker
+    counts = sorted({int(count) for count in args.workers.split(',')})
+    baseline = None
+    print(f'{os.cpu_count()} CPUs, {args.time:g}s per position, {args.hash} MB hash')
+    for workers in counts:
+        nodes = 0
+        elapsed = 0.0
+        depths = []
+        for label, fen in SMP_BENCH_POSITIONS:
+            table = TranspositionTable(args.hash, shared=workers > 1)
+            try:
+                search, searched = parallel_search(Position(fen), workers, table, max_time=args.time)
+            finally:
+                table.close()
+            nodes += searched
+            elapsed += search.elapsed
+            depths.append(search.depth)
+        nps = nodes / max(elapsed, 1e-9)
+        if baseline is None:
+            baseline = nps
+        print(f'{workers} workers: depths {"/".join(str(depth) for depth in depths)}, {nodes:,} nodes, {nps:,.0f} nodes/s, {nps / baseline:.2f}x')
+    return 0
+
+def eval_command(args):
+    # Score positions with evaluate() one at a time and as one NumPy batch, check that both paths agree, and report positions per second for each
+    if np is None:
+        print("The eval command needs NumPy (pip install numpy)")
+        return 1
+    if args.fens:
+        with open(args.fens) as fp:
+            positions = [Position(line) for line in fp if line.strip()]
+    else:
+        positions = history_positions()
+    positions = positions * args.repeat
+    started = time.perf_counter()
+    single = [evaluate(pos) for pos in positions]
+    single_time = time.perf_counter() - started
+    started = time.perf_counter()
+    squares, sides = encode_positions(positions)
+    encode_time = time.perf_counter() - started
+    started = time.perf_counter()
+    batch = evaluate_batch(squares, sides)
+    batch_time = time.perf_counter() - started
+    mismatches = sum(1 for a, b in zip(single, batch.tolist()) if a != b)
+    count = len(positions)
+    print(f'{count:,} positions')
+    print(f'one at a time: {single_time:.3f}s, {count / max(single_time, 1e-9):,.0f} positions/s')
+    print(f'batch: {batch_time:.3f}s, {count / max(batch_time, 1e-9):,.0f} positions/s (plus {encode_time:.3f}s to encode)')
+    print('scores agree' if not mismatches else f'{mismatches} scores differ')
+    return 1 if mismatches else 0
+
+def nnue_bench_command(args):
+    # Evaluate every position of the recorded games with the network, updating the accumulator move by move and rebuilding it each time, and compare speed and results
+    if np is None:
+        print("The nnue-bench command needs NumPy (pip install numpy)")
+        return 1
+    nnue = NNUEEvaluator.load(args.weights) if args.weights else NNUEEvaluator.random(args.hidden)
+    if args.save:
+        nnue.save(args.save)
+        print(f'weights written to {args.save}')
+    games = history_games() * args.repeat
+    positions = []
+    for moves in games:
+        pos = setboard()
+        for move in moves:
+            pos.make_move(move)
+            positions.append(pos.copy())
+    started = time.perf_counter()
+    incremental = []
+    for moves in games:
+        pos = setboard()
+        nnue.refresh(pos)
+        for move in moves:
+            nnue.push(pos, move)
+            pos.make_move(move)
+            incremental.append(nnue.stack[-1])
+    incremental_time = time.perf_counter() - started
+    started = time.perf_counter()
+    full = [nnue.full(pos) for pos in positions]
+    full_time = time.perf_counter() - started
+    started = time.perf_counter()
+    for (white, black), pos in zip(incremental, positions):
+        nnue.output(white, black, pos.side)
+    output_time = time.perf_counter() - started
+    # Both perspectives are compared, and so is the score the dense layers make of each, so a slip in either half of push() shows up; scores are whole centipawns, so rounding may move one by 1
+    difference = max((max(float(np.abs(a[0] - b[0]).max()), float(np.abs(a[1] - b[1]).max())) for a, b in zip(incremental, full)), default=0.0)
+    score_difference = max((abs(nnue.output(a[0], a[1], pos.side) - nnue.output(b[0], b[1], pos.side)) for a, b, pos in zip(incremental, full, positions)), default=0)
+    count = len(positions)
+    print(f'{count:,} positions, {nnue.ft_bias.shape[0]} hidden units per side')
+    print(f'incremental accumulator: {incremental_time:.3f}s, {count / max(incremental_time, 1e-9):,.0f} positions/s')
+    print(f'full recompute: {full_time:.3f}s, {count / max(full_time, 1e-9):,.0f} positions/s')
+    print(f'dense layers: {output_time:.3f}s, {count / max(output_time, 1e-9):,.0f} positions/s')
+    print(f'whole evaluation: incremental {count / max(incremental_time + output_time, 1e-9):,.0f} positions/s, full {count / max(full_time + output_time, 1e-9):,.0f} positions/s')
+    print(f'largest accumulator difference {difference:.2e} (both sides), largest score difference {score_difference} centipawns')
+    return 0 if difference < 1e-3 and score_difference <= 1 else 1
+
+def book_command(args):
+    # Build the opening book from the game archive and PGN files, or show the book moves for a position
+    if args.probe:
+        pos = Position(args.probe)
+        book = OpeningBook(args.output)
+        started = time.perf_counter()
+        found = book.entries(pos)
+        elapsed = time.perf_counter() - started
+        for move, weight, wins, draws, losses in found:
+            print(f'{move_text(move)}: played {weight}, {wins} won, {draws} drawn, {losses} lost')
+        print(f'{len(found)} book moves among {book.count:,} entries, looked up in {elapsed * 1000:.2f} ms')
+        book.close()
+        return 0
+    started = time.perf_counter()
+    games, entries = build_book(args.output, args.pgn, args.plies, None if args.no_history else 'GameHistory.txt')
+    print(f'{games} games, {entries:,} entries, {os.path.getsize(args.output):,} bytes written to {args.output} in {time.perf_counter() - started:.2f}s')
+    return 0
+
+def tablebase_command(args):
+    # Generate the endgame tables (queen and rook first, since pawn endings promote into them) reporting time and size for each, or probe a position
+    if args.probe:
+        pos = Position(args.probe)
+        found = probe_tablebase(pos)
+        if found is None:
+            print('no table covers this position')
+            return 1
+        result, plies = found
+        move = tablebase_move(pos)
+        print(f'{result} for {"white" if pos.side == WHITE else "black"}' + (f', mate in {plies} plies' if plies else '') + (f', best move {move_text(move)}' if move else ''))
+        return 0
+    for name in sorted(args.tables, key=list(TABLEBASE_PIECES).index):
+        started = time.perf_counter()
+        resolved, size = generate_tablebase(name, args.workers, args.directory)
+        print(f'{name}: {resolved:,} won or lost entries of {TABLEBASE_SIZE:,}, {size:,} bytes, {time.perf_counter() - started:.2f}s')
+    return 0
+
+MATE_PUZZLES = [
+    ("back rank", "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1", 1),
+    ("scholar's mate", "r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5Q2/PPPP1PPP/RNB1K1NR w KQkq - 0 1", 1),
+    ("rook and pawn", "kbK5/pp6/1P6/8/8/8/8/R7 w - - 0 1", 2),
+    ("knight and bishop", "r2qkb1r/pp2nppp/3p4/2pNN1B1/2BnP3/3P4/PPP2PPP/R2bK2R w KQkq - 1 1", 2),
+    ("rook lift", "r5rk/5p1p/5R2/4B3/8/8/7P/7K w - - 0 1", 3),
+    ("queen hunt", "2r3k1/p4p2/3Rp2p/1p2P1pK/8/1P4P1/P3Q2P/1q6 b - - 0 1", 3),
+]
+
+def mate_command(args):
+    # Look for a forced mate with proof-number search in one position or in each of the built-in puzzles, reporting nodes, time and the mating line
+    puzzles = [('position', args.fen, args.moves)] if args.fen else MATE_PUZZLES
+    for label, fen, moves in puzzles:
+        pos = Position(fen)
+        solver = MateSolver(args.nodes or None, args.time or None)
+        result = solver.solve(pos, moves)
+        if result:
+            found = f'mate in {solver.mate_in}: {" ".join(move_text(move) for move in solver.line)}'
+        elif result is None:
+            found = 'no answer within the budget'
+        else:
+            found = f'no mate in {moves}'
+        print(f'{label}: {found} ({solver.nodes:,} nodes in {solver.elapsed:.3f}s)')
+        if args.compare:
+            # The same question put to the alpha-beta search, to the same depth
+            search = Search(max_depth=2 * moves - 1)
+            search.run(pos)
+            print(f'  alpha-beta to {2 * moves - 1} plies: {score_text(search.score)} ({search.nodes:,} nodes in {search.elapsed:.3f}s)')
+    return 0
+
+def loop_bench_command(args):
+    # Play a long scripted game through the interactive prompts in a scratch directory and check that the call stack and memory stay flat from move to move
+    global board, p1name, p2name, computer_side, PAUSES
+    script = LOOP_BENCH_CYCLE * (args.plies // 4) + ['resign', 'y']
+    home = os.getcwd()
+    stdin, stdout = sys.stdin, sys.stdout
+    reader = ScriptedInput(script)
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        for dox, first in (('Elo.txt', '100'), ('Wins.txt', '0'), ('Loss.txt', '0'), ('Draw.txt', '0')):
+            with open(dox, 'w') as fp:
+                fp.write(f'BenchWhite,{first}\nBenchBlack,{first}')
+        open('GameHistory.txt', 'w').close()
+        board = setboard()
+        p1name, p2name = 'BenchWhite', 'BenchBlack'
+        computer_side = None
+        PAUSES = False
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            sys.stdin = reader
+            sys.stdout = open(os.devnull, 'w')
+            begin()
+        finally:
+            sys.stdout.close()
+            sys.stdin, sys.stdout = stdin, stdout
+            elapsed = time.perf_counter() - started
+            tracemalloc.stop()
+            ponderer.stop()
+            PAUSES = True
+            os.chdir(home)
+    plies = len(board.undo)
+    prompts = len(reader.depths)
+    print(f'{plies} plies, {prompts} prompts answered in {elapsed:.2f}s ({plies / max(elapsed, 1e-9):,.0f} plies/s)')
+    print(f'call stack at the prompts: {min(reader.depths)} to {max(reader.depths)} frames')
+    tenth = max(prompts // 10, 1)
+    early = sum(reader.memory[tenth:2 * tenth]) / tenth
+    late = sum(reader.memory[-tenth:]) / tenth
+    print(f'traced memory at the prompts: {early / 1024:,.0f} KB early in the game, {late / 1024:,.0f} KB at the end ({(late - early) / max(plies, 1):,.0f} bytes per ply, mostly the undo history)')
+    return 0 if max(reader.depths) - min(reader.depths) <= 3 else 1
+
+def batch_command(args):
+    # Play move scripts from files or stdin through the interactive prompts with the pauses off, recording each game and its result like one played at the keyboard
+    global board, p1name, p2name, computer_side, PAUSES
+    if args.files:
+        text = ''
+        for path in args.files:
+            with open(path) as fp:
+                text += fp.read() + '\n'
+    else:
+        text = sys.stdin.read()
+    scripts = [line for line in text.splitlines() if line.strip() and not line.lstrip().startswith('#')]
+    with open('Elo.txt') as fp:
+        players = {line.split(',')[0] for line in fp if ',' in line}
+    stdin, stdout = sys.stdin, sys.stdout
+    played = finished = failed = plies = 0
+    PAUSES = False
+    started = time.perf_counter()
+    try:
+        for number, line in enumerate(scripts, 1):
+            try:
+                white, black, answers, session = batch_script(line, args.white, args.black)
+                for player in (white, black):
+                    if player not in players:
+                        raise ValueError(f'{player} has no account (sign up first)')
+            except ValueError as error:
+                print(f'game {number}: {error}, skipped')
+                failed += 1
+                continue
+            board = setboard()
+            p1name, p2name = white, black
+            computer_side = None
+            try:
+                sys.stdin = ScriptedInput(answers)
+                if not args.verbose:
+                    sys.stdout = open(os.devnull, 'w')
+                begin()
+            except EOFError:
+                # The script stopped before the game was decided, so it stays in GameHistory.txt without a result, like a game left unfinished at the keyboard
+                pass
+            finally:
+                if sys.stdout is not stdout:
+                    sys.stdout.close()
+                sys.stdin, sys.stdout = stdin, stdout
+                ponderer.stop()
+            if board.key != session.board.key:
+                print(f'game {number}: the prompts ended in a different position from the script')
+                failed += 1
+            played += 1
+            finished += session.result is not None
+            plies += len(board.undo)
+    finally:
+        PAUSES = True
+    elapsed = time.perf_counter() - started
+    print(f'{played} games ({finished} decided, {failed} with errors), {plies:,} moves in {elapsed:.2f}s: {played / max(elapsed, 1e-9):,.1f} games/s, {plies / max(elapsed, 1e-9):,.0f} moves/s')
+    return 1 if failed else 0
+
+def self_play_command(args):
+    # Play automated games across a process pool and record them through the usual rating and history files, reporting throughput and where the time went
+    global p1name, p2name, PAUSES
+    home = os.getcwd()
+    if args.output:
+        # A separate set of data files, so the real accounts and history are left alone
+        os.makedirs(args.output, exist_ok=True)
+        for dox in ('Login.txt', 'Elo.txt', 'Wins.txt', 'Loss.txt', 'Draw.txt', 'GameHistory.txt'):
+            open(os.path.join(args.output, dox), 'a').close()
+    tasks = [(args.seed + game, args.white, args.black, args.depth, args.max_plies) for game in range(args.games)]
+    started = time.perf_counter()
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            games = list(pool.map(_self_play_game, tasks, chunksize=max(1, len(tasks) // (args.workers * 4))))
+    else:
+        games = [_self_play_game(task) for task in tasks]
+    playing = time.perf_counter() - started
+    white, black = self_play_name(args.white, WHITE), self_play_name(args.black, BLACK)
+    stdout = sys.stdout
+    started = time.perf_counter()
+    try:
+        os.chdir(args.output or home)
+        computer_account(white)
+        computer_account(black)
+        p1name, p2name = white, black
+        PAUSES = False
+        if not args.verbose:
+            sys.stdout = open(os.devnull, 'w')
+        for seed, line, result, reason, plies, choosing, rules in games:
+            # finish_game() closes the line with the result, as it does for games played at the prompts
+            with open('GameHistory.txt', 'a') as enter_games:
+                enter_games.write(line)
+            finish_game(result)
+    finally:
+        if sys.stdout is not stdout:
+            sys.stdout.close()
+        sys.stdout = stdout
+        PAUSES = True
+        os.chdir(home)
+    recording = time.perf_counter() - started
+    elapsed = playing + recording
+    plies = sum(game[4] for game in games)
+    outcomes = {}
+    for game in games:
+        outcomes[game[3]] = outcomes.get(game[3], 0) + 1
+    scores = [sum(1 for game in games if game[2] == result) for result in 'wdl']
+    print(f'{len(games)} games, {plies:,} plies in {elapsed:.2f}s with {args.workers} worker(s): {len(games) / max(elapsed, 1e-9):,.1f} games/s, {plies / max(elapsed, 1e-9):,.0f} plies/s')
+    print(f'{white} {scores[0]} wins, {scores[1]} draws, {black} {scores[2]} wins ({", ".join(f"{count} by {reason}" for reason, count in sorted(outcomes.items()))})')
+    print(f'choosing moves: {white} {sum(game[5][WHITE] for game in games):.2f}s, {black} {sum(game[5][BLACK] for game in games):.2f}s (summed over workers)')
+    print(f'rules (legal moves, mate and draw checks): {sum(game[6] for game in games):.2f}s (summed over workers)')
+    print(f'playing {playing:.2f}s wall clock, recording ratings and history {recording:.2f}s')
+    return 0
+
+def uci_command(args):
+    # Speak the Universal Chess Interface on stdin and stdout, for chess GUIs and tournament managers
+    UCIEngine().run()
+    return 0
+
+def main():
+    # Command line entry point: no arguments starts the interactive program, otherwise run one of the tool commands
+    parser = argparse.ArgumentParser(prog='OFFChess.py', description='OFF Chess, an offline chess program')
+    commands = parser.add_subparsers(dest='command')
+    perft_parser = commands.add_parser('perft', help='count leaf positions to check move generation speed and correctness')
+    perft_parser.add_argument('--depth', type=int, default=0, help='plies to search (default: 3, capped at the reference counts)')
+    perft_parser.add_argument('--fen', help='run a single position instead of the reference suite')
+    perft_parser.add_argument('--divide', action='store_true', help='print the leaf count under each root move')
+    perft_parser.add_argument('--generator', choices=sorted(MOVE_GENERATORS), default='bitboard', help='move generator to measure')
+    perft_parser.add_argument('--workers', type=int, default=1, help='processes to split the count across (default: 1, no pool)')
+    perft_parser.add_argument('--split-depth', type=int, choices=(1, 2), default=1, help='split the tree at the root (1) or one ply below it (2)')
+    perft_parser.add_argument('--compare-serial', action='store_true', help='also time a single-process run and report the speedup')
+    search_parser = commands.add_parser('search', help="run the computer player's search on a position and report its speed")
+    search_parser.add_argument('--fen', default=START_FEN, help='position to search (default: the starting position)')
+    search_parser.add_argument('--time', type=float, default=COMPUTER_MOVE_TIME, help=f'seconds to think (default: {COMPUTER_MOVE_TIME:g}, 0 for no limit)')
+    search_parser.add_argument('--nodes', type=int, default=0, help='stop after this many nodes (default: no limit)')
+    search_parser.add_argument('--depth', type=int, default=0, help='stop after this many plies (default: no limit)')
+    search_parser.add_argument('--hash', type=int, default=COMPUTER_HASH_MB, help=f'transposition table size in MB (default: {COMPUTER_HASH_MB}, 0 for none)')
+    search_parser.add_argument('--workers', type=int, default=1, help='processes searching together through a shared table (default: 1)')
+    search_parser.add_argument('--nnue', help='evaluate with the neural network in this weights file (.npz, needs NumPy)')
+    search_parser.add_argument('--verify-eval', action='store_true', help='recount the evaluation sums and hash keys at every evaluation and stop on any mismatch (slow)')
+    bench_parser = commands.add_parser('smp-bench', help='measure how the parallel search scales with the number of worker processes')
+    bench_parser.add_argument('--time', type=float, default=5.0, help='seconds per position (default: 5)')
+    bench_parser.add_argument('--workers', default='1,2,4', help='comma separated worker counts to compare (default: 1,2,4)')
+    bench_parser.add_argument('--hash', type=int, default=COMPUTER_HASH_MB, help=f'shared table size in MB (default: {COMPUTER_HASH_MB})')
+    nnue_parser = commands.add_parser('nnue-bench', help='compare incremental and full-recompute neural network evaluation speed')
+    nnue_parser.add_argument('--weights', help='network weights file (.npz); default is an untrained random network')
+    nnue_parser.add_argument('--hidden', type=int, default=128, help='hidden units per side for the random network (default: 128)')
+    nnue_parser.add_argument('--save', help='write the network used to this .npz file')
+    nnue_parser.add_argument('--repeat', type=int, default=1, help='go through the recorded games this many times over')
+    book_parser = commands.add_parser('book', help='build the opening book from GameHistory.txt and PGN files, or look a position up in it')
+    book_parser.add_argument('--pgn', nargs='*', default=[], help='PGN game collections to add to the book')
+    book_parser.add_argument('--plies', type=int, default=BOOK_PLIES, help=f'moves per game (in plies) to take into the book (default: {BOOK_PLIES})')
+    book_parser.add_argument('--output', default=BOOK_FILE, help=f'book file (default: {BOOK_FILE})')
+    book_parser.add_argument('--no-history', action='store_true', help='leave GameHistory.txt out of the book')
+    book_parser.add_argument('--probe', metavar='FEN', help='list the book moves for this position instead of building')
+    eval_parser = commands.add_parser('eval', help='score positions one at a time and in a NumPy batch and compare the speed')
+    eval_parser.add_argument('--fens', help='file with one FEN per line (default: every position in GameHistory.txt)')
+    eval_parser.add_argument('--repeat', type=int, default=1, help='score the set this many times over, for a bigger batch')
+    tablebase_parser = commands.add_parser('tablebase', help='generate the endgame tablebases by retrograde analysis, or probe a position')
+    tablebase_parser.add_argument('--tables', nargs='*', choices=list(TABLEBASE_PIECES), default=list(TABLEBASE_PIECES), help='tables to build (default: all; KPK needs KQK and KRK)')
+    tablebase_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processes to split each table across (default: one per core)')
+    tablebase_parser.add_argument('--directory', default=TABLEBASE_DIR, help=f'where to write the table files (default: {TABLEBASE_DIR}; probing always reads {TABLEBASE_DIR})')
+    tablebase_parser.add_argument('--probe', metavar='FEN', help='look a position up in the tables instead of generating')
+    mate_parser = commands.add_parser('mate', help='prove or disprove a forced mate with proof-number search')
+    mate_parser.add_argument('--fen', help='position to solve (default: the built-in mate puzzles)')
+    mate_parser.add_argument('--moves', type=int, default=3, help='longest mate to look for, in moves of the side to move (default: 3)')
+    mate_parser.add_argument('--nodes', type=int, default=0, help='give up after this many nodes (default: no limit)')
+    mate_parser.add_argument('--time', type=float, default=0, help='give up after this many seconds (default: no limit)')
+    mate_parser.add_argument('--compare', action='store_true', help='also time the alpha-beta search to the same depth')
+    loop_parser = commands.add_parser('loop-bench', help='play a long scripted game through the prompts and check the stack and memory stay flat')
+    loop_parser.add_argument('--plies', type=int, default=500, help='length of the scripted game (default: 500)')
+    batch_parser = commands.add_parser('batch', help='play move scripts from files or stdin through the game prompts and record the results')
+    batch_parser.add_argument('files', nargs='*', help='move script files, one game per line (default: read stdin)')
+    batch_parser.add_argument('--white', default='White', help='White player for lines without "White VS Black;" (default: White)')
+    batch_parser.add_argument('--black', default='Black', help='Black player for lines without "White VS Black;" (default: Black)')
+    batch_parser.add_argument('--verbose', action='store_true', help='show the prompts and boards as the games are played')
+    self_play_parser = commands.add_parser('self-play', help='play many games between automated players across a process pool and record them')
+    self_play_parser.add_argument('--games', type=int, default=100, help='games to play (default: 100)')
+    self_play_parser.add_argument('--white', choices=sorted(SELF_PLAY_PLAYERS), default='greedy', help='player for White (default: greedy)')
+    self_play_parser.add_argument('--black', choices=sorted(SELF_PLAY_PLAYERS), default='random', help='player for Black (default: random)')
+    self_play_parser.add_argument('--depth', type=int, default=2, help='plies the search player looks ahead (default: 2)')
+    self_play_parser.add_argument('--max-plies', type=int, default=300, help='call a game drawn after this many plies (default: 300)')
+    self_play_parser.add_argument('--seed', type=int, default=1, help='seed of the first game; game i uses seed + i (default: 1)')
+    self_play_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processes to play the games in (default: one per core)')
+    self_play_parser.add_argument('--output', metavar='DIR', help='write the history and rating files in DIR instead of the current directory')
+    self_play_parser.add_argument('--verbose', action='store_true', help='show the rating changes as games are recorded')
+    commands.add_parser('uci', help='run as a UCI engine on stdin and stdout, for chess GUIs and tournament managers')
+    args = parser.parse_args()
+    if args.command == 'search' and args.workers > 1 and args.hash <= 0:
+        parser.error('--workers needs a transposition table to share (--hash above 0)')
+    if args.command is None:
+        # Show the splash screen and launch the interactive menu loop
+        openingAnimation()
+    elif args.command == 'perft':
+        sys.exit(perft_command(args))
+    elif args.command == 'search':
+        sys.exit(search_command(args))
+    elif args.command == 'smp-bench':
+        sys.exit(smp_bench_command(args))
+    elif args.command == 'eval':
+        sys.exit(eval_command(args))
+    elif args.command == 'book':
+        sys.exit(book_command(args))
+    elif args.command == 'nnue-bench':
+        sys.exit(nnue_bench_command(args))
+    elif args.command == 'tablebase':
+        sys.exit(tablebase_command(args))
+    elif args.command == 'mate':
+        sys.exit(mate_command(args))
+    elif args.command == 'loop-bench':
+        sys.exit(loop_bench_command(args))
+    elif args.command == 'batch':
+        sys.exit(batch_command(args))
+    elif args.command == 'self-play':
+        sys.exit(self_play_command(args))
+    elif args.command == 'uci':
+        sys.exit(uci_command(args))
+
+board = setboard()
+
+if __name__ == '__main__':
+    main()